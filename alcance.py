@@ -0,0 +1,202 @@
+import sys
+
+import numpy as np
+
+from cache_cotizaciones import CacheCotizaciones
+from catalogo import abrir_catalogo, CSV_MUNICIPIOS
+from cotizacion import redondea, versiones_cotizacion
+from distancias import distancias_municipios
+from tarifas import obtener_tarifario
+
+# Consultas de alcance desde un origen: qué municipios caen en cada banda LTL,
+# a qué precio por clase de unidad, cuáles quedan dentro de un radio y cuáles
+# se pueden mandar por menos de $X.
+#
+# Para un origen se calcula de una vez la distancia a todo el catálogo (una
+# fila de la matriz), se ordena y se precalculan la banda LTL, la tarifa por
+# m3 y el costo de cada clase de unidad con las reglas de cotizar_servicio.
+# Como las bandas y los radios son rangos contiguos del orden por distancia,
+# cada consulta es un searchsorted y una rebanada. Los alcances se guardan en
+# un caché LRU por origen que se invalida con las versiones de catálogo,
+# tarifario y distancias, igual que el caché de cotizaciones.
+#
+#   python alcance.py "Monterrey (Nuevo León)"                 resumen por banda
+#   python alcance.py "Monterrey (Nuevo León)" --banda 1       destinos de la banda 400-900 km
+#   python alcance.py "Monterrey (Nuevo León)" --precio 15000 --peso 3 --salida hoja.xlsx
+
+CAPACIDAD = 256
+
+
+class Alcance:
+    def __init__(self, catalogo, fila_origen, tarifario):
+        self.fila_origen = int(fila_origen)
+        self.tarifario = tarifario
+        n = catalogo.n
+        distancia = distancias_municipios(
+            catalogo, np.full(n, self.fila_origen, dtype=np.intp), np.arange(n), tarifario.modo_distancia,
+        )
+        # Igual que cotizar_ruta y cotizar_lote: la distancia se redondea antes de tarificar
+        distancia = redondea(distancia)
+        # Todos los destinos menos el origen, del más cercano al más lejano
+        orden = np.argsort(distancia, kind="stable")
+        self.filas = orden[orden != self.fila_origen]
+        self.distancia = distancia[self.filas]
+        self.banda = tarifario.indice_banda_ltl(self.distancia)
+        self.tarifa_m3 = tarifario.tarifas_ltl[self.banda]
+        # Costo sin redondear de cada clase de unidad (renglón = destino)
+        excedente = np.maximum(self.distancia - tarifario.km_banderazo, 0.0)
+        self._costo_unidad = tarifario.banderazo[None, :] + excedente[:, None] * tarifario.por_km[None, :]
+        self.costo_unidad = redondea(self._costo_unidad)
+
+    def __len__(self):
+        return len(self.filas)
+
+    def dentro_de(self, km):
+        # Rebanada de los destinos a km o menos
+        return slice(0, int(np.searchsorted(self.distancia, km, side="right")))
+
+    def en_banda(self, banda):
+        # Rebanada de los destinos de la banda LTL (índice de tarifario.nombres_ltl)
+        return slice(
+            int(np.searchsorted(self.banda, banda, side="left")),
+            int(np.searchsorted(self.banda, banda, side="right")),
+        )
+
+    def costos(self, servicio="FTL", peso_vol=0.0, volumen_m3=0.0, maniobras=0.0):
+        # Precio a cada destino con las reglas de cotizar_servicio
+        if servicio == "LTL":
+            return redondea(volumen_m3 * self.tarifa_m3)
+        costo = self._costo_unidad[:, self.tarifario.indice_unidad(peso_vol)]
+        if servicio == "MUDANZA":
+            costo = costo + maniobras
+        return redondea(costo)
+
+    def bajo_precio(self, maximo, servicio="FTL", peso_vol=0.0, volumen_m3=0.0, maniobras=0.0):
+        # Posiciones (en el orden por distancia) de los destinos que cuestan
+        # maximo o menos. El precio LTL no siempre crece con la distancia si
+        # el tarifario tiene bandas más baratas que la anterior, por eso se
+        # filtra con máscara y no con un radio.
+        costo = self.costos(servicio, peso_vol, volumen_m3, maniobras)
+        return np.flatnonzero(costo <= maximo)
+
+    def tabla(self, catalogo, seleccion=slice(None)):
+        # Destinos con distancia, banda, tarifa LTL y costo de cada unidad
+        import pandas as pd
+
+        filas = self.filas[seleccion]
+        tabla = pd.DataFrame({
+            "fila": filas,
+            "Destino": [catalogo.etiqueta(fila) for fila in filas.tolist()],
+            "Distancia (km)": self.distancia[seleccion],
+            "Banda": np.asarray(self.tarifario.nombres_ltl, dtype=object)[self.banda[seleccion]],
+            "Tarifa LTL (m3)": self.tarifa_m3[seleccion],
+        })
+        for k, unidad in enumerate(self.tarifario.unidades):
+            tabla[f"Costo {unidad}"] = self.costo_unidad[seleccion, k]
+        return tabla
+
+    def resumen(self):
+        # Un renglón por banda LTL: destinos, km y rango de precio por unidad
+        import pandas as pd
+
+        renglones = []
+        for banda, nombre in enumerate(self.tarifario.nombres_ltl):
+            rango = self.en_banda(banda)
+            if rango.start == rango.stop:
+                continue
+            renglon = {
+                "Banda": nombre,
+                "Destinos": rango.stop - rango.start,
+                "Km mín": float(self.distancia[rango.start]),
+                "Km máx": float(self.distancia[rango.stop - 1]),
+                "Tarifa LTL (m3)": float(self.tarifario.tarifas_ltl[banda]),
+            }
+            for k, unidad in enumerate(self.tarifario.unidades):
+                renglon[f"{unidad} desde"] = float(self.costo_unidad[rango.start, k])
+                renglon[f"{unidad} hasta"] = float(self.costo_unidad[rango.stop - 1, k])
+            renglones.append(renglon)
+        return pd.DataFrame(renglones)
+
+
+# Caché del proceso: un alcance por origen (unos 100 KB cada uno)
+CACHE_ALCANCE = CacheCotizaciones(CAPACIDAD)
+
+
+def fila_de(catalogo, origen):
+    # Fila del catálogo de una etiqueta, un alias o un número de fila
+    if isinstance(origen, (int, np.integer)):
+        if not 0 <= origen < catalogo.n:
+            raise KeyError(f"Fila fuera del catálogo: {origen}")
+        return int(origen)
+    fila = catalogo.indice().buscar_etiqueta(str(origen))
+    if fila is None:
+        raise KeyError(f"No se encontró el municipio {origen!r} en el catálogo")
+    return fila
+
+
+def alcance(origen, catalogo=None, tarifario=None, cache=CACHE_ALCANCE):
+    catalogo = catalogo or abrir_catalogo(CSV_MUNICIPIOS)
+    tarifario = tarifario or obtener_tarifario()
+    fila = fila_de(catalogo, origen)
+    if cache is None:
+        return Alcance(catalogo, fila, tarifario)
+    return cache.obtener(fila, versiones_cotizacion(catalogo, tarifario), lambda: Alcance(catalogo, fila, tarifario))
+
+
+def main(argv=None):
+    import argparse
+    import time
+
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(description="Destinos desde un origen por banda LTL, radio o precio")
+    parser.add_argument("origen", help="etiqueta 'Ciudad (Estado)' o alias")
+    grupo = parser.add_mutually_exclusive_group()
+    grupo.add_argument("--banda", type=int, default=None, help="índice de banda LTL (0 = la más cercana)")
+    grupo.add_argument("--km", type=float, default=None, help="destinos dentro de este radio")
+    grupo.add_argument("--precio", type=float, default=None, help="destinos que cuestan esto o menos")
+    parser.add_argument("--servicio", default="FTL", choices=("FTL", "LTL", "MUDANZA"))
+    parser.add_argument("--peso", type=float, default=0.0, help="peso/vol (ton) para FTL y MUDANZA")
+    parser.add_argument("--volumen", type=float, default=1.0, help="m3 para LTL")
+    parser.add_argument("--maniobras", type=float, default=0.0)
+    parser.add_argument("--fuente", default=CSV_MUNICIPIOS)
+    parser.add_argument("--salida", default=None, help="hoja de tarifas .xlsx o .csv")
+    args = parser.parse_args(argv)
+
+    catalogo = abrir_catalogo(args.fuente)
+    inicio = time.perf_counter()
+    try:
+        resultado = alcance(args.origen, catalogo)
+    except KeyError as error:
+        print(error.args[0], file=sys.stderr)
+        return 1
+    calculado = time.perf_counter()
+
+    if args.banda is None and args.km is None and args.precio is None:
+        tabla = resultado.resumen()
+    else:
+        if args.banda is not None:
+            seleccion = resultado.en_banda(args.banda)
+        elif args.km is not None:
+            seleccion = resultado.dentro_de(args.km)
+        else:
+            seleccion = resultado.bajo_precio(args.precio, args.servicio, args.peso, args.volumen, args.maniobras)
+        tabla = resultado.tabla(catalogo, seleccion)
+        if args.precio is not None:
+            tabla.insert(2, "Costo", resultado.costos(args.servicio, args.peso, args.volumen, args.maniobras)[seleccion])
+
+    print(f"{catalogo.etiqueta(resultado.fila_origen)}: {len(resultado):,} destinos "
+          f"en {(calculado - inicio) * 1000:.1f} ms, {len(tabla):,} renglones")
+    with pd.option_context("display.width", 160, "display.max_columns", None, "display.max_rows", 40):
+        print(tabla)
+    if args.salida:
+        if args.salida.lower().endswith((".xlsx", ".xls")):
+            tabla.to_excel(args.salida, index=False)
+        else:
+            tabla.to_csv(args.salida, index=False, encoding="utf-8")
+        print(args.salida)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
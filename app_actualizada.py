@@ -1,70 +1,65 @@
-
-import pandas as pd
 import streamlit as st
-from geopy.distance import geodesic
-from math import radians, sin, cos, sqrt, atan2
-import io
 from datetime import datetime
-from fpdf import FPDF
+from catalogo import abrir_catalogo
+from distancias import distancia_municipios
+from cotizacion import cotizar_servicio, versiones_cotizacion
+from tarifas import obtener_tarifario
+from cache_cotizaciones import CACHE
+from metricas import etapa, medido, solicitud
+from pdf_cotizaciones import PLANTILLA_SERVICIO
 
 CSV_FILENAME = "municipios_mexico.csv"
 
-TARIFAS_LTL = [
-    (0, 400, 2000),
-    (401, 900, 3500),
-    (901, 1300, 5900),
-    (1301, 1700, 7800),
-    (1701, 1999, 8999),
-    (2000, float('inf'), 10500)
-]
-
-@st.cache_data
+@st.cache_resource
+@medido("carga_catalogo")
 def load_municipios(filename):
-    try:
-        df = pd.read_csv(filename, encoding="utf-8", dtype=str)
-    except UnicodeDecodeError:
-        df = pd.read_csv(filename, encoding="latin1", dtype=str)
-    df['Longitud'] = df['Longitud'].astype(float)
-    df['Latitud'] = df['Latitud'].astype(float)
-    return df
-
-def calcular_distancia(df, origen, destino):
-    ciudad_o, estado_o = origen.rsplit(" (", 1)
-    ciudad_d, estado_d = destino.rsplit(" (", 1)
-    ciudad_o = ciudad_o.strip()
-    estado_o = estado_o.replace(")", "").strip()
-    ciudad_d = ciudad_d.strip()
-    estado_d = estado_d.replace(")", "").strip()
-    coord_o = tuple(df[(df['Ciudad'] == ciudad_o) & (df['Estado'] == estado_o)][['Latitud', 'Longitud']].iloc[0])
-    coord_d = tuple(df[(df['Ciudad'] == ciudad_d) & (df['Estado'] == estado_d)][['Latitud', 'Longitud']].iloc[0])
-    distancia = geodesic(coord_o, coord_d).kilometers
-    return distancia, ciudad_o, estado_o, ciudad_d, estado_d
+    # Catálogo compilado y abierto con mmap; se comparte entre sesiones sin copiarlo
+    return abrir_catalogo(filename).a_dataframe()
+
+def separar_etiqueta(etiqueta):
+    ciudad, estado = etiqueta.rsplit(" (", 1)
+    return ciudad.strip(), estado.replace(")", "").strip()
+
+@medido("distancia")
+def calcular_distancia(catalogo, fila_o, fila_d):
+    return distancia_municipios(catalogo, fila_o, fila_d, obtener_tarifario().modo_distancia)
 
 def obtener_tarifa_LTL(distancia_km):
-    for min_km, max_km, tarifa in TARIFAS_LTL:
-        if min_km <= distancia_km <= max_km:
-            return tarifa
-    return TARIFAS_LTL[-1][2]
+    return obtener_tarifario().tarifa_ltl(distancia_km)
+
+# Distancia y precio del carril; se guardan en el caché LRU del proceso. El
+# LTL guarda la tarifa por m3 y el costo se calcula con el volumen de cada consulta
+@medido("cotizacion")
+def cotizar(origen, destino, tipo_servicio, peso_vol=0.0):
+    catalogo = abrir_catalogo(CSV_FILENAME)
+    tarifario = obtener_tarifario()
+    with etapa("busqueda"):
+        indice = catalogo.indice()
+        fila_o, fila_d = indice.buscar(*separar_etiqueta(origen)), indice.buscar(*separar_etiqueta(destino))
+    clase = tarifario.indice_unidad(peso_vol) if tipo_servicio == "Flete completo (FTL)" else -1
+    clave = ("actualizada", fila_o, fila_d, tipo_servicio, clase)
+
+    def calcular():
+        distancia = calcular_distancia(catalogo, fila_o, fila_d)
+        if tipo_servicio == "Flete consolidado (LTL)":
+            return distancia, "LTL por volumen", obtener_tarifa_LTL(distancia)
+        if tipo_servicio == "Mudanza":
+            return distancia, "Mudanza", tarifario.costo_mudanza(distancia)
+        unidad, costo, _ = cotizar_servicio(distancia, peso_vol, "FTL", tarifario=tarifario)
+        return distancia, unidad, costo
+
+    return CACHE.obtener(clave, versiones_cotizacion(catalogo, tarifario), calcular)
 
-def calcular_costo_LTL(distancia_km, largo_cm, ancho_cm, alto_cm):
+def calcular_costo_LTL(tarifa_m3, largo_cm, ancho_cm, alto_cm):
     volumen_cm3 = largo_cm * ancho_cm * alto_cm
     volumen_m3 = volumen_cm3 / 1_000_000
-    tarifa_m3 = obtener_tarifa_LTL(distancia_km)
     costo = volumen_m3 * tarifa_m3
-    return round(costo, 2), volumen_cm3, tarifa_m3
+    return round(costo, 2), volumen_cm3
 
+@medido("pdf")
 def generar_pdf(cotizacion):
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_font("Arial", "B", 14)
-    pdf.cell(200, 10, "Cotización de Servicio de Transporte", ln=True, align="C")
-    pdf.set_font("Arial", "", 12)
-    for key, value in cotizacion.items():
-        pdf.cell(200, 10, f"{key}: {value}", ln=True)
-    pdf_output = io.BytesIO()
-    pdf.output(pdf_output)
-    pdf_output.seek(0)
-    return pdf_output
+    # PDF en memoria con la plantilla precompilada
+    return PLANTILLA_SERVICIO.renderizar(cotizacion)
 
 def main():
     st.set_page_config(page_title="Cotizador de Transporte México", layout="centered")
@@ -94,28 +89,13 @@ def main():
         submitted = st.form_submit_button("Cotizar")
 
     if submitted and origen != destino:
-        distancia, ciudad_o, estado_o, ciudad_d, estado_d = calcular_distancia(df, origen, destino)
         if tipo_servicio == "Flete consolidado (LTL)":
-            costo, volumen_cm3, tarifa_m3 = calcular_costo_LTL(distancia, largo, ancho, alto)
-            unidad = "LTL por volumen"
-        elif tipo_servicio == "Mudanza":
-            unidad = "Mudanza"
-            costo = 3500 + distancia * 9
+            distancia, unidad, tarifa_m3 = cotizar(origen, destino, tipo_servicio)
+            costo, volumen_cm3 = calcular_costo_LTL(tarifa_m3, largo, ancho, alto)
         else:
-            if peso_vol <= 1:
-                unidad = "1 Ton"
-            elif peso_vol <= 3:
-                unidad = "3 Ton"
-            elif peso_vol <= 5:
-                unidad = "5 Ton"
-            else:
-                unidad = "10 Ton"
-            tarifas_banderazo = {"1 Ton": 2500, "3 Ton": 3000, "5 Ton": 3500, "10 Ton": 4000}
-            tarifas_km = {"1 Ton": 13, "3 Ton": 15, "5 Ton": 19, "10 Ton": 23}
-            if distancia <= 50:
-                costo = tarifas_banderazo[unidad]
-            else:
-                costo = tarifas_banderazo[unidad] + (distancia - 50) * tarifas_km[unidad]
+            distancia, unidad, costo = cotizar(origen, destino, tipo_servicio, peso_vol)
+        ciudad_o, estado_o = separar_etiqueta(origen)
+        ciudad_d, estado_d = separar_etiqueta(destino)
 
         cotizacion = {
             "Fecha cotización": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
@@ -135,5 +115,7 @@ def main():
         pdf_file = generar_pdf(cotizacion)
         st.download_button("Descargar cotización en PDF", data=pdf_file, file_name="cotizacion.pdf", mime="application/pdf")
 
+# Cada rerun de Streamlit es una solicitud en la traza de métricas
 if __name__ == "__main__":
-    main()
+    with solicitud("rerun"):
+        main()
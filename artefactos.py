@@ -0,0 +1,87 @@
+import contextvars
+import threading
+from collections import OrderedDict
+
+# Archivos de descarga (PDF, Excel) de las cotizaciones, bajo demanda.
+#
+# Las apps ya no generan el PDF ni el Excel al cotizar: guardan la cotización
+# y sólo cuando el usuario pide una descarga se encarga el archivo (pedir) a
+# un hilo del grupo compartido, sin esperarlo. Un rerun posterior muestra la
+# descarga en cuanto listo(clave) tiene los bytes. El resultado queda
+# memorizado por (id de cotización, tipo) en el almacén de la sesión, así que
+# los reruns siguientes (cambiar de página, pulsar la descarga) lo reutilizan
+# sin volver a renderizar. El almacén guarda a lo más LIMITE archivos y
+# suelta los más viejos.
+#
+# Las tareas corren en una copia del contexto de quien las pide, así que las
+# etapas que midan (metricas.etapa) quedan en la traza de la misma solicitud.
+
+LIMITE = 32
+HILOS = 2
+
+_grupo = None
+_candado_grupo = threading.Lock()
+
+
+def grupo():
+    # Grupo de hilos del proceso, creado al primer encargo
+    global _grupo
+    with _candado_grupo:
+        if _grupo is None:
+            from concurrent.futures import ThreadPoolExecutor
+
+            _grupo = ThreadPoolExecutor(HILOS, thread_name_prefix="artefactos")
+        return _grupo
+
+
+class Artefactos:
+    def __init__(self, limite=LIMITE):
+        self.limite = limite
+        self._futuros = OrderedDict()
+        self._candado = threading.Lock()
+        self.generados = 0
+        self.reutilizados = 0
+
+    def __len__(self):
+        return len(self._futuros)
+
+    def pedir(self, clave, construir, *args):
+        # Future con los bytes del archivo; sólo el primer pedido de cada
+        # clave lo construye
+        with self._candado:
+            futuro = self._futuros.get(clave)
+            if futuro is not None and not (futuro.done() and futuro.exception() is not None):
+                self._futuros.move_to_end(clave)
+                self.reutilizados += 1
+                return futuro
+            contexto = contextvars.copy_context()
+            futuro = self._futuros[clave] = grupo().submit(contexto.run, construir, *args)
+            self.generados += 1
+            while len(self._futuros) > self.limite:
+                self._futuros.popitem(last=False)
+            return futuro
+
+    def obtener(self, clave, construir, *args, espera=None):
+        # Bytes del archivo; bloquea hasta que esté (o hasta espera segundos)
+        return self.pedir(clave, construir, *args).result(espera)
+
+    def listo(self, clave):
+        # Bytes si ya se generó, None si no se ha pedido o sigue en curso
+        with self._candado:
+            futuro = self._futuros.get(clave)
+        if futuro is None or not futuro.done() or futuro.exception() is not None:
+            return None
+        return futuro.result()
+
+    def en_curso(self, clave):
+        # Pedido y todavía sin terminar
+        with self._candado:
+            futuro = self._futuros.get(clave)
+        return futuro is not None and not futuro.done()
+
+    def olvidar(self, clave=None):
+        with self._candado:
+            if clave is None:
+                self._futuros.clear()
+            else:
+                self._futuros.pop(clave, None)
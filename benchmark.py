@@ -0,0 +1,494 @@
+import gc
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+from catalogo import abrir_catalogo, normaliza, olvidar_catalogos, CSV_MUNICIPIOS
+
+# Banco de pruebas de rendimiento de las rutas calientes del cotizador:
+# carga del catálogo, búsqueda de filas, distancia, tarificación, PDF y Excel,
+# más las funciones equivalentes de cada una de las cuatro apps de Streamlit.
+#
+#   python benchmark.py --salida bench.json
+#   python benchmark.py --solo cotizacion --escalas 1,1000,1000000
+#   python benchmark.py --salida nuevo.json --comparar bench.json
+#
+# Cada caso reporta rendimiento (operaciones por segundo), percentiles de
+# latencia y memoria pico (tracemalloc, en una corrida aparte para no
+# distorsionar los tiempos). Los carriles son aleatorios con semilla fija, así
+# que dos corridas del mismo commit son comparables. El grupo "arranque" mide
+# cuánto tarda un proceso nuevo en importar cada módulo del núcleo y qué
+# dependencias pesadas arrastra (deben cargarse hasta el primer uso):
+#
+#   python benchmark.py --solo arranque --escalas 1 --repeticiones 10
+
+ESCALAS = (1, 100, 10_000, 1_000_000)
+APPS = ("app", "cotizador_fletes", "app_actualizada", "cotizador_transporte")
+
+CASOS = {}
+
+
+def caso(grupo, variante="core"):
+    # Registra una función de caso: recibe el contexto y la escala y devuelve
+    # (n operaciones, función a medir, por_operacion). Con por_operacion=True
+    # la función se llama n veces con el índice de la operación y cada
+    # llamada es una muestra de latencia; si no, se llama una vez por
+    # repetición y hace las n operaciones.
+    def registra(funcion):
+        CASOS[funcion.__name__] = (grupo, variante, funcion)
+        return funcion
+    return registra
+
+
+class Contexto:
+    def __init__(self, fuente=CSV_MUNICIPIOS, semilla=42):
+        self.fuente = fuente
+        self.semilla = semilla
+        self.catalogo = abrir_catalogo(fuente)
+        self.etiquetas = self.catalogo.etiquetas()
+        self._apps = {}
+
+    def carriles(self, n):
+        rng = np.random.default_rng(self.semilla)
+        return rng.integers(0, self.catalogo.n, n), rng.integers(0, self.catalogo.n, n)
+
+    def envios(self, n):
+        import pandas as pd
+
+        rng = np.random.default_rng(self.semilla)
+        fila_o, fila_d = self.carriles(n)
+        etiquetas = np.array(self.etiquetas, dtype=object)
+        return pd.DataFrame({
+            "origen": etiquetas[fila_o],
+            "destino": etiquetas[fila_d],
+            "servicio": rng.choice(["FTL", "LTL", "MUDANZA"], n),
+            "peso_vol": rng.uniform(0.1, 10, n).round(2),
+            "largo": rng.integers(10, 200, n),
+            "ancho": rng.integers(10, 200, n),
+            "alto": rng.integers(10, 200, n),
+            "maniobras": rng.choice([0, 500, 1500], n),
+        })
+
+    def cotizaciones(self, n):
+        return [
+            {
+                "Fecha cotización": "2024-01-01 10:00:00", "Cliente": f"Cliente {i}", "Servicio": "FTL",
+                "Origen": self.etiquetas[i % self.catalogo.n], "Destino": self.etiquetas[-1 - i % self.catalogo.n],
+                "Distancia (km)": 512.3, "Tipo de unidad": "3 Ton", "Peso/Vol (Ton)": 2.5,
+                "Costo Total MXN": 10234.5, "Observaciones": "Entrega en andén", "Fecha de servicio": "2024-01-02",
+            }
+            for i in range(n)
+        ]
+
+    def app(self, nombre):
+        # Las apps importan streamlit; sin él, los casos de la app se omiten
+        if nombre not in self._apps:
+            import importlib
+
+            try:
+                self._apps[nombre] = importlib.import_module(nombre)
+            except ImportError as error:
+                self._apps[nombre] = error
+        modulo = self._apps[nombre]
+        if isinstance(modulo, ImportError):
+            raise Omitido(f"{nombre}: {modulo}")
+        return modulo
+
+
+class Omitido(Exception):
+    pass
+
+
+def _limita(escala, tope):
+    return max(1, min(escala, tope))
+
+
+# ---------------- arranque ----------------
+
+# Módulos sin interfaz y dependencias pesadas que no deben cargar al importarlos
+NUCLEO = ("catalogo", "distancias", "tarifas", "cache_cotizaciones", "cotizacion", "bitacora", "pdf_cotizaciones", "metricas")
+PESADOS = ("streamlit", "pandas", "geopy", "fpdf", "openpyxl", "scipy")
+_DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+
+
+def modulos_pesados(modulo):
+    # Dependencias pesadas cargadas tras importar el módulo en un proceso nuevo
+    codigo = f"import sys, {modulo}; print(','.join(m for m in {PESADOS!r} if m in sys.modules))"
+    salida = subprocess.run(
+        [sys.executable, "-c", codigo], capture_output=True, text=True, check=True, cwd=_DIRECTORIO,
+    ).stdout.strip()
+    return salida.split(",") if salida else []
+
+
+def _caso_arranque(modulo):
+    # Tiempo de pared de un intérprete nuevo que sólo importa el módulo
+    def arranque(ctx, escala):
+        comando = [sys.executable, "-c", f"import {modulo}" if modulo else "pass"]
+        extra = {"pesados": modulos_pesados(modulo)} if modulo else {}
+        return 1, lambda: subprocess.run(comando, check=True, cwd=_DIRECTORIO), False, extra
+
+    arranque.__name__ = f"arranque_{modulo or 'python'}"
+    caso("arranque", modulo or "python")(arranque)
+
+
+for _modulo in (None,) + NUCLEO:
+    _caso_arranque(_modulo)
+
+
+# ---------------- carga ----------------
+
+@caso("carga")
+def carga_catalogo_mmap(ctx, escala):
+    def correr():
+        olvidar_catalogos()
+        abrir_catalogo(ctx.fuente).a_dataframe(limpio=True)
+    return 1, correr, False
+
+
+@caso("carga", "csv_original")
+def carga_csv_original(ctx, escala):
+    # Lo que hacía load_municipios antes del catálogo compilado
+    import pandas as pd
+
+    from catalogo import limpia_texto
+
+    def correr():
+        df = pd.read_csv(ctx.fuente, encoding="utf-8")
+        df["Estado"] = df["Estado"].apply(limpia_texto)
+        df["Ciudad"] = df["Ciudad"].apply(limpia_texto)
+        df["ciudad_norm"] = df["Ciudad"].apply(normaliza)
+        df["estado_norm"] = df["Estado"].apply(normaliza)
+    return 1, correr, False
+
+
+# ---------------- búsqueda ----------------
+
+@caso("busqueda")
+def busqueda_indice(ctx, escala):
+    n = _limita(escala, 100_000)
+    indice = ctx.catalogo.indice()
+    fila_o, _ = ctx.carriles(n)
+    etiquetas = [ctx.etiquetas[f] for f in fila_o]
+    return n, lambda i: indice.buscar_etiqueta(etiquetas[i]), True
+
+
+@caso("busqueda", "pandas_normaliza")
+def busqueda_pandas(ctx, escala):
+    # Búsqueda original: normaliza + máscara sobre todo el DataFrame
+    n = _limita(escala, 1_000)
+    df = ctx.catalogo.a_dataframe()
+    df["ciudad_norm"] = df["Ciudad"].apply(normaliza)
+    df["estado_norm"] = df["Estado"].apply(normaliza)
+    fila_o, _ = ctx.carriles(n)
+    pares = [(df["Ciudad"].iat[f], df["Estado"].iat[f]) for f in fila_o]
+
+    def correr(i):
+        ciudad, estado = pares[i]
+        return df[(df["ciudad_norm"] == normaliza(ciudad)) & (df["estado_norm"] == normaliza(estado))]
+    return n, correr, True
+
+
+@caso("busqueda", "typeahead")
+def busqueda_typeahead(ctx, escala):
+    n = _limita(escala, 10_000)
+    buscador = ctx.catalogo.buscador()
+    fila_o, _ = ctx.carriles(n)
+    consultas = [ctx.catalogo.valor("ciudad_norm", f)[:6] for f in fila_o]
+    return n, lambda i: buscador.buscar(consultas[i], 10), True
+
+
+# ---------------- distancia ----------------
+
+@caso("distancia")
+def distancia_matriz(ctx, escala):
+    from distancias import distancia_municipios
+
+    n = _limita(escala, 100_000)
+    fila_o, fila_d = ctx.carriles(n)
+    return n, lambda i: distancia_municipios(ctx.catalogo, fila_o[i], fila_d[i]), True
+
+
+@caso("distancia", "geodesic")
+def distancia_geodesic(ctx, escala):
+    from distancias import distancia_coordenadas
+
+    n = _limita(escala, 2_000)
+    fila_o, fila_d = ctx.carriles(n)
+    lat, lon = ctx.catalogo.latitud, ctx.catalogo.longitud
+    return n, lambda i: distancia_coordenadas(lat[fila_o[i]], lon[fila_o[i]], lat[fila_d[i]], lon[fila_d[i]]), True
+
+
+@caso("distancia", "lote")
+def distancia_lote(ctx, escala):
+    from distancias import distancias_municipios
+
+    fila_o, fila_d = ctx.carriles(escala)
+    return escala, lambda: distancias_municipios(ctx.catalogo, fila_o, fila_d), False
+
+
+# ---------------- tarificación ----------------
+
+@caso("cotizacion")
+def cotizar_servicio_individual(ctx, escala):
+    from cotizacion import cotizar_servicio
+
+    n = _limita(escala, 100_000)
+    rng = np.random.default_rng(ctx.semilla)
+    distancia = rng.uniform(1, 3000, n).tolist()
+    peso = rng.uniform(0.1, 10, n).tolist()
+    return n, lambda i: cotizar_servicio(distancia[i], peso[i], "FTL"), True
+
+
+@caso("cotizacion", "lote")
+def cotizar_lote_sin_cache(ctx, escala):
+    from cotizacion import cotizar_lote
+
+    envios = ctx.envios(escala)
+    return escala, lambda: cotizar_lote(envios, ctx.catalogo, cache=None), False
+
+
+@caso("cotizacion", "lote_cache")
+def cotizar_lote_con_cache(ctx, escala):
+    from cache_cotizaciones import CACHE
+    from cotizacion import cotizar_lote
+
+    envios = ctx.envios(escala)
+    CACHE.limpiar()
+    return escala, lambda: cotizar_lote(envios, ctx.catalogo), False
+
+
+# ---------------- PDF y Excel ----------------
+
+@caso("pdf")
+def pdf_plantilla(ctx, escala):
+    from pdf_cotizaciones import PLANTILLA_FLETES
+
+    n = _limita(escala, 2_000)
+    cotizaciones = ctx.cotizaciones(n)
+    return n, lambda i: PLANTILLA_FLETES.renderizar(cotizaciones[i]), True
+
+
+@caso("excel")
+def excel_bitacora(ctx, escala):
+    from bitacora import exportar_excel, guardar_cotizacion
+
+    n = _limita(escala, 100_000)
+    directorio = tempfile.mkdtemp(prefix="bench_")
+    ruta = os.path.join(directorio, "bitacora.sqlite")
+    for cotizacion in ctx.cotizaciones(n):
+        guardar_cotizacion(cotizacion, ruta)
+    destino = os.path.join(directorio, "salida.xlsx")
+    return n, lambda: exportar_excel(datetime.now().strftime("%Y-%m-%d"), destino, ruta), False
+
+
+@caso("excel", "to_excel")
+def excel_to_excel(ctx, escala):
+    import pandas as pd
+
+    n = _limita(escala, 100_000)
+    df = pd.DataFrame(ctx.cotizaciones(n))
+    destino = os.path.join(tempfile.mkdtemp(prefix="bench_"), "salida.xlsx")
+    return n, lambda: df.to_excel(destino, index=False), False
+
+
+# ---------------- apps de Streamlit ----------------
+
+def _caso_app(nombre):
+    def carga(ctx, escala):
+        modulo = ctx.app(nombre)
+        if not hasattr(modulo, "load_municipios"):
+            raise Omitido(f"{nombre} no tiene load_municipios")
+        funcion = getattr(modulo.load_municipios, "__wrapped__", modulo.load_municipios)
+
+        def correr():
+            olvidar_catalogos()
+            funcion(CSV_MUNICIPIOS)
+        return 1, correr, False
+
+    def distancia(ctx, escala):
+        modulo = ctx.app(nombre)
+        n = _limita(escala, 2_000)
+        fila_o, fila_d = ctx.carriles(n)
+        if nombre == "cotizador_transporte":
+            return n, lambda i: modulo.obtener_distancia(ctx.etiquetas[fila_o[i]], ctx.etiquetas[fila_d[i]]), True
+        if nombre == "app_actualizada":
+            return n, lambda i: modulo.calcular_distancia(ctx.catalogo, fila_o[i], fila_d[i]), True
+        # app.py y cotizador_fletes.py calculan la distancia con cotizar_ruta (grupo distancia)
+        raise Omitido(f"{nombre} no tiene función de distancia propia")
+
+    def pdf(ctx, escala):
+        modulo = ctx.app(nombre)
+        n = _limita(escala, 1_000)
+        cotizaciones = ctx.cotizaciones(n)
+        return n, lambda i: modulo.generar_pdf(cotizaciones[i]), True
+
+    for etapa, funcion in (("carga", carga), ("distancia", distancia), ("pdf", pdf)):
+        funcion.__name__ = f"{nombre}_{etapa}"
+        caso(etapa, nombre)(funcion)
+
+
+for _nombre in APPS:
+    _caso_app(_nombre)
+
+
+# ---------------- medición ----------------
+
+def _mide(preparar, ctx, escala, repeticiones):
+    n, funcion, por_operacion, *extra = preparar(ctx, escala)
+    muestras = []
+    gc.collect()
+    if por_operacion:
+        funcion(0)
+        for i in range(n):
+            inicio = time.perf_counter_ns()
+            funcion(i)
+            muestras.append(time.perf_counter_ns() - inicio)
+        total_s = sum(muestras) / 1e9
+        latencias = np.array(muestras) / 1e3
+    else:
+        for _ in range(repeticiones):
+            inicio = time.perf_counter_ns()
+            funcion()
+            muestras.append(time.perf_counter_ns() - inicio)
+        total_s = float(np.median(muestras)) / 1e9
+        latencias = np.array(muestras) / 1e3
+
+    # Memoria pico en una corrida aparte (tracemalloc vuelve lento el código)
+    tracemalloc.start()
+    if por_operacion:
+        for i in range(min(n, 1_000)):
+            funcion(i)
+    else:
+        funcion()
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "n": n,
+        "modo": "por_operacion" if por_operacion else "lote",
+        "repeticiones": n if por_operacion else repeticiones,
+        "segundos": round(total_s, 6),
+        "operaciones_por_s": round(n / total_s, 1) if total_s else None,
+        "latencia_us": {
+            "p50": round(float(np.percentile(latencias, 50)), 2),
+            "p90": round(float(np.percentile(latencias, 90)), 2),
+            "p99": round(float(np.percentile(latencias, 99)), 2),
+            "max": round(float(latencias.max()), 2),
+        },
+        "memoria_pico_mb": round(pico / 2**20, 3),
+        **(extra[0] if extra else {}),
+    }
+
+
+def _entorno(ctx):
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    import pandas as pd
+
+    return {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+        "catalogo": ctx.catalogo.version,
+        "municipios": ctx.catalogo.n,
+        "semilla": ctx.semilla,
+    }
+
+
+def correr(escalas=ESCALAS, solo=None, repeticiones=3, semilla=42, fuente=CSV_MUNICIPIOS, avisar=print):
+    random.seed(semilla)
+    ctx = Contexto(fuente, semilla)
+    resultados = []
+    for nombre, (grupo, variante, preparar) in CASOS.items():
+        if solo and grupo not in solo and nombre not in solo and variante not in solo:
+            continue
+        # Los casos que no dependen de la escala se miden una sola vez
+        vistos = set()
+        for escala in escalas:
+            registro = {"caso": nombre, "grupo": grupo, "variante": variante, "escala": escala}
+            try:
+                medicion = _mide(preparar, ctx, escala, repeticiones)
+            except Omitido as motivo:
+                registro["omitido"] = str(motivo)
+                resultados.append(registro)
+                avisar(f"{nombre:32s} omitido: {motivo}")
+                break
+            if medicion["n"] in vistos:
+                continue
+            vistos.add(medicion["n"])
+            registro.update(medicion)
+            resultados.append(registro)
+            avisar(
+                f"{nombre:32s} n={medicion['n']:>9,}  {medicion['operaciones_por_s'] or 0:>14,.0f} op/s  "
+                f"p50 {medicion['latencia_us']['p50']:>12,.1f} us  p99 {medicion['latencia_us']['p99']:>12,.1f} us  "
+                f"pico {medicion['memoria_pico_mb']:>9,.2f} MB"
+                + (f"  carga {','.join(medicion['pesados'])}" if medicion.get("pesados") else "")
+            )
+    return {"entorno": _entorno(ctx), "resultados": resultados}
+
+
+def comparar(actual, anterior):
+    # Cambio de operaciones por segundo por (caso, n) entre dos corridas
+    previos = {(r["caso"], r.get("n")): r for r in anterior["resultados"] if "omitido" not in r}
+    filas = []
+    for r in actual["resultados"]:
+        previo = previos.get((r["caso"], r.get("n")))
+        if previo and r.get("operaciones_por_s") and previo.get("operaciones_por_s"):
+            filas.append((r["caso"], r["n"], r["operaciones_por_s"] / previo["operaciones_por_s"]))
+    return filas
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Banco de pruebas de rendimiento del cotizador")
+    parser.add_argument("--salida", default=None, help="archivo JSON de resultados")
+    parser.add_argument("--escalas", default=",".join(str(e) for e in ESCALAS))
+    parser.add_argument("--solo", default=None, help="grupos, variantes o casos separados por coma")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--fuente", default=CSV_MUNICIPIOS)
+    parser.add_argument("--comparar", default=None, help="JSON de una corrida anterior")
+    parser.add_argument("--listar", action="store_true")
+    args = parser.parse_args(argv)
+
+    if args.listar:
+        for nombre, (grupo, variante, _) in CASOS.items():
+            print(f"{grupo:12s} {variante:22s} {nombre}")
+        return 0
+
+    escalas = [int(e) for e in args.escalas.split(",")]
+    solo = set(args.solo.split(",")) if args.solo else None
+    datos = correr(escalas, solo, args.repeticiones, args.semilla, args.fuente)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(datos, f, ensure_ascii=False, indent=2)
+        print(f"Resultados en {args.salida}")
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            anterior = json.load(f)
+        print(f"\nComparación contra {anterior['entorno'].get('commit')} (>1 = más rápido ahora)")
+        for nombre, n, razon in comparar(datos, anterior):
+            print(f"{nombre:32s} n={n:>9,}  x{razon:.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
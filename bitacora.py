@@ -0,0 +1,128 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+from datetime import datetime
+
+# Bitácora de cotizaciones sólo de anexado. Cada cotización es un INSERT en
+# SQLite con WAL: costo constante sin importar cuántas haya en el día, y
+# seguro entre sesiones y procesos concurrentes. El Excel diario ya no se
+# reescribe en cada cotización; se genera a pedido a partir de la bitácora.
+
+DIRECTORIO = "BaseCotizaciones"
+RUTA_BITACORA = os.path.join(DIRECTORIO, "cotizaciones.sqlite")
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS cotizaciones (
+    id INTEGER PRIMARY KEY,
+    fecha TEXT NOT NULL,
+    creada TEXT NOT NULL,
+    datos TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cotizaciones_fecha ON cotizaciones (fecha);
+"""
+
+# Streamlit corre cada sesión en su propio hilo; una conexión por hilo y ruta
+_local = threading.local()
+
+
+def conexion(ruta=RUTA_BITACORA):
+    conexiones = getattr(_local, "conexiones", None)
+    if conexiones is None:
+        conexiones = _local.conexiones = {}
+    clave = (os.getpid(), os.path.abspath(ruta))
+    con = conexiones.get(clave)
+    if con is None:
+        os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+        con = sqlite3.connect(ruta, timeout=30, isolation_level=None)
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("PRAGMA synchronous=NORMAL")
+        con.executescript(_ESQUEMA)
+        conexiones[clave] = con
+    return con
+
+
+def guardar_cotizacion(cotizacion, ruta=RUTA_BITACORA, momento=None):
+    momento = momento or datetime.now()
+    datos = json.dumps(cotizacion, ensure_ascii=False, default=str)
+    cursor = conexion(ruta).execute(
+        "INSERT INTO cotizaciones (fecha, creada, datos) VALUES (?, ?, ?)",
+        (momento.strftime("%Y-%m-%d"), momento.strftime("%Y-%m-%d %H:%M:%S"), datos),
+    )
+    return cursor.lastrowid
+
+
+def _filtro(fecha, desde, hasta):
+    condiciones, parametros = [], []
+    if fecha is not None:
+        condiciones.append("fecha = ?")
+        parametros.append(fecha)
+    if desde is not None:
+        condiciones.append("fecha >= ?")
+        parametros.append(desde)
+    if hasta is not None:
+        condiciones.append("fecha <= ?")
+        parametros.append(hasta)
+    return (f" WHERE {' AND '.join(condiciones)}" if condiciones else ""), parametros
+
+
+def iterar_cotizaciones(fecha=None, ruta=RUTA_BITACORA, desde=None, hasta=None):
+    # Recorre la bitácora en orden de inserción sin cargarla completa en memoria
+    donde, parametros = _filtro(fecha, desde, hasta)
+    consulta = f"SELECT datos FROM cotizaciones{donde} ORDER BY id"
+    for (datos,) in conexion(ruta).execute(consulta, parametros):
+        yield json.loads(datos)
+
+
+def columnas_bitacora(fecha=None, ruta=RUTA_BITACORA, desde=None, hasta=None):
+    # Llaves de las cotizaciones en orden de primera aparición, resuelto en
+    # SQLite (json_each) sin cargar los renglones a Python
+    donde, parametros = _filtro(fecha, desde, hasta)
+    consulta = (
+        f"SELECT j.key FROM cotizaciones, json_each(cotizaciones.datos) AS j{donde} "
+        "GROUP BY j.key ORDER BY MIN(cotizaciones.id * 4294967296 + j.id)"
+    )
+    return [llave for (llave,) in conexion(ruta).execute(consulta, parametros)]
+
+
+def leer_cotizaciones(fecha=None, ruta=RUTA_BITACORA, desde=None, hasta=None):
+    import pandas as pd
+
+    return pd.DataFrame(list(iterar_cotizaciones(fecha, ruta, desde, hasta)))
+
+
+def ruta_excel_del_dia(fecha):
+    return os.path.join(DIRECTORIO, f"cotizaciones_{fecha}.xlsx")
+
+
+def exportar_bitacora(destino, fecha=None, ruta=RUTA_BITACORA, desde=None, hasta=None, formato=None):
+    # XLSX, CSV o Parquet por bloques con memoria constante; devuelve renglones
+    from exportacion import exportar
+
+    columnas = columnas_bitacora(fecha, ruta, desde, hasta)
+    return exportar(iterar_cotizaciones(fecha, ruta, desde, hasta), destino, formato, columnas)
+
+
+def exportar_excel(fecha=None, destino=None, ruta=RUTA_BITACORA):
+    # Materializa el Excel del día (por omisión, hoy) desde la bitácora
+    fecha = fecha or datetime.now().strftime("%Y-%m-%d")
+    destino = destino or ruta_excel_del_dia(fecha)
+    exportar_bitacora(destino, fecha, ruta)
+    return destino
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Exporta la bitácora de cotizaciones a Excel")
+    parser.add_argument("--fecha", default=None, help="día a exportar (AAAA-MM-DD, por omisión hoy)")
+    parser.add_argument("--salida", default=None)
+    parser.add_argument("--bitacora", default=RUTA_BITACORA)
+    args = parser.parse_args(argv)
+    print(exportar_excel(args.fecha, args.salida, args.bitacora))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
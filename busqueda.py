@@ -0,0 +1,138 @@
+import bisect
+import re
+import sys
+
+import numpy as np
+
+from catalogo import abrir_catalogo, normaliza, CSV_MUNICIPIOS
+
+# Búsqueda de municipios para autocompletar (typeahead).
+#
+# Sobre las llaves normalizadas del catálogo (sin acentos, minúsculas) se
+# arman dos índices:
+#   - listas ordenadas de nombres y palabras, para prefijos con bisect
+#     ("san nic" -> San Nicolás de los Garza, "tlaquep" -> San Pedro Tlaquepaque)
+#   - trigramas -> filas, para tolerar errores de dedo ("tlaquepaqe", "monterey")
+# buscar() devuelve las k filas con mejor puntaje, así la interfaz o la API
+# sólo piden unos cuantos candidatos en lugar de las ~2,470 etiquetas.
+
+_NO_ALFANUMERICO = re.compile(r"[^a-z0-9]+")
+
+# Puntaje mínimo de cobertura de trigramas para aceptar un candidato difuso
+COBERTURA_MINIMA = 0.5
+
+
+def simplifica(texto):
+    # normaliza() y además deja sólo letras y dígitos separados por un espacio
+    return _NO_ALFANUMERICO.sub(" ", normaliza(texto)).strip()
+
+
+def trigramas(texto):
+    # Con relleno para que el inicio de cada palabra pese más
+    relleno = f"  {texto} "
+    return {relleno[i:i + 3] for i in range(len(relleno) - 2)}
+
+
+def _rango_prefijo(ordenados, prefijo):
+    # Rango [a, b) de tuplas (texto, fila) cuyo texto empieza con prefijo
+    a = bisect.bisect_left(ordenados, (prefijo, -1))
+    b = bisect.bisect_left(ordenados, (prefijo + "\uffff", -1))
+    return a, b
+
+
+class BuscadorMunicipios:
+    def __init__(self, catalogo):
+        self.catalogo = catalogo
+        n = catalogo.n
+        ciudades = [simplifica(c) for c in catalogo.columna("ciudad_norm")]
+        estados = [simplifica(e) for e in catalogo.columna("estado_norm")]
+        textos = [f"{c} {e}" for c, e in zip(ciudades, estados)]
+
+        self._nombres = sorted((texto, fila) for fila, texto in enumerate(textos))
+        self._palabras = sorted({(p, fila) for fila, texto in enumerate(textos) for p in texto.split()})
+
+        filas_por_trigrama = {}
+        self._num_trigramas = np.empty(n, dtype=np.float64)
+        for fila, texto in enumerate(textos):
+            propios = trigramas(texto)
+            self._num_trigramas[fila] = len(propios)
+            for trigrama in propios:
+                filas_por_trigrama.setdefault(trigrama, []).append(fila)
+        self._trigramas = {t: np.asarray(filas, dtype=np.intp) for t, filas in filas_por_trigrama.items()}
+
+    def _filas_prefijo(self, consulta):
+        a, b = _rango_prefijo(self._nombres, consulta)
+        return [fila for _, fila in self._nombres[a:b]]
+
+    def _filas_palabras(self, palabras):
+        # Filas donde cada palabra de la consulta es prefijo de alguna palabra
+        comunes = None
+        for palabra in palabras:
+            a, b = _rango_prefijo(self._palabras, palabra)
+            filas = {fila for _, fila in self._palabras[a:b]}
+            comunes = filas if comunes is None else comunes & filas
+            if not comunes:
+                return set()
+        return comunes or set()
+
+    def puntajes(self, consulta):
+        # Puntaje por fila: prefijo del nombre completo (+1), todas las
+        # palabras como prefijos (+0.5) y similitud de trigramas (cobertura
+        # de la consulta + Jaccard como desempate)
+        consulta = simplifica(consulta)
+        puntaje = np.zeros(self.catalogo.n)
+        if not consulta:
+            return puntaje
+        propios = trigramas(consulta)
+        listas = [self._trigramas[t] for t in propios if t in self._trigramas]
+        if listas:
+            comunes = np.bincount(np.concatenate(listas), minlength=self.catalogo.n)
+            cobertura = comunes / len(propios)
+            jaccard = comunes / (len(propios) + self._num_trigramas - comunes)
+            puntaje += np.where(cobertura >= COBERTURA_MINIMA, cobertura + 0.5 * jaccard, 0.0)
+        prefijo = self._filas_prefijo(consulta)
+        if prefijo:
+            puntaje[prefijo] += 1.0
+        palabras = self._filas_palabras(consulta.split())
+        if palabras:
+            puntaje[list(palabras)] += 0.5
+        return puntaje
+
+    def buscar(self, consulta, k=10):
+        # Filas del catálogo, de la más a la menos parecida (máximo k)
+        puntaje = self.puntajes(consulta)
+        candidatas = np.flatnonzero(puntaje > 0)
+        if len(candidatas) > k:
+            candidatas = candidatas[np.argpartition(-puntaje[candidatas], k - 1)[:k]]
+        # Empates: primero el nombre más corto y luego el orden del catálogo
+        orden = np.lexsort((candidatas, self._num_trigramas[candidatas], -puntaje[candidatas]))
+        return candidatas[orden].tolist()
+
+    def sugerencias(self, consulta, k=10, limpio=True):
+        # Etiquetas "Ciudad (Estado)" listas para un selectbox o una respuesta JSON
+        return [self.catalogo.etiqueta(fila, limpio) for fila in self.buscar(consulta, k)]
+
+
+def main(argv=None):
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Busca municipios por prefijo o aproximación")
+    parser.add_argument("consulta", nargs="+")
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--fuente", default=CSV_MUNICIPIOS)
+    args = parser.parse_args(argv)
+
+    buscador = abrir_catalogo(args.fuente).buscador()
+    consulta = " ".join(args.consulta)
+    inicio = time.perf_counter()
+    filas = buscador.buscar(consulta, args.k)
+    microsegundos = (time.perf_counter() - inicio) * 1e6
+    for fila in filas:
+        print(f"{fila:6d}  {buscador.catalogo.etiqueta(fila, limpio=True)}")
+    print(f"{len(filas)} resultados en {microsegundos:.0f} µs")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+import threading
+from collections import OrderedDict
+
+# Caché LRU acotado de cotizaciones. La llave es el carril y los parámetros
+# que realmente cambian el precio: (fila origen, fila destino, servicio,
+# clase de unidad, maniobras). Del LTL se guarda la distancia y la tarifa por
+# m3; el costo se calcula con el volumen de cada consulta. El caché recuerda
+# las versiones de catálogo y tarifario con las que se llenó; si cambian, se
+# vacía solo antes de la siguiente consulta.
+
+CAPACIDAD = 8192
+
+
+class CacheCotizaciones:
+    def __init__(self, capacidad=CAPACIDAD):
+        self.capacidad = capacidad
+        self._datos = OrderedDict()
+        self._versiones = None
+        self._candado = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = 0
+        self.invalidaciones = 0
+
+    def __len__(self):
+        return len(self._datos)
+
+    def _valida_versiones(self, versiones):
+        # Se llama con el candado tomado
+        if versiones != self._versiones:
+            if self._datos:
+                self.invalidaciones += 1
+            self._datos.clear()
+            self._versiones = versiones
+
+    def buscar(self, clave, versiones):
+        with self._candado:
+            self._valida_versiones(versiones)
+            valor = self._datos.get(clave)
+            if valor is None:
+                self.fallos += 1
+                return None
+            self._datos.move_to_end(clave)
+            self.aciertos += 1
+            return valor
+
+    def guardar(self, clave, valor, versiones):
+        with self._candado:
+            self._valida_versiones(versiones)
+            self._datos[clave] = valor
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.capacidad:
+                self._datos.popitem(last=False)
+                self.desalojos += 1
+
+    def obtener(self, clave, versiones, calcular):
+        valor = self.buscar(clave, versiones)
+        if valor is None:
+            valor = calcular()
+            self.guardar(clave, valor, versiones)
+        return valor
+
+    def limpiar(self):
+        with self._candado:
+            self._datos.clear()
+
+    def estadisticas(self):
+        consultas = self.aciertos + self.fallos
+        return {
+            "entradas": len(self._datos),
+            "capacidad": self.capacidad,
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "desalojos": self.desalojos,
+            "invalidaciones": self.invalidaciones,
+            "tasa_aciertos": self.aciertos / consultas if consultas else 0.0,
+        }
+
+
+# Caché del proceso, compartido por todas las sesiones y rutas de cotización
+CACHE = CacheCotizaciones()
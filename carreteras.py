@@ -0,0 +1,210 @@
+import hashlib
+import heapq
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from catalogo import abrir_catalogo, CSV_MUNICIPIOS
+from distancias import guardar_matriz, ruta_matriz
+from espacial import IndiceEspacial
+
+# Distancias por carretera entre municipios, fuera de línea.
+#
+# La red se lee de un archivo local (CSV o Parquet) con un tramo por renglón:
+#
+#   lat1, lon1, lat2, lon2, km [, sentido_unico]
+#
+# Los nodos son los extremos de los tramos (coordenadas redondeadas a 1e-6°).
+# Cada municipio del catálogo se ancla a su nodo más cercano (KD-tree de
+# espacial.py) y se suma ese tramo de acceso en línea recta. Desde cada nodo
+# ancla se corre Dijkstra sobre la red en CSR (scipy si está instalado; si no,
+# heapq repartido entre procesos) y el resultado se guarda como la tabla
+# N x N "carretera" de distancias.py, así que cotizar sigue siendo O(1).
+#
+#   python carreteras.py red_carretera.csv --procesos 8
+#
+# Los pares sin ruta en la red quedan como NaN en la tabla y al cotizar caen
+# a la distancia en línea recta.
+
+_DECIMALES_NODO = 6
+
+# Red del proceso de trabajo (se carga una vez por proceso)
+_red_trabajador = None
+
+
+def huella_archivo(ruta):
+    h = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def _lee_tramos(ruta):
+    import pandas as pd
+
+    if os.path.splitext(ruta)[1].lower() in (".parquet", ".pq"):
+        df = pd.read_parquet(ruta)
+    else:
+        df = pd.read_csv(ruta)
+    faltan = {"lat1", "lon1", "lat2", "lon2", "km"} - set(df.columns)
+    if faltan:
+        raise ValueError(f"{ruta}: faltan las columnas {sorted(faltan)}")
+    return df
+
+
+class RedCarretera:
+    # Grafo dirigido en CSR: los tramos que salen del nodo i son
+    # destinos[inicio[i]:inicio[i + 1]] con pesos km[...]
+    def __init__(self, latitud, longitud, origen, destino, km):
+        self.latitud = latitud
+        self.longitud = longitud
+        self.n = len(latitud)
+        # Tramos repetidos: se queda el más corto
+        orden = np.lexsort((km, destino, origen))
+        origen, destino, km = origen[orden], destino[orden], km[orden]
+        unico = np.ones(len(origen), dtype=bool)
+        unico[1:] = (origen[1:] != origen[:-1]) | (destino[1:] != destino[:-1])
+        origen, destino, km = origen[unico], destino[unico], km[unico]
+        self.inicio = np.zeros(self.n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(origen, minlength=self.n), out=self.inicio[1:])
+        self.destinos = destino.astype(np.int64)
+        self.km = km.astype(np.float64)
+
+    @classmethod
+    def desde_archivo(cls, ruta):
+        df = _lee_tramos(ruta)
+        km = df["km"].to_numpy(dtype=np.float64)
+        validos = np.isfinite(km) & (km >= 0)
+        df, km = df[validos], km[validos]
+        extremos = np.concatenate([
+            df[["lat1", "lon1"]].to_numpy(dtype=np.float64),
+            df[["lat2", "lon2"]].to_numpy(dtype=np.float64),
+        ]).round(_DECIMALES_NODO)
+        nodos, codigos = np.unique(extremos, axis=0, return_inverse=True)
+        codigos = codigos.ravel()
+        a, b = codigos[:len(df)], codigos[len(df):]
+        if "sentido_unico" in df:
+            doble = ~df["sentido_unico"].fillna(False).astype(bool).to_numpy()
+        else:
+            doble = np.ones(len(df), dtype=bool)
+        origen = np.concatenate([a, b[doble]])
+        destino = np.concatenate([b, a[doble]])
+        return cls(nodos[:, 0], nodos[:, 1], origen, destino, np.concatenate([km, km[doble]]))
+
+    def matriz_scipy(self):
+        from scipy.sparse import csr_matrix
+
+        return csr_matrix((self.km, self.destinos, self.inicio), shape=(self.n, self.n))
+
+
+def dijkstra_objetivos(inicio, destinos, pesos, fuente, objetivos):
+    # Distancias desde fuente a cada nodo de objetivos (inf si no hay ruta);
+    # se detiene en cuanto todos los objetivos quedan resueltos
+    dist = {fuente: 0.0}
+    pendientes = set(objetivos)
+    resueltos = set()
+    cola = [(0.0, fuente)]
+    while cola and pendientes:
+        d, nodo = heapq.heappop(cola)
+        if nodo in resueltos:
+            continue
+        resueltos.add(nodo)
+        pendientes.discard(nodo)
+        for j in range(inicio[nodo], inicio[nodo + 1]):
+            vecino = destinos[j]
+            nueva = d + pesos[j]
+            if nueva < dist.get(vecino, np.inf):
+                dist[vecino] = nueva
+                heapq.heappush(cola, (nueva, vecino))
+    return [dist[o] if o in resueltos else np.inf for o in objetivos]
+
+
+def _inicia_trabajador(red):
+    global _red_trabajador
+    # Listas de Python: el lazo de Dijkstra es mucho más rápido sin escalares de numpy
+    _red_trabajador = (red.inicio.tolist(), red.destinos.tolist(), red.km.tolist())
+
+
+def _dijkstra_bloque(fuentes, objetivos):
+    objetivos = objetivos.tolist()
+    return np.array([dijkstra_objetivos(*_red_trabajador, f, objetivos) for f in fuentes.tolist()])
+
+
+def caminos_minimos(red, anclas, procesos=None, tam_bloque=16):
+    # Matriz len(anclas) x len(anclas) de km por carretera entre nodos ancla
+    try:
+        from scipy.sparse.csgraph import dijkstra
+    except ImportError:
+        dijkstra = None
+    if dijkstra is not None:
+        grafo = red.matriz_scipy()
+        filas = []
+        for i in range(0, len(anclas), tam_bloque):
+            # Por bloques para no materializar fuentes x nodos completos
+            filas.append(dijkstra(grafo, indices=anclas[i:i + tam_bloque])[:, anclas])
+        return np.concatenate(filas)
+
+    procesos = procesos or os.cpu_count() or 1
+    bloques = [anclas[i:i + tam_bloque] for i in range(0, len(anclas), tam_bloque)]
+    if procesos == 1:
+        _inicia_trabajador(red)
+        return np.concatenate([_dijkstra_bloque(b, anclas) for b in bloques])
+    with ProcessPoolExecutor(procesos, initializer=_inicia_trabajador, initargs=(red,)) as grupo:
+        return np.concatenate(list(grupo.map(_dijkstra_bloque, bloques, [anclas] * len(bloques))))
+
+
+def construir_tabla(catalogo, ruta_red, destino=None, procesos=None):
+    destino = destino or ruta_matriz(catalogo, "carretera")
+    red = RedCarretera.desde_archivo(ruta_red)
+    if red.n == 0:
+        raise ValueError(f"{ruta_red} no tiene tramos válidos")
+
+    # Ancla de cada municipio: nodo más cercano + acceso en línea recta
+    nodo, acceso = IndiceEspacial(red.latitud, red.longitud).mas_cercano(catalogo.latitud, catalogo.longitud)
+    anclas, ancla_de_fila = np.unique(nodo, return_inverse=True)
+    entre_anclas = caminos_minimos(red, anclas, procesos)
+
+    km = entre_anclas[np.ix_(ancla_de_fila, ancla_de_fila)] + acceso[:, None] + acceso[None, :]
+    km[~np.isfinite(km)] = np.nan
+    np.fill_diagonal(km, 0.0)
+    guardar_matriz(
+        km.astype(np.float32), catalogo, destino,
+        modo="carretera",
+        red={
+            "archivo": os.path.basename(ruta_red),
+            "huella": huella_archivo(ruta_red),
+            "nodos": red.n,
+            "tramos": len(red.destinos),
+        },
+        acceso_max_km=round(float(acceso.max()), 3),
+    )
+    return destino, red, acceso
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Precalcula distancias por carretera entre municipios")
+    parser.add_argument("red", help="tramos de la red (CSV o Parquet: lat1, lon1, lat2, lon2, km[, sentido_unico])")
+    parser.add_argument("--fuente", default=CSV_MUNICIPIOS)
+    parser.add_argument("--salida", default=None)
+    parser.add_argument("--procesos", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    inicio = time.perf_counter()
+    catalogo = abrir_catalogo(args.fuente)
+    destino, red, acceso = construir_tabla(catalogo, args.red, args.salida, args.procesos)
+    segundos = time.perf_counter() - inicio
+    print(
+        f"{destino}: {catalogo.n} x {catalogo.n} por carretera ({red.n:,} nodos, "
+        f"{len(red.destinos):,} tramos, acceso máx. {acceso.max():.1f} km) en {segundos:.1f} s"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
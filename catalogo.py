@@ -0,0 +1,335 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import unicodedata
+
+import numpy as np
+
+# Catálogo binario de municipios.
+#
+# Los CSV se compilan una sola vez a un archivo con arreglos float64 de
+# coordenadas, una tabla de textos internados (cada cadena se guarda una vez)
+# y las llaves normalizadas ya calculadas. Cada proceso abre el archivo con
+# mmap: los arreglos son vistas de solo lectura sobre las páginas del sistema
+# operativo, sin parsear y sin copia privada.
+
+CSV_MUNICIPIOS = "municipios_mexico.csv"
+CSV_ALIAS = "municipios.csv"
+CSV_CAPITALES = "capitales_mexico.csv"
+
+MAGIA = b"MUNCAT01"
+VERSION_FORMATO = 2
+_ALINEACION = 8
+
+# Columnas de texto, cada una guardada como ids uint32 a la tabla de textos
+COLUMNAS_TEXTO = (
+    "estado", "ciudad",
+    "estado_limpio", "ciudad_limpio",
+    "estado_norm", "ciudad_norm",
+    "alias",
+)
+
+
+def limpia_texto(texto):
+    # Normaliza y elimina caracteres extraños/acentos
+    if texto is None or texto != texto:
+        return ""
+    txt = ''.join(
+        c for c in unicodedata.normalize('NFKD', str(texto))
+        if not unicodedata.combining(c)
+    )
+    txt = txt.replace("’", "'").replace("“", '"').replace("”", '"').replace("–", "-")
+    return txt.strip()
+
+
+def normaliza(texto):
+    if texto is None or texto != texto:
+        return ""
+    return ''.join(
+        c for c in unicodedata.normalize('NFKD', str(texto))
+        if not unicodedata.combining(c)
+    ).lower().strip()
+
+
+def ruta_catalogo(fuente=CSV_MUNICIPIOS):
+    return os.path.splitext(fuente)[0] + ".cat"
+
+
+def _alinea(n):
+    return (n + _ALINEACION - 1) // _ALINEACION * _ALINEACION
+
+
+def _huella(*rutas):
+    h = hashlib.sha256(b"%d" % VERSION_FORMATO)
+    for ruta in rutas:
+        if os.path.exists(ruta):
+            with open(ruta, "rb") as f:
+                h.update(f.read())
+    return h.hexdigest()
+
+
+def _estado_fuentes(*rutas):
+    estado = {}
+    for ruta in rutas:
+        if os.path.exists(ruta):
+            st = os.stat(ruta)
+            estado[ruta] = [st.st_size, st.st_mtime_ns]
+    return estado
+
+
+def construir_catalogo(fuente=CSV_MUNICIPIOS, alias=CSV_ALIAS, destino=None, capitales=CSV_CAPITALES):
+    # Limpieza y conciliación de los CSV en ingesta.py; aquí sólo se internan
+    # los textos y se escribe el archivo
+    import pandas as pd
+
+    from ingesta import ingerir
+
+    destino = destino or ruta_catalogo(fuente)
+    columnas, reporte = ingerir(fuente, alias, capitales)
+    n = len(columnas["latitud"])
+
+    # Tabla de textos internados: factorize sobre todas las columnas juntas
+    todos = np.concatenate([np.asarray(columnas[col], dtype=object) for col in COLUMNAS_TEXTO])
+    codigos, textos = pd.factorize(todos)
+    ids = {
+        col: np.ascontiguousarray(codigos[k * n:(k + 1) * n], dtype=np.uint32)
+        for k, col in enumerate(COLUMNAS_TEXTO)
+    }
+
+    codificados = [t.encode("utf-8") for t in textos]
+    offsets = np.zeros(len(codificados) + 1, dtype=np.uint32)
+    offsets[1:] = np.cumsum([len(b) for b in codificados])
+    blob = np.frombuffer(b"".join(codificados), dtype=np.uint8)
+
+    secciones = [("latitud", columnas["latitud"]), ("longitud", columnas["longitud"])]
+    secciones += [(f"id_{col}", ids[col]) for col in COLUMNAS_TEXTO]
+    secciones += [("textos_offsets", offsets), ("textos_blob", blob)]
+
+    indice, posicion = {}, 0
+    for nombre, arreglo in secciones:
+        indice[nombre] = [posicion, arreglo.dtype.str, int(arreglo.size)]
+        posicion = _alinea(posicion + arreglo.nbytes)
+
+    cabecera = json.dumps({
+        "version": VERSION_FORMATO,
+        "n": n,
+        "huella": _huella(fuente, alias, capitales),
+        "fuentes": _estado_fuentes(fuente, alias, capitales),
+        "secciones": indice,
+        "ingesta": reporte,
+    }, ensure_ascii=False).encode("utf-8")
+
+    inicio = _alinea(len(MAGIA) + 4 + len(cabecera))
+    tmp = f"{destino}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIA + struct.pack("<I", len(cabecera)) + cabecera)
+        for nombre, arreglo in secciones:
+            f.seek(inicio + indice[nombre][0])
+            f.write(arreglo.tobytes())
+    # Reemplazo atómico: otros procesos siguen viendo el archivo anterior
+    os.replace(tmp, destino)
+    return destino
+
+
+def _lee_cabecera(ruta):
+    with open(ruta, "rb") as f:
+        inicio = f.read(len(MAGIA) + 4)
+        if len(inicio) < len(MAGIA) + 4 or inicio[:len(MAGIA)] != MAGIA:
+            raise ValueError(f"{ruta} no es un catálogo de municipios válido")
+        (largo,) = struct.unpack("<I", inicio[len(MAGIA):])
+        return json.loads(f.read(largo)), _alinea(len(MAGIA) + 4 + largo)
+
+
+def catalogo_vigente(ruta, fuente=CSV_MUNICIPIOS, alias=CSV_ALIAS, capitales=CSV_CAPITALES):
+    if not os.path.exists(ruta):
+        return False
+    try:
+        cabecera, _ = _lee_cabecera(ruta)
+    except (ValueError, OSError):
+        return False
+    if cabecera.get("version") != VERSION_FORMATO:
+        return False
+    if cabecera.get("fuentes") == _estado_fuentes(fuente, alias, capitales):
+        return True
+    # Cambió la fecha o el tamaño: sólo se reconstruye si cambió el contenido
+    return cabecera.get("huella") == _huella(fuente, alias, capitales)
+
+
+class Catalogo:
+    def __init__(self, ruta):
+        self.ruta = ruta
+        cabecera, inicio = _lee_cabecera(ruta)
+        with open(ruta, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.cabecera = cabecera
+        self.huella = cabecera["huella"]
+        self.n = cabecera["n"]
+        arreglos = {
+            nombre: np.frombuffer(self._mm, dtype=np.dtype(dtype), count=cuenta, offset=inicio + offset)
+            for nombre, (offset, dtype, cuenta) in cabecera["secciones"].items()
+        }
+        self.latitud = arreglos["latitud"]
+        self.longitud = arreglos["longitud"]
+        self.ids = {col: arreglos[f"id_{col}"] for col in COLUMNAS_TEXTO}
+        self._offsets = arreglos["textos_offsets"]
+        self._blob = arreglos["textos_blob"]
+        self._textos = None
+        self._indice = None
+        self._buscador = None
+        self._espacial = None
+
+    # Versión corta de la huella; cambia cuando cambian los CSV de origen
+    @property
+    def version(self):
+        return self.huella[:16]
+
+    def __len__(self):
+        return self.n
+
+    def texto(self, id_texto):
+        if self._textos is not None:
+            return self._textos[id_texto]
+        ini, fin = self._offsets[id_texto], self._offsets[id_texto + 1]
+        return self._blob[ini:fin].tobytes().decode("utf-8")
+
+    def textos(self):
+        # La tabla internada es chica (unos miles de cadenas); se decodifica una vez
+        if self._textos is None:
+            datos = self._blob.tobytes()
+            off = self._offsets.tolist()
+            self._textos = [datos[off[i]:off[i + 1]].decode("utf-8") for i in range(len(off) - 1)]
+        return self._textos
+
+    def columna(self, nombre):
+        textos = self.textos()
+        return [textos[i] for i in self.ids[nombre].tolist()]
+
+    def valor(self, nombre, fila):
+        return self.texto(int(self.ids[nombre][fila]))
+
+    def etiqueta(self, fila, limpio=False):
+        sufijo = "_limpio" if limpio else ""
+        return f"{self.valor('ciudad' + sufijo, fila)} ({self.valor('estado' + sufijo, fila)})"
+
+    def etiquetas(self, limpio=False):
+        sufijo = "_limpio" if limpio else ""
+        return [
+            f"{ciudad} ({estado})"
+            for ciudad, estado in zip(self.columna("ciudad" + sufijo), self.columna("estado" + sufijo))
+        ]
+
+    def indice(self):
+        # Se construye una vez por catálogo abierto y se reutiliza en cada cotización
+        if self._indice is None:
+            self._indice = IndiceMunicipios(self)
+        return self._indice
+
+    def buscador(self):
+        # Índice de búsqueda por prefijo/aproximación (módulo busqueda)
+        if self._buscador is None:
+            from busqueda import BuscadorMunicipios
+
+            self._buscador = BuscadorMunicipios(self)
+        return self._buscador
+
+    def espacial(self):
+        # KD-tree de coordenadas para el municipio más cercano (módulo espacial)
+        if self._espacial is None:
+            from espacial import IndiceEspacial
+
+            self._espacial = IndiceEspacial(self.latitud, self.longitud)
+        return self._espacial
+
+    def a_dataframe(self, limpio=False):
+        import pandas as pd
+
+        sufijo = "_limpio" if limpio else ""
+        return pd.DataFrame({
+            "Estado": self.columna("estado" + sufijo),
+            "Ciudad": self.columna("ciudad" + sufijo),
+            "Longitud": self.longitud,
+            "Latitud": self.latitud,
+        }, copy=False)
+
+
+class IndiceMunicipios:
+    # Tablas hash de llave normalizada (ciudad, estado) y de etiqueta visible
+    # ("Ciudad (Estado)", su versión limpia y el alias de municipios.csv) a fila
+    # del catálogo. Con nombres repetidos gana la primera fila, como el .iloc[0]
+    # de las búsquedas originales.
+    def __init__(self, catalogo):
+        self.catalogo = catalogo
+        self.por_llave = {}
+        self.por_etiqueta = {}
+        llaves = zip(catalogo.columna("ciudad_norm"), catalogo.columna("estado_norm"))
+        for fila, llave in enumerate(llaves):
+            self.por_llave.setdefault(llave, fila)
+        for etiquetas in (catalogo.etiquetas(), catalogo.etiquetas(limpio=True), catalogo.columna("alias")):
+            for fila, etiqueta in enumerate(etiquetas):
+                self.por_etiqueta.setdefault(etiqueta, fila)
+
+    def __len__(self):
+        return len(self.por_llave)
+
+    def buscar(self, ciudad, estado):
+        return self.por_llave.get((normaliza(ciudad), normaliza(estado)))
+
+    def buscar_etiqueta(self, etiqueta):
+        fila = self.por_etiqueta.get(etiqueta)
+        if fila is None and " (" in etiqueta:
+            ciudad, estado = etiqueta.rsplit(" (", 1)
+            fila = self.buscar(ciudad, estado.replace(")", ""))
+        return fila
+
+
+_ABIERTOS = {}
+
+
+def abrir_catalogo(fuente=CSV_MUNICIPIOS, alias=CSV_ALIAS, ruta=None, capitales=CSV_CAPITALES):
+    # Abre (y compila si hace falta) el catálogo; una instancia por proceso
+    ruta = ruta or ruta_catalogo(fuente)
+    if not catalogo_vigente(ruta, fuente, alias, capitales):
+        construir_catalogo(fuente, alias, ruta, capitales)
+    clave = (os.path.abspath(ruta), os.stat(ruta).st_mtime_ns)
+    catalogo = _ABIERTOS.get(clave)
+    if catalogo is None:
+        catalogo = Catalogo(ruta)
+        _ABIERTOS[clave] = catalogo
+    return catalogo
+
+
+def olvidar_catalogos():
+    # La siguiente llamada a abrir_catalogo vuelve a abrir el archivo (carga
+    # en frío). No cierra los mmap: las instancias que alguien ya tiene, y los
+    # arreglos que apuntan a ellos, siguen siendo válidos.
+    _ABIERTOS.clear()
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compila los CSV de municipios a un catálogo binario")
+    parser.add_argument("--fuente", default=CSV_MUNICIPIOS)
+    parser.add_argument("--alias", default=CSV_ALIAS)
+    parser.add_argument("--capitales", default=CSV_CAPITALES)
+    parser.add_argument("--salida", default=None)
+    parser.add_argument("--reporte", action="store_true", help="imprime el reporte de ingesta completo")
+    args = parser.parse_args(argv)
+    destino = construir_catalogo(args.fuente, args.alias, args.salida, args.capitales)
+    catalogo = Catalogo(destino)
+    reporte = catalogo.cabecera["ingesta"]
+    print(f"{destino}: {len(catalogo)} municipios, version {catalogo.version}")
+    print(
+        f"coordenadas {reporte['coordenadas']}, {reporte['duplicados']} duplicados, "
+        f"{reporte['homonimos']} homónimos"
+    )
+    if args.reporte:
+        print(json.dumps(reporte, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,273 @@
+import sys
+import time
+
+import numpy as np
+
+from catalogo import abrir_catalogo, CSV_MUNICIPIOS
+from cotizacion import redondea, tabla_a_dataframe, columna_numerica, filas_extremo, volumenes_m3
+from distancias import distancias_municipios
+from espacial import IndiceEspacial
+from rutas import planear_ruta
+from tarifas import obtener_tarifario
+
+# Consolidación de envíos LTL del día en unidades completas.
+#
+# Los envíos se agrupan por origen y zona de destino: los destinos de un
+# mismo origen se juntan, del más lejano al más cercano, con los que quedan a
+# radio_km o menos (vecinos del KD-tree de espacial.py, a lo más
+# PARADAS_ZONA por zona). Con radio_km=0 cada destino es su propia zona y
+# sólo se consolidan carriles idénticos. En cada zona los envíos se acomodan
+# por volumen y peso con First-Fit Decreasing en dos dimensiones, una vez por
+# cada clase de unidad como tamaño de caja; cada viaje resultante se baja a
+# la unidad más barata en la que cabe su carga, y se queda la mezcla más
+# barata de las corridas. Un viaje con varios destinos se cobra por los km de
+# su ruta de reparto (rutas.planear_ruta, sin regreso). Al final, un viaje
+# cuya carga sale más barata como LTL individual se manda así. Los precios
+# son los del tarifario: banderazo + km excedente de cada unidad, y tarifa
+# LTL por m3 según la distancia directa de cada envío.
+#
+# Las capacidades de cada unidad son "capacidad_ton" y "capacidad_m3" en
+# tarifas.json; las unidades sin capacidad no se usan para consolidar.
+
+EXCEDE = "excede capacidad"
+SIN_MUNICIPIO = "sin municipio"
+CONSOLIDADO = "consolidado"
+INDIVIDUAL = "LTL"
+
+RADIO_KM = 50
+PARADAS_ZONA = 8
+
+
+def costo_unidades(tarifario, distancia):
+    # Costo de un viaje de cada clase de unidad a esa distancia (regla FTL)
+    excedente = max(float(distancia) - tarifario.km_banderazo, 0.0)
+    return redondea(tarifario.banderazo + excedente * tarifario.por_km)
+
+
+def acomodar(volumen, peso, cap_m3, cap_ton):
+    # First-Fit Decreasing 2D en cajas iguales; devuelve el viaje de cada
+    # envío y la carga (m3, ton) de cada viaje
+    orden = np.argsort(-np.maximum(volumen / cap_m3, peso / cap_ton), kind="stable")
+    viaje = np.empty(len(volumen), dtype=np.intp)
+    carga_m3 = np.empty(len(volumen))
+    carga_ton = np.empty(len(volumen))
+    abiertos = 0
+    for i in orden:
+        cabe = (carga_m3[:abiertos] + volumen[i] <= cap_m3) & (carga_ton[:abiertos] + peso[i] <= cap_ton)
+        destino = int(np.argmax(cabe)) if abiertos and cabe.any() else abiertos
+        if destino == abiertos:
+            carga_m3[abiertos] = carga_ton[abiertos] = 0.0
+            abiertos += 1
+        carga_m3[destino] += volumen[i]
+        carga_ton[destino] += peso[i]
+        viaje[i] = destino
+    return viaje, carga_m3[:abiertos], carga_ton[:abiertos]
+
+
+def _unidad_mas_barata(carga_m3, carga_ton, tarifario, costos):
+    # Por viaje: la unidad más barata en la que cabe la carga (-1 si ninguna);
+    # costos es (viajes, clases)
+    cabe = (carga_m3[:, None] <= tarifario.capacidad_m3[None, :]) & (carga_ton[:, None] <= tarifario.capacidad_ton[None, :])
+    costo = np.where(cabe, costos, np.inf)
+    unidad = np.argmin(costo, axis=1)
+    return np.where(np.isfinite(costo.min(axis=1)), unidad, -1), costo.min(axis=1)
+
+
+def planear_zona(volumen, peso, km_viaje, tarifario):
+    # Mejor mezcla de unidades para los envíos de una zona. km_viaje recibe
+    # las posiciones de los envíos de un viaje y devuelve los km que se
+    # cobran. Devuelve (viaje de cada envío, unidad de cada viaje, costo de
+    # cada viaje, km de cada viaje)
+    mejor = None
+    for clase in np.flatnonzero(np.isfinite(tarifario.capacidad_m3) & np.isfinite(tarifario.capacidad_ton)):
+        viaje, carga_m3, carga_ton = acomodar(volumen, peso, tarifario.capacidad_m3[clase], tarifario.capacidad_ton[clase])
+        km = np.array([km_viaje(np.flatnonzero(viaje == v)) for v in range(len(carga_m3))])
+        costos = np.array([costo_unidades(tarifario, d) for d in km.tolist()]).reshape(len(km), -1)
+        unidad, costo = _unidad_mas_barata(carga_m3, carga_ton, tarifario, costos)
+        if mejor is None or costo.sum() < mejor[2].sum():
+            mejor = (viaje, unidad, costo, km)
+    return mejor
+
+
+def zonas_destino(catalogo, filas_destino, distancia, radio_km=RADIO_KM):
+    # Zona de cada destino distinto de un origen. Del más lejano al más
+    # cercano, cada destino sin zona abre una con sus vecinos sin zona a
+    # radio_km o menos.
+    m = len(filas_destino)
+    if radio_km <= 0 or m == 1:
+        return np.arange(m)
+    latitud, longitud = catalogo.latitud[filas_destino], catalogo.longitud[filas_destino]
+    vecinos, km = IndiceEspacial(latitud, longitud).vecinos(latitud, longitud, min(m, PARADAS_ZONA))
+    zona = np.full(m, -1, dtype=np.intp)
+    numero = 0
+    for i in np.argsort(-distancia, kind="stable").tolist():
+        if zona[i] >= 0:
+            continue
+        cerca = vecinos[i][km[i] <= radio_km]
+        zona[cerca[zona[cerca] < 0]] = numero
+        zona[i] = numero
+        numero += 1
+    return zona
+
+
+def planear_consolidacion(tabla, catalogo=None, tarifario=None, radio_km=RADIO_KM):
+    # tabla: envíos LTL pendientes con origen, destino (o coordenadas como en
+    # cotizar_lote), largo/ancho/alto en cm (o volumen_m3) y peso_ton (o
+    # peso_vol). Devuelve (viajes, asignacion): un DataFrame por viaje y uno
+    # por envío, alineado con la tabla de entrada. radio_km es el radio de
+    # las zonas de destino (0 = sólo carriles idénticos).
+    import pandas as pd
+
+    df = tabla_a_dataframe(tabla)
+    n = len(df)
+    catalogo = catalogo or abrir_catalogo(CSV_MUNICIPIOS)
+    tarifario = tarifario or obtener_tarifario()
+
+    volumen = volumenes_m3(df)
+    peso = columna_numerica(df, "peso_ton" if "peso_ton" in df else "peso_vol", 0.0, np.float64)
+    fila_o = filas_extremo(catalogo, df, "origen")
+    fila_d = filas_extremo(catalogo, df, "destino")
+    encontrado = (fila_o >= 0) & (fila_d >= 0)
+
+    distancia = np.full(n, np.nan)
+    distancia[encontrado] = redondea(
+        distancias_municipios(catalogo, fila_o[encontrado], fila_d[encontrado], tarifario.modo_distancia)
+    )
+    costo_ltl = np.where(encontrado, redondea(volumen * tarifario.tarifa_ltl(np.nan_to_num(distancia))), np.nan)
+    cabe = (volumen <= np.nanmax(tarifario.capacidad_m3)) & (peso <= np.nanmax(tarifario.capacidad_ton))
+
+    modalidad = np.full(n, INDIVIDUAL, dtype=object)
+    modalidad[~encontrado] = SIN_MUNICIPIO
+    modalidad[encontrado & ~cabe] = EXCEDE
+    viaje_envio = np.full(n, -1, dtype=np.int64)
+    costo_asignado = costo_ltl.copy()
+    costo_asignado[~encontrado] = np.nan
+
+    viajes = []
+    candidatos = np.flatnonzero(encontrado & cabe)
+    origenes = pd.DataFrame({"o": fila_o[candidatos]}).groupby("o", sort=False).indices
+    for o, posiciones in origenes.items():
+        en_origen = candidatos[posiciones]
+        destinos, primero, cual = np.unique(fila_d[en_origen], return_index=True, return_inverse=True)
+        zona = zonas_destino(catalogo, destinos, distancia[en_origen[primero]], radio_km)
+        for z in range(int(zona.max()) + 1):
+            filas = en_origen[zona[cual] == z]
+            _planear_viajes(catalogo, tarifario, int(o), filas, fila_d, distancia, volumen, peso, costo_ltl,
+                            viajes, viaje_envio, modalidad, costo_asignado)
+
+    columnas = ["viaje", "fila_origen", "fila_destino", "origen", "destino", "paradas", "ruta", "distancia_km",
+                "unidad", "envios", "volumen_m3", "peso_ton", "ocupacion_volumen", "ocupacion_peso", "costo",
+                "costo_ltl"]
+    asignacion = pd.DataFrame({
+        "fila_origen": fila_o,
+        "fila_destino": fila_d,
+        "distancia_km": distancia,
+        "volumen_m3": np.round(volumen, 6),
+        "modalidad": modalidad,
+        "viaje": viaje_envio,
+        "costo_ltl": costo_ltl,
+        "costo": costo_asignado,
+    }, index=df.index)
+    return pd.DataFrame(viajes, columns=columnas), asignacion
+
+
+def _planear_viajes(catalogo, tarifario, o, filas, fila_d, distancia, volumen, peso, costo_ltl,
+                    viajes, viaje_envio, modalidad, costo_asignado):
+    # Viajes de los envíos (filas) de una zona; agrega los renglones a viajes
+    # y marca la asignación de cada envío
+    rutas = {}
+
+    def ruta_viaje(envios):
+        paradas = tuple(np.unique(fila_d[envios]).tolist())
+        if paradas not in rutas:
+            if len(paradas) == 1:
+                rutas[paradas] = {"secuencia": [o, paradas[0]], "distancia_km": float(distancia[envios[0]])}
+            else:
+                rutas[paradas] = planear_ruta(catalogo, o, paradas, modo=tarifario.modo_distancia)
+        return rutas[paradas]
+
+    viaje, unidad, costo, _ = planear_zona(
+        volumen[filas], peso[filas], lambda envios: ruta_viaje(filas[envios])["distancia_km"], tarifario,
+    )
+    for v in range(len(unidad)):
+        envios = filas[viaje == v]
+        ltl = float(costo_ltl[envios].sum())
+        # Si la carga sale más barata como LTL individual, no se arma el viaje
+        if unidad[v] < 0 or ltl <= costo[v]:
+            continue
+        numero = len(viajes)
+        volumen_viaje = float(volumen[envios].sum())
+        peso_viaje = float(peso[envios].sum())
+        viaje_envio[envios] = numero
+        modalidad[envios] = CONSOLIDADO
+        # El costo del viaje se prorratea por volumen entre sus envíos
+        participacion = volumen[envios] / volumen_viaje if volumen_viaje else np.full(len(envios), 1 / len(envios))
+        costo_asignado[envios] = np.round(costo[v] * participacion, 2)
+        ruta = ruta_viaje(envios)
+        secuencia = ruta["secuencia"]
+        viajes.append({
+            "viaje": numero,
+            "fila_origen": o,
+            "fila_destino": int(secuencia[-1]),
+            "origen": catalogo.etiqueta(o),
+            "destino": catalogo.etiqueta(secuencia[-1]),
+            "paradas": len(secuencia) - 1,
+            "ruta": " -> ".join(catalogo.etiqueta(fila) for fila in secuencia[1:]),
+            "distancia_km": float(ruta["distancia_km"]),
+            "unidad": tarifario.unidades[unidad[v]],
+            "envios": len(envios),
+            "volumen_m3": round(volumen_viaje, 4),
+            "peso_ton": round(peso_viaje, 4),
+            "ocupacion_volumen": round(volumen_viaje / tarifario.capacidad_m3[unidad[v]], 4),
+            "ocupacion_peso": round(peso_viaje / tarifario.capacidad_ton[unidad[v]], 4),
+            "costo": float(costo[v]),
+            "costo_ltl": round(ltl, 2),
+        })
+
+
+def resumen(viajes, asignacion):
+    individual = float(np.nansum(asignacion["costo_ltl"]))
+    plan = float(np.nansum(asignacion["costo"]))
+    return {
+        "envios": len(asignacion),
+        "viajes": len(viajes),
+        "consolidados": int((asignacion["modalidad"] == CONSOLIDADO).sum()),
+        "costo_individual": round(individual, 2),
+        "costo_plan": round(plan, 2),
+        "ahorro": round(individual - plan, 2),
+    }
+
+
+def main(argv=None):
+    import argparse
+
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(description="Consolida los envíos LTL pendientes en viajes por origen y zona de destino")
+    parser.add_argument("entrada", help="CSV o Parquet de envíos")
+    parser.add_argument("--viajes", default="viajes.csv", help="salida con un renglón por viaje")
+    parser.add_argument("--asignacion", default=None, help="salida con el viaje de cada envío")
+    parser.add_argument("--radio", type=float, default=RADIO_KM, help="km entre destinos de una zona (0 = sólo carriles idénticos)")
+    parser.add_argument("--fuente", default=CSV_MUNICIPIOS)
+    args = parser.parse_args(argv)
+
+    if args.entrada.lower().endswith((".parquet", ".pq")):
+        df = pd.read_parquet(args.entrada)
+    else:
+        df = pd.read_csv(args.entrada)
+    inicio = time.perf_counter()
+    viajes, asignacion = planear_consolidacion(df, abrir_catalogo(args.fuente), radio_km=args.radio)
+    segundos = time.perf_counter() - inicio
+    viajes.to_csv(args.viajes, index=False)
+    if args.asignacion:
+        df.join(asignacion.drop(columns=[c for c in asignacion.columns if c in df])).to_csv(args.asignacion, index=False)
+    datos = resumen(viajes, asignacion)
+    print(
+        f"{datos['envios']:,} envíos -> {datos['viajes']:,} viajes ({datos['consolidados']:,} envíos consolidados) "
+        f"en {segundos:.2f} s; costo ${datos['costo_plan']:,.2f} vs ${datos['costo_individual']:,.2f} LTL individual"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
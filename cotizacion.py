@@ -0,0 +1,455 @@
+import numpy as np
+
+from catalogo import abrir_catalogo, CSV_MUNICIPIOS
+from distancias import distancia_municipios, distancias_municipios, version_distancias
+from tarifas import obtener_tarifario
+from cache_cotizaciones import CACHE
+from metricas import etapa
+
+# Reglas de precio de cotizar_servicio, compartidas por la forma interactiva
+# (app.py, cotizador_fletes.py) y por la cotización por lotes. Las tarifas
+# vienen del tarifario (tarifas.json).
+
+SERVICIOS = ("FTL", "LTL", "MUDANZA")
+
+
+def obtener_tarifa_por_distancia(distancia, tarifario=None):
+    return (tarifario or obtener_tarifario()).tarifa_ltl(distancia)
+
+
+def unidad_por_peso(peso_vol, tarifario=None):
+    return (tarifario or obtener_tarifario()).unidad(peso_vol)
+
+
+def detalle_ltl(volumen_m3, tarifa_m3):
+    return f"{volumen_m3:.4f} m3 x ${tarifa_m3:,.2f}/m3"
+
+
+def cotizar_ltl(volumen_m3, tarifa_m3):
+    # Precio LTL con la tarifa por m3 de la banda ya resuelta
+    return "LTL", round(volumen_m3 * tarifa_m3, 2), detalle_ltl(volumen_m3, tarifa_m3)
+
+
+def cotizar_servicio(distancia, peso_vol, servicio, maniobras=0, volumen_m3=0, tarifario=None):
+    tarifario = tarifario or obtener_tarifario()
+    if servicio == "LTL":
+        return cotizar_ltl(volumen_m3, tarifario.tarifa_ltl(distancia))
+
+    unidad = tarifario.unidad(peso_vol)
+    banderazo = tarifario.tarifas_banderazo[unidad]
+    tarifa_km = tarifario.tarifas_km[unidad]
+    km_banderazo = tarifario.km_banderazo
+
+    if distancia <= km_banderazo:
+        costo = banderazo
+        detalle = f"Banderazo para {unidad} ({distancia:.2f} km, <={km_banderazo:g} km)"
+    else:
+        costo = banderazo + (distancia - km_banderazo) * tarifa_km
+        detalle = (
+            f"${banderazo:,.2f} (banderazo hasta {km_banderazo:g} km) + "
+            f"{(distancia - km_banderazo):.2f} km x ${tarifa_km:,.2f}/km"
+        )
+    if servicio == "MUDANZA":
+        costo += maniobras
+        detalle += f" + ${maniobras:,.2f} por maniobras"
+    return unidad, round(costo, 2), detalle
+
+
+def tabla_a_dataframe(tabla):
+    import pandas as pd
+
+    if isinstance(tabla, pd.DataFrame):
+        return tabla
+    if hasattr(tabla, "to_pandas"):
+        # pyarrow.Table / RecordBatch
+        return tabla.to_pandas()
+    return pd.DataFrame(tabla)
+
+
+def columna_numerica(df, nombre, defecto, dtype):
+    if nombre in df:
+        return df[nombre].fillna(defecto).to_numpy(dtype=dtype)
+    return np.full(len(df), defecto, dtype=dtype)
+
+
+def volumenes_m3(df):
+    # Columna volumen_m3 o largo x ancho x alto (cm) / 1,000,000
+    if "volumen_m3" in df:
+        return columna_numerica(df, "volumen_m3", 0.0, np.float64)
+    return (
+        columna_numerica(df, "largo", 0.0, np.float64)
+        * columna_numerica(df, "ancho", 0.0, np.float64)
+        * columna_numerica(df, "alto", 0.0, np.float64)
+        / 1_000_000
+    )
+
+
+def resolver_filas(catalogo, etiquetas):
+    # Etiquetas "Ciudad (Estado)" (o alias de municipios.csv) a filas del
+    # catálogo; -1 si no se encuentran. Cada etiqueta distinta se busca una vez.
+    import pandas as pd
+
+    indice = catalogo.indice()
+    codigos, unicas = pd.factorize(pd.Series(etiquetas, dtype=object).fillna(""))
+    filas_unicas = np.empty(len(unicas), dtype=np.intp)
+    for i, etiqueta in enumerate(unicas):
+        fila = indice.buscar_etiqueta(str(etiqueta))
+        filas_unicas[i] = -1 if fila is None else fila
+    return filas_unicas[codigos]
+
+
+def resolver_coordenadas(catalogo, lat, lon):
+    # Coordenadas (GPS, geocodificadas) a la fila del municipio más cercano
+    # con el KD-tree del catálogo; -1 donde falte alguna coordenada
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    filas = np.full(lat.shape, -1, dtype=np.intp)
+    validas = ~(np.isnan(lat) | np.isnan(lon))
+    if validas.any():
+        filas[validas] = catalogo.espacial().mas_cercano(lat[validas], lon[validas])[0]
+    return filas
+
+
+def filas_extremo(catalogo, df, extremo):
+    # Filas de "origen" o "destino": por etiqueta y, donde no la haya, por
+    # coordenadas <extremo>_lat/<extremo>_lon
+    filas = resolver_filas(catalogo, df[extremo]) if extremo in df else np.full(len(df), -1, dtype=np.intp)
+    if f"{extremo}_lat" in df and f"{extremo}_lon" in df:
+        faltan = filas < 0
+        if faltan.any():
+            lat = columna_numerica(df, f"{extremo}_lat", np.nan, np.float64)
+            lon = columna_numerica(df, f"{extremo}_lon", np.nan, np.float64)
+            filas[faltan] = resolver_coordenadas(catalogo, lat[faltan], lon[faltan])
+    return filas
+
+
+def redondea(valores, decimales=2):
+    # np.round escala por 10**decimales y en los casi-empates puede diferir
+    # de round() de Python, que redondea el valor exacto del float; esos pocos
+    # se redondean con round() para que el lote cobre lo mismo que
+    # cotizar_servicio
+    valores = np.asarray(valores, dtype=np.float64)
+    redondeado = np.atleast_1d(np.round(valores, decimales))
+    escalado = np.atleast_1d(valores) * 10.0 ** decimales
+    dudosos = np.isfinite(escalado) & (np.abs(escalado - np.floor(escalado) - 0.5) < 1e-6)
+    if dudosos.any():
+        redondeado[dudosos] = [round(v, decimales) for v in np.atleast_1d(valores)[dudosos].tolist()]
+    return redondeado.reshape(valores.shape)
+
+
+def precios_lote(distancia, servicio, peso_vol, maniobras, volumen_m3, tarifario=None):
+    # Núcleo vectorizado de cotizar_servicio: recibe arreglos y devuelve
+    # (índice de unidad, costo, tarifa aplicada); índice -1 significa LTL.
+    # Un servicio fuera de SERVICIOS, o FTL/MUDANZA con peso NaN, no tiene
+    # precio: costo NaN.
+    tarifario = tarifario or obtener_tarifario()
+    distancia = np.asarray(distancia, dtype=np.float64)
+    servicio = np.asarray(servicio, dtype=object)
+    es_ltl = servicio == "LTL"
+    es_mudanza = servicio == "MUDANZA"
+
+    peso_vol = np.asarray(peso_vol, dtype=np.float64)
+    idx_unidad = tarifario.indice_unidad(peso_vol)
+    por_km = tarifario.por_km[idx_unidad]
+    costo_unidad = tarifario.banderazo[idx_unidad] + np.maximum(distancia - tarifario.km_banderazo, 0.0) * por_km
+    costo_unidad = np.where(es_mudanza, costo_unidad + maniobras, costo_unidad)
+
+    tarifa_m3 = tarifario.tarifa_ltl(distancia)
+    costo_ltl = redondea(volumen_m3 * tarifa_m3)
+
+    costo = redondea(np.where(es_ltl, costo_ltl, costo_unidad))
+    con_precio = es_ltl | ((es_mudanza | (servicio == "FTL")) & ~np.isnan(peso_vol))
+    costo = np.where(con_precio, costo, np.nan)
+    tarifa = np.where(es_ltl, tarifa_m3, por_km)
+    return np.where(es_ltl, -1, idx_unidad), costo, tarifa
+
+
+def _detalles(idx_unidad, distancia, servicio, maniobras, volumen_m3, tarifa, tarifario):
+    km_banderazo = tarifario.km_banderazo
+    detalles = []
+    for i, d, s, m, v, t in zip(
+        idx_unidad.tolist(), distancia.tolist(), servicio.tolist(),
+        maniobras.tolist(), volumen_m3.tolist(), tarifa.tolist(),
+    ):
+        if i < 0:
+            detalles.append(detalle_ltl(v, t))
+            continue
+        unidad = tarifario.unidades[i]
+        if d <= km_banderazo:
+            detalle = f"Banderazo para {unidad} ({d:.2f} km, <={km_banderazo:g} km)"
+        else:
+            detalle = (
+                f"${tarifario.tarifas_banderazo[unidad]:,.2f} (banderazo hasta {km_banderazo:g} km) + "
+                f"{(d - km_banderazo):.2f} km x ${t:,.2f}/km"
+            )
+        if s == "MUDANZA":
+            detalle += f" + ${m:,.2f} por maniobras"
+        detalles.append(detalle)
+    return detalles
+
+
+def clave_cotizacion(fila_o, fila_d, servicio, peso_vol=0, maniobras=0, tarifario=None):
+    # Llave del caché: sólo lo que cambia el precio del carril. El LTL no
+    # lleva volumen: se guarda la distancia y la tarifa por m3 de su banda, y
+    # el costo se calcula con el volumen de cada consulta.
+    if servicio == "LTL":
+        return (fila_o, fila_d, servicio, -1, 0.0)
+    clase = (tarifario or obtener_tarifario()).indice_unidad(peso_vol)
+    return (fila_o, fila_d, servicio, clase, float(maniobras) if servicio == "MUDANZA" else 0.0)
+
+
+def cotizar_ruta(catalogo, fila_o, fila_d, servicio, peso_vol=0, maniobras=0, volumen_m3=0,
+                 tarifario=None, cache=CACHE):
+    # Distancia (redondeada a 2 decimales, como en la forma) y cotizar_servicio
+    # para un carril del catálogo. Devuelve (distancia, unidad, costo, detalle).
+    tarifario = tarifario or obtener_tarifario()
+
+    modo = tarifario.modo_distancia
+
+    def calcular():
+        # Sólo en los fallos del caché; los aciertos no calculan distancia
+        with etapa("distancia"):
+            distancia = round(distancia_municipios(catalogo, fila_o, fila_d, modo), 2)
+        if servicio == "LTL":
+            return distancia, tarifario.tarifa_ltl(distancia)
+        return (distancia,) + cotizar_servicio(distancia, peso_vol, servicio, maniobras, volumen_m3, tarifario)
+
+    if cache is None:
+        valor = calcular()
+    else:
+        clave = clave_cotizacion(fila_o, fila_d, servicio, peso_vol, maniobras, tarifario)
+        valor = cache.obtener(clave, versiones_cotizacion(catalogo, tarifario), calcular)
+    if servicio == "LTL":
+        distancia, tarifa_m3 = valor
+        return (distancia,) + cotizar_ltl(volumen_m3, tarifa_m3)
+    return valor
+
+
+def versiones_cotizacion(catalogo, tarifario):
+    # Todo lo que invalida una cotización guardada en caché
+    return (catalogo.version, tarifario.version, version_distancias(catalogo, tarifario.modo_distancia))
+
+
+def _cotiza_filas(catalogo, tarifario, fila_o, fila_d, distancia, servicio, peso_vol, maniobras,
+                  volumen_m3, con_detalle):
+    # Distancia y precio vectorizados para un subconjunto de filas del lote.
+    # distancia=None significa tomarla de la matriz (del modo del tarifario).
+    if distancia is None:
+        encontrado = (fila_o >= 0) & (fila_d >= 0)
+        distancia = np.full(len(fila_o), np.nan)
+        distancia[encontrado] = distancias_municipios(
+            catalogo, fila_o[encontrado], fila_d[encontrado], tarifario.modo_distancia
+        )
+    else:
+        encontrado = ~np.isnan(distancia)
+    # Igual que la forma interactiva: la distancia se redondea antes de tarificar
+    distancia = redondea(distancia)
+
+    idx_unidad, costo, tarifa = precios_lote(
+        np.where(encontrado, distancia, 0.0), servicio, peso_vol, maniobras, volumen_m3, tarifario
+    )
+    etiquetas_unidad = np.array(tarifario.unidades + ("LTL",), dtype=object)
+    unidad = np.where(encontrado, etiquetas_unidad[idx_unidad], None)
+    costo = np.where(encontrado, costo, np.nan)
+    detalle = None
+    if con_detalle:
+        detalle = np.array(
+            _detalles(idx_unidad, distancia, servicio, maniobras, volumen_m3, tarifa, tarifario), dtype=object
+        )
+        detalle = np.where(encontrado, detalle, None)
+    return encontrado, distancia, unidad, costo, detalle, tarifa
+
+
+def _codigos_compuestos(columnas):
+    # Código entero por combinación distinta de valores, columna por columna
+    # (evita armar tuplas por fila)
+    import pandas as pd
+
+    codigos = np.zeros(len(columnas[0]), dtype=np.int64)
+    for columna in columnas:
+        codigos_col, unicos = pd.factorize(columna)
+        codigos = pd.factorize(codigos * len(unicos) + codigos_col)[0]
+    return codigos
+
+
+def cotizar_lote(tabla, catalogo=None, con_detalle=True, tarifario=None, cache=CACHE):
+    # Cotiza muchos envíos en una sola llamada con las reglas de cotizar_servicio.
+    #
+    # tabla: DataFrame, tabla de Arrow o dict de columnas con origen, destino,
+    # servicio, peso_vol (ton), largo/ancho/alto (cm) y maniobras ($). Si trae
+    # "volumen_m3" o "distancia" se usan en lugar de calcularlos. En vez de
+    # etiqueta, origen/destino pueden venir como coordenadas (origen_lat,
+    # origen_lon, destino_lat, destino_lon): se toma el municipio más cercano.
+    # Devuelve un DataFrame con fila_origen, fila_destino, distancia_km,
+    # unidad, costo, detalle y error. Las filas con municipios no encontrados
+    # o con un servicio fuera de SERVICIOS quedan sin unidad, costo ni
+    # detalle, y error dice por qué (None en las filas cotizadas).
+    #
+    # Cada llave distinta (carril, servicio, clase, maniobras) se cotiza una
+    # sola vez y se comparte con el caché LRU del proceso; pasa cache=None
+    # para desactivarlo. Del LTL se comparten la distancia y la tarifa por m3,
+    # y el costo se calcula con el volumen de cada envío.
+    import pandas as pd
+
+    df = tabla_a_dataframe(tabla)
+    n = len(df)
+    catalogo = catalogo or abrir_catalogo(CSV_MUNICIPIOS)
+    tarifario = tarifario or obtener_tarifario()
+
+    servicio = df["servicio"].fillna("").astype(str).str.upper().to_numpy(dtype=object)
+    peso_vol = columna_numerica(df, "peso_vol", 0.0, np.float64)
+    maniobras = columna_numerica(df, "maniobras", 0.0, np.float64)
+    volumen_m3 = volumenes_m3(df)
+
+    fila_o = filas_extremo(catalogo, df, "origen")
+    fila_d = filas_extremo(catalogo, df, "destino")
+    distancia_dada = columna_numerica(df, "distancia", np.nan, np.float64) if "distancia" in df else None
+
+    if cache is None or distancia_dada is not None:
+        _, distancia, unidad, costo, detalle, _ = _cotiza_filas(
+            catalogo, tarifario, fila_o, fila_d, distancia_dada, servicio, peso_vol, maniobras,
+            volumen_m3, con_detalle,
+        )
+    else:
+        es_ltl = servicio == "LTL"
+        clase = np.where(es_ltl, -1, tarifario.indice_unidad(peso_vol))
+        extra = np.where(servicio == "MUDANZA", maniobras, 0.0)
+        columnas = (fila_o, fila_d, servicio, clase, extra)
+        codigos = _codigos_compuestos(columnas)
+        primero = np.unique(codigos, return_index=True)[1]
+        claves = list(zip(*(np.asarray(col)[primero].tolist() for col in columnas)))
+        versiones = versiones_cotizacion(catalogo, tarifario)
+        # Un lote con más llaves distintas que el caché sólo lo desalojaría:
+        # entonces basta con la deduplicación dentro del lote
+        usa_cache = len(claves) <= cache.capacidad
+
+        k = len(claves)
+        distancia_u = np.full(k, np.nan)
+        unidad_u = np.full(k, None, dtype=object)
+        costo_u = np.full(k, np.nan)
+        detalle_u = np.full(k, None, dtype=object)
+        tarifa_u = np.full(k, np.nan)
+        faltan = []
+        for j, clave in enumerate(claves):
+            if not usa_cache or clave[0] < 0 or clave[1] < 0:
+                faltan.append(j)
+                continue
+            valor = cache.buscar(clave, versiones)
+            if valor is None or (con_detalle and clave[2] != "LTL" and valor[3] is None):
+                faltan.append(j)
+                continue
+            if clave[2] == "LTL":
+                distancia_u[j], tarifa_u[j] = valor
+                unidad_u[j] = "LTL"
+            else:
+                distancia_u[j], unidad_u[j], costo_u[j], detalle_u[j] = valor
+
+        if faltan:
+            faltan = np.asarray(faltan, dtype=np.intp)
+            filas = primero[faltan]
+            encontrado, distancia, unidad, costo, detalle, tarifa = _cotiza_filas(
+                catalogo, tarifario, fila_o[filas], fila_d[filas], None, servicio[filas], peso_vol[filas],
+                maniobras[filas], volumen_m3[filas], con_detalle,
+            )
+            distancia_u[faltan], unidad_u[faltan], costo_u[faltan] = distancia, unidad, costo
+            tarifa_u[faltan] = np.where(encontrado, tarifa, np.nan)
+            if detalle is not None:
+                detalle_u[faltan] = detalle
+            if usa_cache:
+                for j, ok, d, u, c, det, t in zip(
+                    faltan.tolist(), encontrado.tolist(), distancia.tolist(), unidad.tolist(), costo.tolist(),
+                    detalle.tolist() if detalle is not None else [None] * len(faltan), tarifa.tolist(),
+                ):
+                    if ok:
+                        cache.guardar(claves[j], (d, t) if claves[j][2] == "LTL" else (d, u, c, det), versiones)
+
+        distancia, unidad, costo = distancia_u[codigos], unidad_u[codigos], costo_u[codigos]
+        detalle = detalle_u[codigos] if con_detalle else None
+        # Los envíos LTL de un carril comparten distancia y tarifa; el costo
+        # y el detalle van con el volumen de cada uno
+        ltl = np.flatnonzero(es_ltl & ~np.isnan(tarifa_u[codigos]))
+        if len(ltl):
+            tarifa_m3 = tarifa_u[codigos[ltl]]
+            costo[ltl] = redondea(volumen_m3[ltl] * tarifa_m3)
+            if con_detalle:
+                detalle[ltl] = [detalle_ltl(v, t) for v, t in zip(volumen_m3[ltl].tolist(), tarifa_m3.tolist())]
+
+    error = np.full(n, None, dtype=object)
+    if distancia_dada is None:
+        error[(fila_o < 0) | (fila_d < 0)] = "Municipio no encontrado"
+    else:
+        error[np.isnan(distancia_dada)] = "Sin distancia"
+    desconocido = ~np.isin(servicio, SERVICIOS)
+    if desconocido.any():
+        error[desconocido] = [f"Servicio desconocido: {s!r}" for s in servicio[desconocido].tolist()]
+        unidad = np.where(desconocido, None, unidad)
+        costo = np.where(desconocido, np.nan, costo)
+        if con_detalle:
+            detalle = np.where(desconocido, None, detalle)
+
+    resultado = pd.DataFrame({
+        "fila_origen": fila_o,
+        "fila_destino": fila_d,
+        "distancia_km": distancia,
+        "unidad": unidad,
+        "costo": costo,
+    }, index=df.index)
+    if con_detalle:
+        resultado["detalle"] = detalle
+    resultado["error"] = error
+    return resultado
+
+
+def _fila_envio(catalogo, envio, extremo):
+    # Etiqueta del municipio o, si no viene, coordenadas <extremo>_lat/_lon
+    if envio.get(extremo) is not None:
+        fila = catalogo.indice().buscar_etiqueta(str(envio[extremo]))
+        if fila is None:
+            raise KeyError(f"No se encontró el municipio {envio[extremo]!r} en el catálogo")
+        return fila
+    try:
+        lat, lon = float(envio[f"{extremo}_lat"]), float(envio[f"{extremo}_lon"])
+    except KeyError:
+        raise ValueError(f"Falta {extremo} (etiqueta, o {extremo}_lat y {extremo}_lon)")
+    if not (np.isfinite(lat) and np.isfinite(lon)):
+        raise ValueError(f"Coordenadas inválidas para {extremo}: {lat}, {lon}")
+    # -1 = sin municipio cercano, como en resolver_coordenadas
+    fila = int(catalogo.espacial().mas_cercano(lat, lon)[0])
+    if fila < 0:
+        raise KeyError(f"No hay municipio cercano a {lat}, {lon}")
+    return fila
+
+
+def cotizar_envio(envio, catalogo=None, tarifario=None):
+    # Cotización de un solo envío descrito como dict (mismas llaves que las
+    # columnas de cotizar_lote); para servicios que no pasan por Streamlit
+    catalogo = catalogo or abrir_catalogo(CSV_MUNICIPIOS)
+    servicio = str(envio.get("servicio", "")).upper()
+    if servicio not in SERVICIOS:
+        raise ValueError(f"Servicio desconocido: {envio.get('servicio')!r} (usa uno de {SERVICIOS})")
+    fila_o = _fila_envio(catalogo, envio, "origen")
+    fila_d = _fila_envio(catalogo, envio, "destino")
+
+    if envio.get("volumen_m3") is not None:
+        volumen_m3 = float(envio["volumen_m3"])
+    else:
+        volumen_m3 = float(envio.get("largo", 0)) * float(envio.get("ancho", 0)) * float(envio.get("alto", 0)) / 1_000_000
+    peso_vol = float(envio.get("peso_vol") or 0)
+    maniobras = float(envio.get("maniobras") or 0)
+    if envio.get("distancia") is not None:
+        distancia = round(float(envio["distancia"]), 2)
+        unidad, costo, detalle = cotizar_servicio(distancia, peso_vol, servicio, maniobras, volumen_m3, tarifario)
+    else:
+        distancia, unidad, costo, detalle = cotizar_ruta(
+            catalogo, fila_o, fila_d, servicio, peso_vol, maniobras, volumen_m3, tarifario
+        )
+    return {
+        "origen": catalogo.etiqueta(fila_o),
+        "destino": catalogo.etiqueta(fila_d),
+        "fila_origen": fila_o,
+        "fila_destino": fila_d,
+        "distancia_km": distancia,
+        "unidad": unidad,
+        "costo": costo,
+        "detalle": detalle,
+    }
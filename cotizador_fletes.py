@@ -1,104 +1,91 @@
 import pandas as pd
 import streamlit as st
 from datetime import datetime
-from geopy.distance import geodesic
-import unicodedata
-import io
-from fpdf import FPDF
-import tempfile
-import os
+from artefactos import Artefactos
+from catalogo import abrir_catalogo
+from cotizacion import cotizar_ruta
+from exportacion import exportar_bytes, TIPOS_MIME
+from historial import HistorialSesion
+from metricas import etapa, medido, solicitud
+from pdf_cotizaciones import PLANTILLA_FLETES_DETALLE
 
 CSV_FILENAME = "municipios_mexico.csv"  # Cambia si tu archivo tiene otro nombre
+TAM_PAGINA = 50
+# Cada cuántos segundos se vuelve a correr una descarga para ver si su archivo ya está
+INTERVALO_DESCARGAS = 1.0
 
-def normaliza(texto):
-    if pd.isna(texto):
-        return ""
-    return ''.join(
-        c for c in unicodedata.normalize('NFKD', str(texto))
-        if not unicodedata.combining(c)
-    ).lower().strip()
-
-@st.cache_data
+@st.cache_resource
+@medido("carga_catalogo")
 def load_municipios(filename):
-    df = pd.read_csv(filename, encoding="utf-8", dtype=str)
-    df['Longitud'] = df['Longitud'].astype(float)
-    df['Latitud'] = df['Latitud'].astype(float)
-    return df
-
-def calcular_distancia(lat1, lon1, lat2, lon2):
-    return round(geodesic((lat1, lon1), (lat2, lon2)).km, 2)
-
-def obtener_tarifa_por_distancia(distancia):
-    if distancia <= 400:
-        return 2000
-    elif distancia <= 900:
-        return 3500
-    elif distancia <= 1300:
-        return 5900
-    elif distancia <= 1700:
-        return 7800
-    elif distancia <= 1999:
-        return 8999
-    else:
-        return 10500
-
-def cotizar_servicio(distancia, peso_vol, servicio, maniobras=0, volumen_m3=0):
-    if servicio == "LTL":
-        tarifa_m3 = obtener_tarifa_por_distancia(distancia)
-        costo = round(volumen_m3 * tarifa_m3, 2)
-        detalle = f"{volumen_m3:.4f} m3 x ${tarifa_m3:,.2f}/m3"
-        unidad = "LTL"
-    else:
-        if peso_vol <= 1:
-            unidad = "1 Ton"
-        elif peso_vol <= 3:
-            unidad = "3 Ton"
-        elif peso_vol <= 5:
-            unidad = "5 Ton"
-        else:
-            unidad = "10 Ton"
+    # Catálogo compilado y abierto con mmap; se comparte entre sesiones sin copiarlo
+    return abrir_catalogo(filename).a_dataframe()
 
-        tarifas_banderazo = {"1 Ton": 2500, "3 Ton": 3000, "5 Ton": 3500, "10 Ton": 4000}
-        tarifas_km = {"1 Ton": 13, "3 Ton": 15, "5 Ton": 19, "10 Ton": 23}
+@medido("pdf")
+def generar_pdf(cotizacion):
+    # PDF en memoria con la plantilla precompilada, sin archivo temporal
+    return PLANTILLA_FLETES_DETALLE.renderizar(cotizacion)
+
+def excel_cotizacion(cotizacion):
+    with etapa("excel"):
+        return exportar_bytes([cotizacion], "xlsx", list(cotizacion))
+
+def excel_historial(historial, n, formato):
+    # Las primeras n cotizaciones: las que había cuando se pidió el archivo
+    with etapa("excel_historial"):
+        return exportar_bytes(historial.iterar(0, n), formato, list(historial.columnas))
+
+def artefactos_sesion():
+    if "artefactos" not in st.session_state:
+        st.session_state["artefactos"] = Artefactos()
+    return st.session_state["artefactos"]
+
+@st.fragment(run_every=INTERVALO_DESCARGAS)
+def descarga(clave, nombre, construir, argumentos, etiqueta, archivo, mime):
+    # El botón sólo encarga el archivo al grupo de hilos y el script sigue;
+    # el fragmento se vuelve a correr solo y muestra la descarga en cuanto
+    # artefactos.listo(clave) tiene los bytes
+    artefactos = artefactos_sesion()
+    llave = "_".join(str(parte) for parte in clave)
+    datos = artefactos.listo(clave)
+    if datos is not None:
+        st.download_button(label=etiqueta, data=datos, file_name=archivo, mime=mime, key=f"descargar_{llave}")
+    elif artefactos.en_curso(clave):
+        st.caption(f"Generando {nombre}...")
+    elif st.button(f"Preparar {nombre}", key=f"preparar_{llave}"):
+        artefactos.pedir(clave, construir, *argumentos)
+        st.caption(f"Generando {nombre}...")
+
+def mostrar_cotizacion(id_cotizacion, cotizacion):
+    st.success(
+        f"""**Cotización**
+- Cliente: {cotizacion['Cliente']}
+- Servicio: {cotizacion['Servicio']}
+- Origen: {cotizacion['Origen']}
+- Destino: {cotizacion['Destino']}
+- Distancia: {cotizacion['Distancia (km)']:.2f} km
+- Tipo de unidad: {cotizacion['Tipo de unidad']}
+- Peso/Volumen: {cotizacion['Peso/Vol (Ton)']}
+- Volumen (m3): {cotizacion['Volumen (m3)']}
+- Costo total: ${cotizacion['Costo Total MXN']:,.2f}
+- Detalle: {cotizacion['Detalle']}
+- Observaciones: {cotizacion['Observaciones']}
+- Fecha de servicio: {cotizacion['Fecha de servicio']}
+"""
+    )
+    st.dataframe(pd.DataFrame([cotizacion]))
 
-        if distancia <= 50:
-            costo = tarifas_banderazo[unidad]
-            detalle = f"Banderazo para {unidad} ({distancia:.2f} km, <=50 km)"
-        else:
-            costo = tarifas_banderazo[unidad] + (distancia - 50) * tarifas_km[unidad]
-            detalle = (
-                f"${tarifas_banderazo[unidad]:,.2f} (banderazo hasta 50 km) + "
-                f"{(distancia - 50):.2f} km x ${tarifas_km[unidad]:,.2f}/km"
+    # PDF y Excel sólo cuando se piden; se generan en un hilo aparte y quedan
+    # memorizados por cotización para los reruns siguientes (artefactos.py)
+    descargas = (
+        ("pdf", "PDF", generar_pdf, f"cotizacion_{cotizacion['Cliente'].replace(' ', '_')}.pdf", "application/pdf"),
+        ("xlsx", "Excel", excel_cotizacion, "cotizacion.xlsx", TIPOS_MIME["xlsx"]),
+    )
+    for columna, (tipo, nombre, construir, archivo, mime) in zip(st.columns(2), descargas):
+        with columna:
+            descarga(
+                (id_cotizacion, tipo), nombre, construir, (cotizacion,),
+                f"Descargar cotización en {nombre}", archivo, mime,
             )
-        if servicio == "MUDANZA":
-            costo += maniobras
-            detalle += f" + ${maniobras:,.2f} por maniobras"
-    return unidad, round(costo, 2), detalle
-
-def generar_pdf(cotizacion):
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_font("Arial", size=12)
-    pdf.cell(200, 10, txt="Cotización de Transporte", ln=True, align="C")
-    pdf.ln(10)
-    pdf.cell(200, 10, txt=f"Fecha de cotización: {cotizacion['Fecha cotización']}", ln=True)
-    pdf.cell(200, 10, txt=f"Cliente: {cotizacion['Cliente']}", ln=True)
-    pdf.cell(200, 10, txt=f"Servicio: {cotizacion['Servicio']}", ln=True)
-    pdf.cell(200, 10, txt=f"Origen: {cotizacion['Origen']}", ln=True)
-    pdf.cell(200, 10, txt=f"Destino: {cotizacion['Destino']}", ln=True)
-    pdf.cell(200, 10, txt=f"Distancia: {cotizacion['Distancia (km)']} km", ln=True)
-    pdf.cell(200, 10, txt=f"Tipo de unidad: {cotizacion['Tipo de unidad']}", ln=True)
-    pdf.cell(200, 10, txt=f"Peso/Volumen: {cotizacion['Peso/Vol (Ton)']}", ln=True)
-    if cotizacion['Volumen (m3)']:
-        pdf.cell(200, 10, txt=f"Volumen (m3): {cotizacion['Volumen (m3)']}", ln=True)
-    pdf.cell(200, 10, txt=f"Costo total: ${cotizacion['Costo Total MXN']:,.2f}", ln=True)
-    pdf.multi_cell(200, 10, txt=f"Detalle: {cotizacion['Detalle']}")
-    pdf.multi_cell(200, 10, txt=f"Observaciones: {cotizacion['Observaciones']}")
-    pdf.cell(200, 10, txt=f"Fecha de servicio: {cotizacion['Fecha de servicio']}", ln=True)
-    # Guardar en archivo temporal para descargar
-    tmpfile = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf")
-    pdf.output(tmpfile.name)
-    return tmpfile.name
 
 def main():
     st.set_page_config(page_title="Cotizador de Fletes", layout="centered")
@@ -136,36 +123,39 @@ def main():
         fecha_servicio = st.date_input("Fecha de servicio", value=datetime.today())
         submitted = st.form_submit_button("Cotizar")
 
-    historial = st.session_state.get("historial", [])
+    # Historial en columnas (historial.py); la tabla sólo arma la página visible
+    historial = st.session_state.get("historial")
 
     if submitted:
+        st.session_state.pop("ultima_cotizacion", None)
         if origen == destino:
             st.error("El municipio de origen y destino deben ser diferentes.")
         else:
-            ciudad_o, estado_o = origen.rsplit(" (", 1)
-            ciudad_d, estado_d = destino.rsplit(" (", 1)
-            ciudad_o = normaliza(ciudad_o)
-            estado_o = normaliza(estado_o.replace(")", ""))
-            ciudad_d = normaliza(ciudad_d)
-            estado_d = normaliza(estado_d.replace(")", ""))
-
-            row_o = df[(df['Ciudad'].apply(normaliza)==ciudad_o) & (df['Estado'].apply(normaliza)==estado_o)]
-            row_d = df[(df['Ciudad'].apply(normaliza)==ciudad_d) & (df['Estado'].apply(normaliza)==estado_d)]
+            # Búsqueda O(1) en el índice del catálogo (llave normalizada o etiqueta)
+            with etapa("busqueda"):
+                catalogo = abrir_catalogo(CSV_FILENAME)
+                indice = catalogo.indice()
+                fila_o = indice.buscar_etiqueta(origen)
+                fila_d = indice.buscar_etiqueta(destino)
+                row_o = df.loc[[fila_o]] if fila_o in df.index else df.iloc[:0]
+                row_d = df.loc[[fila_d]] if fila_d in df.index else df.iloc[:0]
 
             if row_o.empty or row_d.empty:
                 st.error("No se encontró alguno de los municipios en la base de datos.")
             else:
                 lat1, lon1 = row_o.iloc[0][['Latitud', 'Longitud']]
                 lat2, lon2 = row_d.iloc[0][['Latitud', 'Longitud']]
-                distancia = calcular_distancia(float(lat1), float(lon1), float(lat2), float(lon2))
-
-                unidad, costo, detalle = cotizar_servicio(
-                    distancia,
-                    peso_vol if peso_vol else 0,
-                    servicio,
-                    maniobras,
-                    volumen_m3 if volumen_m3 else 0
-                )
+                # Distancia de la matriz y precio, con caché LRU por carril
+                with etapa("cotizacion"):
+                    distancia, unidad, costo, detalle = cotizar_ruta(
+                        catalogo,
+                        fila_o,
+                        fila_d,
+                        servicio,
+                        peso_vol if peso_vol else 0,
+                        maniobras,
+                        volumen_m3 if volumen_m3 else 0
+                    )
 
                 cotizacion = {
                     "Fecha cotización": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
@@ -183,63 +173,29 @@ def main():
                     "Fecha de servicio": fecha_servicio.strftime("%Y-%m-%d"),
                 }
                 if "historial" not in st.session_state:
-                    st.session_state["historial"] = []
-                st.session_state["historial"].append(cotizacion)
+                    st.session_state["historial"] = HistorialSesion()
+                id_cotizacion = st.session_state["historial"].agregar(cotizacion)
+                st.session_state["ultima_cotizacion"] = (id_cotizacion, cotizacion)
                 historial = st.session_state["historial"]
 
-                st.success(
-                    f"""**Cotización**
-- Cliente: {cotizacion['Cliente']}
-- Servicio: {cotizacion['Servicio']}
-- Origen: {cotizacion['Origen']}
-- Destino: {cotizacion['Destino']}
-- Distancia: {cotizacion['Distancia (km)']:.2f} km
-- Tipo de unidad: {cotizacion['Tipo de unidad']}
-- Peso/Volumen: {cotizacion['Peso/Vol (Ton)']}
-- Volumen (m3): {cotizacion['Volumen (m3)']}
-- Costo total: ${cotizacion['Costo Total MXN']:,.2f}
-- Detalle: {cotizacion['Detalle']}
-- Observaciones: {cotizacion['Observaciones']}
-- Fecha de servicio: {cotizacion['Fecha de servicio']}
-"""
-                )
-
-                cotizacion_df = pd.DataFrame([cotizacion])
-                st.dataframe(cotizacion_df)
-
-                # Botón para descargar PDF de la cotización individual
-                pdf_path = generar_pdf(cotizacion)
-                with open(pdf_path, "rb") as f:
-                    st.download_button(
-                        label="Descargar cotización en PDF",
-                        data=f,
-                        file_name=f"cotizacion_{cotizacion['Cliente'].replace(' ', '_')}.pdf",
-                        mime="application/pdf"
-                    )
-                os.remove(pdf_path)
-
-                # Botón para bajar el Excel de la cotización individual
-                output = io.BytesIO()
-                cotizacion_df.to_excel(output, index=False, engine='openpyxl')
-                st.download_button(
-                    label="Descargar cotización en Excel",
-                    data=output.getvalue(),
-                    file_name="cotizacion.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                )
+    ultima = st.session_state.get("ultima_cotizacion")
+    if ultima is not None:
+        mostrar_cotizacion(*ultima)
 
     st.markdown("---")
     st.subheader("Historial de cotizaciones (de esta sesión)")
     if historial:
-        df_hist = pd.DataFrame(historial)
-        st.dataframe(df_hist)
-        output_hist = io.BytesIO()
-        df_hist.to_excel(output_hist, index=False, engine='openpyxl')
-        st.download_button(
-            label="Descargar historial en Excel",
-            data=output_hist.getvalue(),
-            file_name="historial_cotizaciones.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        paginas = historial.paginas(TAM_PAGINA)
+        pagina = st.number_input("Página", min_value=1, max_value=paginas, value=1, step=1) if paginas > 1 else 1
+        st.dataframe(historial.pagina(pagina, TAM_PAGINA))
+        st.caption(f"{len(historial)} cotizaciones, las más recientes primero")
+        # El archivo del historial se genera sólo cuando se pide, no en cada
+        # rerun, y se reutiliza mientras no haya cotizaciones nuevas
+        formato = st.radio("Formato del historial", ["xlsx", "csv", "parquet"], horizontal=True)
+        descarga(
+            ("historial", len(historial), formato), "historial", excel_historial,
+            (historial, len(historial), formato), f"Descargar historial ({formato})",
+            f"historial_cotizaciones.{formato}", TIPOS_MIME[formato],
         )
     else:
         st.info("Aún no hay cotizaciones en esta sesión.")
@@ -254,5 +210,7 @@ def main():
         unsafe_allow_html=True
     )
 
+# Cada rerun de Streamlit es una solicitud en la traza de métricas
 if __name__ == "__main__":
-    main()
+    with solicitud("rerun"):
+        main()
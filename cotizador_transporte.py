@@ -1,72 +1,78 @@
 import streamlit as st
 import pandas as pd
-import numpy as np
-from fpdf import FPDF
 from datetime import datetime
 import os
-from geopy.distance import geodesic
-
-# Leer el archivo de municipios con codificación correcta
-df_municipios = pd.read_csv("municipios.csv", encoding="utf-8")  # <- aquí se corrige el problema de caracteres
+from catalogo import abrir_catalogo
+from distancias import distancia_municipios
+from tarifas import obtener_tarifario
+from cache_cotizaciones import CACHE
+from cotizacion import versiones_cotizacion
+from bitacora import exportar_excel, guardar_cotizacion
+from metricas import etapa, medido, solicitud
+from pdf_cotizaciones import PLANTILLA_SIMPLE
+
+# Catálogo compilado (mmap); se abre en el primer uso, no al importar
+_catalogo = None
+
+def catalogo_transporte():
+    global _catalogo
+    if _catalogo is None:
+        with etapa("carga_catalogo"):
+            _catalogo = abrir_catalogo()
+    return _catalogo
+
+# "municipio" conserva las etiquetas de municipios.csv
+def municipios_transporte():
+    catalogo = catalogo_transporte()
+    return pd.DataFrame({
+        "municipio": catalogo.columna("alias"),
+        "latitud": catalogo.latitud,
+        "longitud": catalogo.longitud,
+    }, copy=False)
 
 # ===================== FUNCIONES ==========================
 
 # Calcular distancia entre dos municipios usando latitud y longitud
+@medido("distancia")
 def obtener_distancia(origen, destino):
-    lat1, lon1 = df_municipios.loc[df_municipios['municipio'] == origen, ['latitud', 'longitud']].values[0]
-    lat2, lon2 = df_municipios.loc[df_municipios['municipio'] == destino, ['latitud', 'longitud']].values[0]
-    return geodesic((lat1, lon1), (lat2, lon2)).km
-
-# Calcular tarifa por distancia
-rangos_precio = [
-    (0, 400, 2000),
-    (401, 900, 3500),
-    (901, 1300, 5900),
-    (1301, 1700, 7800),
-    (1701, 1999, 8999),
-    (2000, float('inf'), 10500)
-]
-
+    catalogo = catalogo_transporte()
+    with etapa("busqueda"):
+        indice = catalogo.indice()
+        fila_o = indice.buscar_etiqueta(origen)
+        fila_d = indice.buscar_etiqueta(destino)
+    return distancia_municipios(catalogo, fila_o, fila_d, obtener_tarifario().modo_distancia)
+
+# Calcular tarifa por distancia (bandas del tarifario, sin huecos entre límites)
 def obtener_tarifa_por_mt3(distancia):
-    for r in rangos_precio:
-        if r[0] <= distancia <= r[1]:
-            return r[2]
-
-# Generar PDF con nombre del cliente y fecha
-def generar_pdf(cotizacion):
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_font("Arial", size=12)
+    return obtener_tarifario().tarifa_ltl(distancia)
+
+# Distancia y tarifa del carril; se guardan en el caché LRU del proceso y el
+# costo se calcula con el volumen de cada consulta
+@medido("cotizacion")
+def cotizar_flete(origen, destino, tipo_flete, volumen_mt3):
+    catalogo = catalogo_transporte()
+    indice = catalogo.indice()
+    tarifario = obtener_tarifario()
+    clave = ("transporte", indice.buscar_etiqueta(origen), indice.buscar_etiqueta(destino))
+
+    def calcular():
+        distancia_km = obtener_distancia(origen, destino)
+        return distancia_km, obtener_tarifa_por_mt3(distancia_km)
 
-    for clave, valor in cotizacion.items():
-        pdf.cell(200, 10, txt=f"{clave}: {valor}", ln=True)
+    distancia_km, tarifa_mt3 = CACHE.obtener(clave, versiones_cotizacion(catalogo, tarifario), calcular)
+    if tipo_flete == "FTL (Completo)":
+        costo_total = tarifa_mt3
+    else:
+        costo_total = volumen_mt3 * tarifa_mt3
+    return distancia_km, tarifa_mt3, costo_total
 
+# Generar PDF en memoria con nombre del cliente y fecha
+@medido("pdf")
+def generar_pdf(cotizacion):
     nombre_cliente = cotizacion.get("Cliente", "cliente_desconocido").replace(" ", "_")
     fecha = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
     nombre_archivo = f"cotizacion_{nombre_cliente}_{fecha}.pdf"
-
-    ruta_pdf = os.path.join("PDF_Cotizaciones", nombre_archivo)
-    os.makedirs("PDF_Cotizaciones", exist_ok=True)
-
-    pdf.output(ruta_pdf)
-    return ruta_pdf
-
-# Guardar cotización en Excel por día
-def guardar_en_excel(cotizacion):
-    fecha_hoy = datetime.now().strftime("%Y-%m-%d")
-    nombre_archivo = f"BaseCotizaciones/cotizaciones_{fecha_hoy}.xlsx"
-    os.makedirs("BaseCotizaciones", exist_ok=True)
-
-    df_nueva = pd.DataFrame([cotizacion])
-
-    if os.path.exists(nombre_archivo):
-        df_existente = pd.read_excel(nombre_archivo)
-        df_total = pd.concat([df_existente, df_nueva], ignore_index=True)
-    else:
-        df_total = df_nueva
-
-    df_total.to_excel(nombre_archivo, index=False)
-    return nombre_archivo
+    return nombre_archivo, PLANTILLA_SIMPLE.renderizar(cotizacion)
 
 # ===================== APP STREAMLIT ==========================
 
@@ -74,6 +80,7 @@ def main():
     st.title("Cotizador de Transporte")
 
     cliente = st.text_input("Nombre del cliente")
+    df_municipios = municipios_transporte()
     origen = st.selectbox("Municipio de origen", df_municipios['municipio'].unique())
     destino = st.selectbox("Municipio de destino", df_municipios['municipio'].unique())
     tipo_flete = st.radio("Tipo de flete", ["FTL (Completo)", "LTL (Consolidado)"])
@@ -86,13 +93,7 @@ def main():
         volumen_cm3 = largo * ancho * alto
         volumen_mt3 = volumen_cm3 / 1_000_000
 
-        distancia_km = obtener_distancia(origen, destino)
-        tarifa_mt3 = obtener_tarifa_por_mt3(distancia_km)
-
-        if tipo_flete == "FTL (Completo)":
-            costo_total = tarifa_mt3
-        else:
-            costo_total = volumen_mt3 * tarifa_mt3
+        distancia_km, tarifa_mt3, costo_total = cotizar_flete(origen, destino, tipo_flete, volumen_mt3)
 
         cotizacion = {
             "Cliente": cliente,
@@ -109,11 +110,25 @@ def main():
         st.success("Cotización generada exitosamente.")
         st.write(cotizacion)
 
-        ruta_pdf = generar_pdf(cotizacion)
-        guardar_en_excel(cotizacion)
-
-        with open(ruta_pdf, "rb") as f:
-            st.download_button("Descargar PDF", data=f, file_name=os.path.basename(ruta_pdf), mime="application/pdf")
-
+        nombre_pdf, pdf = generar_pdf(cotizacion)
+        # Anexa a la bitácora (SQLite WAL); el Excel del día se genera a pedido
+        with etapa("bitacora"):
+            guardar_cotizacion(cotizacion)
+
+        st.download_button("Descargar PDF", data=pdf, file_name=nombre_pdf, mime="application/pdf")
+
+    if st.button("Generar Excel de cotizaciones del día"):
+        with etapa("excel"):
+            ruta_excel = exportar_excel()
+        with open(ruta_excel, "rb") as f:
+            st.download_button(
+                "Descargar Excel del día",
+                data=f,
+                file_name=os.path.basename(ruta_excel),
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            )
+
+# Cada rerun de Streamlit es una solicitud en la traza de métricas
 if __name__ == "__main__":
-    main()
+    with solicitud("rerun"):
+        main()
@@ -0,0 +1,155 @@
+import collections
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from catalogo import abrir_catalogo, CSV_MUNICIPIOS
+from cotizacion import cotizar_lote
+from tarifas import obtener_tarifario
+
+# Cotización masiva de archivos de envíos (CSV o Parquet) desde la línea de
+# comandos. El archivo se lee por bloques, cada bloque se cotiza con
+# cotizar_lote en un grupo de procesos y el resultado se escribe en orden en
+# cuanto está listo. Como sólo hay unos cuantos bloques en vuelo a la vez, la
+# memoria no crece con el tamaño del archivo.
+#
+#   python cotizar_archivo.py carriles.csv cotizados.csv --procesos 8
+#
+# Columnas de entrada: las de cotizar_lote (origen, destino, servicio,
+# peso_vol, largo, ancho, alto, maniobras; opcionales volumen_m3, distancia,
+# y origen_lat/origen_lon, destino_lat/destino_lon en lugar de las etiquetas).
+
+TAM_BLOQUE = 50_000
+
+# Tipos fijos de las columnas agregadas, para que todos los bloques de un
+# Parquet compartan esquema aunque un bloque venga sin coincidencias
+TIPOS_RESULTADO = {
+    "fila_origen": "int64",
+    "fila_destino": "int64",
+    "distancia_km": "float64",
+    "unidad": "string",
+    "costo": "float64",
+    "detalle": "string",
+    "error": "string",
+}
+
+_fuente_trabajador = CSV_MUNICIPIOS
+
+
+def _formato(ruta):
+    extension = os.path.splitext(ruta)[1].lower()
+    if extension in (".parquet", ".pq"):
+        return "parquet"
+    if extension in (".csv", ".txt", ".gz"):
+        return "csv"
+    raise ValueError(f"Formato no soportado para {ruta!r}: usa .csv o .parquet")
+
+
+def leer_bloques(ruta, tam_bloque=TAM_BLOQUE):
+    import pandas as pd
+
+    if _formato(ruta) == "parquet":
+        import pyarrow.parquet as pq
+
+        for lote in pq.ParquetFile(ruta).iter_batches(batch_size=tam_bloque):
+            yield lote.to_pandas()
+    else:
+        yield from pd.read_csv(ruta, chunksize=tam_bloque, encoding="utf-8")
+
+
+class EscritorBloques:
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.formato = _formato(ruta)
+        self._parquet = None
+        self._esquema = None
+        self._primero = True
+
+    def escribir(self, df):
+        if self.formato == "csv":
+            df.to_csv(self.ruta, mode="w" if self._primero else "a", header=self._primero, index=False)
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            if self._parquet is None:
+                self._esquema = pa.Schema.from_pandas(df, preserve_index=False)
+                self._parquet = pq.ParquetWriter(self.ruta, self._esquema)
+            self._parquet.write_table(pa.Table.from_pandas(df, schema=self._esquema, preserve_index=False))
+        self._primero = False
+
+    def cerrar(self):
+        if self._parquet is not None:
+            self._parquet.close()
+
+
+def _inicia_trabajador(fuente):
+    global _fuente_trabajador
+    _fuente_trabajador = fuente
+    # Abre el catálogo (mmap compartido con los demás procesos) y el tarifario
+    abrir_catalogo(fuente).indice()
+    obtener_tarifario()
+
+
+def cotizar_bloque(df, con_detalle=True):
+    resultado = cotizar_lote(df, abrir_catalogo(_fuente_trabajador), con_detalle=con_detalle)
+    resultado = resultado.astype({c: t for c, t in TIPOS_RESULTADO.items() if c in resultado})
+    return df.drop(columns=[c for c in resultado.columns if c in df]).join(resultado)
+
+
+def cotizar_archivo(entrada, salida, procesos=None, tam_bloque=TAM_BLOQUE, con_detalle=True,
+                    fuente=CSV_MUNICIPIOS):
+    procesos = procesos or os.cpu_count() or 1
+    escritor = EscritorBloques(salida)
+    filas = 0
+    try:
+        if procesos == 1:
+            _inicia_trabajador(fuente)
+            for bloque in leer_bloques(entrada, tam_bloque):
+                escritor.escribir(cotizar_bloque(bloque, con_detalle))
+                filas += len(bloque)
+            return filas
+
+        # Hasta dos bloques en vuelo por proceso: suficiente para no dejar
+        # procesos ociosos y acota la memoria
+        en_vuelo = collections.deque()
+        with ProcessPoolExecutor(procesos, initializer=_inicia_trabajador, initargs=(fuente,)) as grupo:
+            for bloque in leer_bloques(entrada, tam_bloque):
+                en_vuelo.append(grupo.submit(cotizar_bloque, bloque, con_detalle))
+                if len(en_vuelo) >= 2 * procesos:
+                    resultado = en_vuelo.popleft().result()
+                    escritor.escribir(resultado)
+                    filas += len(resultado)
+            while en_vuelo:
+                resultado = en_vuelo.popleft().result()
+                escritor.escribir(resultado)
+                filas += len(resultado)
+        return filas
+    finally:
+        escritor.cerrar()
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Cotiza un archivo de envíos (CSV o Parquet) por bloques")
+    parser.add_argument("entrada")
+    parser.add_argument("salida")
+    parser.add_argument("--procesos", type=int, default=None, help="procesos de trabajo (por omisión, uno por núcleo)")
+    parser.add_argument("--tam-bloque", type=int, default=TAM_BLOQUE)
+    parser.add_argument("--sin-detalle", action="store_true", help="omite la columna de detalle (más rápido)")
+    parser.add_argument("--fuente", default=CSV_MUNICIPIOS)
+    args = parser.parse_args(argv)
+
+    inicio = time.perf_counter()
+    filas = cotizar_archivo(
+        args.entrada, args.salida, args.procesos, args.tam_bloque, not args.sin_detalle, args.fuente
+    )
+    segundos = time.perf_counter() - inicio
+    print(f"{filas:,} envíos cotizados en {segundos:.1f} s ({filas / max(segundos, 1e-9):,.0f}/s) -> {args.salida}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
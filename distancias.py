@@ -0,0 +1,271 @@
+import json
+import mmap
+import os
+import struct
+import sys
+
+import numpy as np
+
+from catalogo import abrir_catalogo, CSV_MUNICIPIOS
+
+# Matriz N x N de distancias geodésicas (km, float32) entre municipios del
+# catálogo, indexada por fila del catálogo. Se construye fuera de línea y se
+# abre con mmap; la cabecera guarda la huella del catálogo con el que se
+# construyó, así que un catálogo distinto invalida la matriz.
+#
+# Modo "carretera": la misma tabla, pero con kilómetros por carretera
+# precalculados desde una red local (ver carreteras.py). Se guarda aparte,
+# junto al catálogo, y se consulta igual: O(1) por par.
+
+MAGIA = b"MUNDIST1"
+_ALINEACION = 8
+
+
+def ruta_matriz(catalogo, modo="vincenty"):
+    base = os.path.splitext(catalogo.ruta)[0]
+    return f"{base}.carretera.dist" if modo == "carretera" else f"{base}.dist"
+
+
+def _alinea(n):
+    return (n + _ALINEACION - 1) // _ALINEACION * _ALINEACION
+
+
+# Elipsoide WGS-84 (el mismo que usa geopy.geodesic)
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+WGS84_B = (1 - WGS84_F) * WGS84_A
+RADIO_MEDIO_KM = 6371.0088
+
+MODOS = ("vincenty", "haversine")
+# Modos válidos entre municipios del catálogo
+MODOS_MUNICIPIOS = MODOS + ("carretera",)
+
+
+def distancia_coordenadas(lat1, lon1, lat2, lon2):
+    # Respaldo para coordenadas fuera del catálogo; geopy se importa al primer uso
+    from geopy.distance import geodesic
+
+    return geodesic((lat1, lon1), (lat2, lon2)).km
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    # Gran círculo sobre la esfera media; rápido, error típico < 0.5 %
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(x, dtype=np.float64)) for x in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * RADIO_MEDIO_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def vincenty_km(lat1, lon1, lat2, lon2, max_iteraciones=200, tolerancia=1e-12):
+    # Inversa de Vincenty sobre WGS-84, vectorizada; coincide con geodesic
+    # (Karney) a menos de un milímetro. Los pares que no convergen (casi
+    # antípodas) se resuelven uno por uno con geographiclib.
+    lat1, lon1, lat2, lon2 = np.broadcast_arrays(*(np.asarray(x, dtype=np.float64) for x in (lat1, lon1, lat2, lon2)))
+    forma = lat1.shape
+    lat1, lon1, lat2, lon2 = (x.ravel() for x in (lat1, lon1, lat2, lon2))
+    f = WGS84_F
+    L = np.radians(lon2 - lon1)
+    U1 = np.arctan((1 - f) * np.tan(np.radians(lat1)))
+    U2 = np.arctan((1 - f) * np.tan(np.radians(lat2)))
+    sinU1, cosU1 = np.sin(U1), np.cos(U1)
+    sinU2, cosU2 = np.sin(U2), np.cos(U2)
+
+    lam = L
+    convergido = np.zeros(L.shape, dtype=bool)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for _ in range(max_iteraciones):
+            sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+            sin_sigma = np.hypot(cosU2 * sin_lam, cosU1 * sinU2 - sinU1 * cosU2 * cos_lam)
+            cos_sigma = sinU1 * sinU2 + cosU1 * cosU2 * cos_lam
+            sigma = np.arctan2(sin_sigma, cos_sigma)
+            sin_alpha = np.where(sin_sigma == 0, 0.0, cosU1 * cosU2 * sin_lam / sin_sigma)
+            cos2_alpha = 1 - sin_alpha ** 2
+            # Sobre el ecuador cos2_alpha = 0 y el término se anula
+            cos_2sigma_m = np.where(cos2_alpha == 0, 0.0, cos_sigma - 2 * sinU1 * sinU2 / cos2_alpha)
+            C = f / 16 * cos2_alpha * (4 + f * (4 - 3 * cos2_alpha))
+            lam_previo = lam
+            lam = L + (1 - C) * f * sin_alpha * (
+                sigma + C * sin_sigma * (cos_2sigma_m + C * cos_sigma * (-1 + 2 * cos_2sigma_m ** 2))
+            )
+            convergido = np.abs(lam - lam_previo) < tolerancia
+            if convergido.all():
+                break
+
+    u2 = cos2_alpha * (WGS84_A ** 2 - WGS84_B ** 2) / WGS84_B ** 2
+    A = 1 + u2 / 16384 * (4096 + u2 * (-768 + u2 * (320 - 175 * u2)))
+    B = u2 / 1024 * (256 + u2 * (-128 + u2 * (74 - 47 * u2)))
+    delta_sigma = B * sin_sigma * (cos_2sigma_m + B / 4 * (
+        cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)
+        - B / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sigma_m ** 2)
+    ))
+    km = WGS84_B * A * (sigma - delta_sigma) / 1000.0
+
+    pendientes = ~convergido | np.isnan(km)
+    if pendientes.any():
+        from geographiclib.geodesic import Geodesic
+
+        for i in np.flatnonzero(pendientes):
+            km[i] = Geodesic.WGS84.Inverse(
+                lat1[i], lon1[i], lat2[i], lon2[i], Geodesic.DISTANCE
+            )["s12"] / 1000.0
+    return km.reshape(forma)
+
+
+def distancias_km(lat1, lon1, lat2, lon2, modo="vincenty"):
+    # Distancias para arreglos de pares de coordenadas en una sola llamada
+    if modo == "vincenty":
+        return vincenty_km(lat1, lon1, lat2, lon2)
+    if modo == "haversine":
+        return haversine_km(lat1, lon1, lat2, lon2)
+    raise ValueError(f"Modo de distancia desconocido: {modo!r} (usa uno de {MODOS})")
+
+
+def _filas_geodesicas(catalogo):
+    lat, lon = catalogo.latitud, catalogo.longitud
+    matriz = np.empty((catalogo.n, catalogo.n), dtype=np.float32)
+    for i in range(catalogo.n):
+        matriz[i] = vincenty_km(lat[i], lon[i], lat, lon)
+    return matriz
+
+
+def guardar_matriz(matriz, catalogo, destino, **extra):
+    # Escritura atómica: cabecera JSON + datos alineados para mmap
+    cabecera = json.dumps({
+        "n": catalogo.n,
+        "huella": catalogo.huella,
+        "dtype": matriz.dtype.str,
+        **extra,
+    }).encode("utf-8")
+    inicio = _alinea(len(MAGIA) + 4 + len(cabecera))
+    tmp = f"{destino}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIA + struct.pack("<I", len(cabecera)) + cabecera)
+        f.seek(inicio)
+        f.write(matriz.tobytes())
+    os.replace(tmp, destino)
+    return destino
+
+
+def construir_matriz(catalogo, destino=None):
+    destino = destino or ruta_matriz(catalogo)
+    return guardar_matriz(_filas_geodesicas(catalogo), catalogo, destino)
+
+
+class MatrizDistancias:
+    def __init__(self, ruta):
+        self.ruta = ruta
+        with open(ruta, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIA)] != MAGIA:
+            raise ValueError(f"{ruta} no es una matriz de distancias válida")
+        (largo,) = struct.unpack_from("<I", self._mm, len(MAGIA))
+        self.cabecera = json.loads(self._mm[len(MAGIA) + 4:len(MAGIA) + 4 + largo])
+        self.n = self.cabecera["n"]
+        self.huella = self.cabecera["huella"]
+        self.datos = np.frombuffer(
+            self._mm, dtype=np.dtype(self.cabecera["dtype"]), count=self.n * self.n,
+            offset=_alinea(len(MAGIA) + 4 + largo),
+        ).reshape(self.n, self.n)
+
+    def vigente(self, catalogo):
+        return self.huella == catalogo.huella and self.n == catalogo.n
+
+    def distancia(self, fila_o, fila_d):
+        return float(self.datos[fila_o, fila_d])
+
+
+_ABIERTAS = {}
+
+
+def abrir_matriz(catalogo, modo="vincenty"):
+    # Devuelve None si no hay matriz construida o si es de otro catálogo
+    ruta = ruta_matriz(catalogo, modo)
+    try:
+        clave = (os.path.abspath(ruta), os.stat(ruta).st_mtime_ns)
+    except OSError:
+        return None
+    matriz = _ABIERTAS.get(clave)
+    if matriz is None:
+        try:
+            matriz = MatrizDistancias(ruta)
+        except (ValueError, KeyError):
+            return None
+        _ABIERTAS[clave] = matriz
+    return matriz if matriz.vigente(catalogo) else None
+
+
+def _matriz_carretera(catalogo):
+    matriz = abrir_matriz(catalogo, "carretera")
+    if matriz is None:
+        raise ValueError(
+            f"No hay tabla de distancias por carretera vigente ({ruta_matriz(catalogo, 'carretera')}); "
+            "constrúyela con: python carreteras.py <red>"
+        )
+    return matriz
+
+
+def version_distancias(catalogo, modo="vincenty"):
+    # Identifica la fuente de distancias para invalidar cachés: en modo
+    # carretera cambia cuando se reconstruye la tabla
+    if modo == "carretera":
+        return f"carretera:{os.stat(_matriz_carretera(catalogo).ruta).st_mtime_ns}"
+    return modo
+
+
+def distancia_municipios(catalogo, fila_o, fila_d, modo="vincenty"):
+    # Consulta O(1) en la matriz; geodesic si la matriz falta o está vencida.
+    # En modo carretera, los pares sin ruta en la red caen a línea recta.
+    if modo == "carretera":
+        km = _matriz_carretera(catalogo).distancia(fila_o, fila_d)
+        if km == km:
+            return km
+    elif modo == "haversine":
+        return float(haversine_km(
+            catalogo.latitud[fila_o], catalogo.longitud[fila_o],
+            catalogo.latitud[fila_d], catalogo.longitud[fila_d],
+        ))
+    elif modo != "vincenty":
+        raise ValueError(f"Modo de distancia desconocido: {modo!r} (usa uno de {MODOS_MUNICIPIOS})")
+    matriz = abrir_matriz(catalogo)
+    if matriz is not None:
+        return matriz.distancia(fila_o, fila_d)
+    return distancia_coordenadas(
+        catalogo.latitud[fila_o], catalogo.longitud[fila_o],
+        catalogo.latitud[fila_d], catalogo.longitud[fila_d],
+    )
+
+
+def distancias_municipios(catalogo, filas_o, filas_d, modo="vincenty"):
+    # Versión por lotes de distancia_municipios para arreglos de filas
+    filas_o = np.asarray(filas_o, dtype=np.intp)
+    filas_d = np.asarray(filas_d, dtype=np.intp)
+    if modo == "carretera":
+        km = _matriz_carretera(catalogo).datos[filas_o, filas_d].astype(np.float64)
+        sin_ruta = np.isnan(km)
+        if sin_ruta.any():
+            km[sin_ruta] = distancias_municipios(catalogo, filas_o[sin_ruta], filas_d[sin_ruta])
+        return km
+    matriz = abrir_matriz(catalogo) if modo == "vincenty" else None
+    if matriz is not None:
+        return matriz.datos[filas_o, filas_d].astype(np.float64)
+    return distancias_km(
+        catalogo.latitud[filas_o], catalogo.longitud[filas_o],
+        catalogo.latitud[filas_d], catalogo.longitud[filas_d],
+        modo,
+    )
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Construye la matriz de distancias entre municipios del catálogo")
+    parser.add_argument("--fuente", default=CSV_MUNICIPIOS)
+    parser.add_argument("--salida", default=None)
+    args = parser.parse_args(argv)
+    catalogo = abrir_catalogo(args.fuente)
+    destino = construir_matriz(catalogo, args.salida)
+    print(f"{destino}: {catalogo.n} x {catalogo.n} (catálogo {catalogo.version})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
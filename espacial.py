@@ -0,0 +1,168 @@
+import sys
+
+import numpy as np
+
+from catalogo import abrir_catalogo, CSV_MUNICIPIOS
+from distancias import RADIO_MEDIO_KM
+
+# Índice espacial del catálogo para pasar de coordenadas (GPS, direcciones
+# geocodificadas) al municipio más cercano.
+#
+# KD-tree sobre vectores unitarios 3D (sin problemas en el antimeridiano ni
+# distorsión por latitud), balanceado y guardado implícito en arreglos: el
+# nodo i tiene hijos 2i+1 y 2i+2 y las hojas son rebanadas contiguas de la
+# permutación de filas. Las consultas van por lotes: todas las coordenadas
+# bajan el árbol juntas, nivel por nivel, descartando las cajas que quedan
+# más lejos que el k-ésimo mejor candidato, así que cada punto visita
+# O(log n) nodos sin recorrer todo el catálogo.
+
+TAM_HOJA = 16
+
+
+def a_vectores(lat, lon):
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+def cuerda_a_km(cuerda):
+    # Distancia en línea recta dentro de la esfera -> arco sobre la superficie
+    return 2 * RADIO_MEDIO_KM * np.arcsin(np.minimum(np.asarray(cuerda) / 2, 1.0))
+
+
+class IndiceEspacial:
+    # Sobre cualquier par de arreglos latitud/longitud: las filas del catálogo
+    # (Catalogo.espacial) o los nodos de una red carretera
+    def __init__(self, latitud, longitud, tam_hoja=TAM_HOJA):
+        puntos = a_vectores(latitud, longitud)
+        n = self.n = len(puntos)
+        self.profundidad = max(0, int(np.ceil(np.log2(max(n, 1) / tam_hoja))))
+        num_hojas = 1 << self.profundidad
+        num_internos = num_hojas - 1
+
+        # Partición por la mediana en la dimensión de mayor extensión
+        orden = np.arange(n)
+        self.dimension = np.zeros(num_internos, dtype=np.intp)
+        self.corte = np.zeros(num_internos)
+        rangos = [(0, n)]
+        for nodo in range(num_internos):
+            a, b = rangos[nodo]
+            bloque = puntos[orden[a:b]]
+            dim = int(np.argmax(bloque.max(axis=0) - bloque.min(axis=0))) if b > a else 0
+            orden[a:b] = orden[a:b][np.argsort(bloque[:, dim], kind="stable")]
+            m = (a + b) // 2
+            self.dimension[nodo] = dim
+            self.corte[nodo] = puntos[orden[m], dim] if b > a else 0.0
+            rangos += [(a, m), (m, b)]
+
+        # Filas de cada hoja en una tabla rellenada con -1
+        hojas = rangos[num_internos:]
+        ancho = max(b - a for a, b in hojas)
+        self.filas_hoja = np.full((num_hojas, max(ancho, 1)), -1, dtype=np.intp)
+        for h, (a, b) in enumerate(hojas):
+            self.filas_hoja[h, :b - a] = orden[a:b]
+
+        # Caja envolvente de cada nodo (vacía = +inf/-inf, nunca se visita)
+        total = num_internos + num_hojas
+        self.caja_min = np.full((total, 3), np.inf)
+        self.caja_max = np.full((total, 3), -np.inf)
+        for h, (a, b) in enumerate(hojas):
+            if b > a:
+                self.caja_min[num_internos + h] = puntos[orden[a:b]].min(axis=0)
+                self.caja_max[num_internos + h] = puntos[orden[a:b]].max(axis=0)
+        for nodo in range(num_internos - 1, -1, -1):
+            self.caja_min[nodo] = np.minimum(self.caja_min[2 * nodo + 1], self.caja_min[2 * nodo + 2])
+            self.caja_max[nodo] = np.maximum(self.caja_max[2 * nodo + 1], self.caja_max[2 * nodo + 2])
+
+        self.puntos = puntos
+        self._num_internos = num_internos
+
+    def _distancias_hoja(self, consultas, hojas):
+        # Distancia^2 de cada consulta a los puntos de su hoja (inf en el relleno)
+        filas = self.filas_hoja[hojas]
+        d2 = ((self.puntos[filas] - consultas[:, None, :]) ** 2).sum(axis=-1)
+        return filas, np.where(filas >= 0, d2, np.inf)
+
+    def vecinos(self, lat, lon, k=1):
+        # Las k filas más cercanas a cada coordenada y su distancia en km.
+        # Con escalares devuelve arreglos de forma (k,); con arreglos, (m, k).
+        escalar = np.ndim(lat) == 0 and np.ndim(lon) == 0
+        consultas = a_vectores(np.atleast_1d(lat), np.atleast_1d(lon)).reshape(-1, 3)
+        m = len(consultas)
+        k = max(1, min(int(k), self.n))
+
+        # Cota inicial: el k-ésimo mejor punto de la hoja donde cae la consulta
+        nodo = np.zeros(m, dtype=np.intp)
+        for _ in range(self.profundidad):
+            derecha = consultas[np.arange(m), self.dimension[nodo]] >= self.corte[nodo]
+            nodo = 2 * nodo + 1 + derecha
+        _, d2_propia = self._distancias_hoja(consultas, nodo - self._num_internos)
+        if d2_propia.shape[1] >= k:
+            radio2 = np.partition(d2_propia, k - 1, axis=1)[:, k - 1]
+        else:
+            radio2 = np.full(m, np.inf)
+
+        # Recorrido por niveles: pares (consulta, nodo) cuya caja puede tener
+        # algo más cerca que la cota
+        consulta = np.arange(m)
+        nodo = np.zeros(m, dtype=np.intp)
+        for nivel in range(self.profundidad + 1):
+            q = consultas[consulta]
+            afuera = np.maximum(self.caja_min[nodo] - q, 0) + np.maximum(q - self.caja_max[nodo], 0)
+            vivos = (afuera ** 2).sum(axis=1) <= radio2[consulta]
+            consulta, nodo = consulta[vivos], nodo[vivos]
+            if nivel < self.profundidad:
+                consulta = np.repeat(consulta, 2)
+                nodo = (2 * nodo[:, None] + np.array([1, 2])).ravel()
+
+        # Candidatos de las hojas sobrevivientes; los k mejores por consulta
+        filas, d2 = self._distancias_hoja(consultas[consulta], nodo - self._num_internos)
+        consulta = np.broadcast_to(consulta[:, None], filas.shape).ravel()
+        filas, d2 = filas.ravel(), d2.ravel()
+        validos = np.isfinite(d2)
+        consulta, filas, d2 = consulta[validos], filas[validos], d2[validos]
+        orden = np.lexsort((filas, d2, consulta))
+        consulta, filas, d2 = consulta[orden], filas[orden], d2[orden]
+        inicio = np.searchsorted(consulta, np.arange(m))
+        rango = np.arange(len(consulta)) - inicio[consulta]
+        tomados = rango < k
+
+        resultado_filas = np.full((m, k), -1, dtype=np.intp)
+        resultado_km = np.full((m, k), np.nan)
+        resultado_filas[consulta[tomados], rango[tomados]] = filas[tomados]
+        resultado_km[consulta[tomados], rango[tomados]] = cuerda_a_km(np.sqrt(d2[tomados]))
+        if escalar:
+            return resultado_filas[0], resultado_km[0]
+        return resultado_filas, resultado_km
+
+    def mas_cercano(self, lat, lon):
+        # Fila del municipio más cercano y distancia en km (escalar o arreglos)
+        filas, km = self.vecinos(lat, lon, 1)
+        return filas[..., 0], km[..., 0]
+
+
+def main(argv=None):
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Municipios más cercanos a una coordenada")
+    parser.add_argument("lat", type=float)
+    parser.add_argument("lon", type=float)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--fuente", default=CSV_MUNICIPIOS)
+    args = parser.parse_args(argv)
+
+    catalogo = abrir_catalogo(args.fuente)
+    indice = catalogo.espacial()
+    inicio = time.perf_counter()
+    filas, km = indice.vecinos(args.lat, args.lon, args.k)
+    microsegundos = (time.perf_counter() - inicio) * 1e6
+    for fila, distancia in zip(filas, km):
+        print(f"{fila:6d}  {distancia:9.2f} km  {catalogo.etiqueta(fila, limpio=True)}")
+    print(f"consulta en {microsegundos:.0f} µs")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,227 @@
+import csv
+import io
+import itertools
+import os
+import sys
+import warnings
+
+# Exportación de historiales de cotizaciones a XLSX, CSV o Parquet por
+# bloques, con memoria constante sin importar cuántos renglones haya.
+#
+# Las filas llegan como un iterable de dicts (la bitácora, el historial de la
+# sesión, un generador) y se escriben en bloques de TAM_BLOQUE: XLSX con el
+# modo write_only de openpyxl (cada renglón se serializa al archivo temporal
+# del libro y se suelta), CSV con csv.writer y Parquet con un ParquetWriter de
+# pyarrow, un grupo de renglones por bloque. Nada se genera hasta que se
+# llama a exportar(); las apps lo hacen sólo cuando el usuario pide la
+# descarga.
+#
+#   python exportacion.py --desde 2024-01-01 --hasta 2024-01-31 enero.parquet
+
+FORMATOS = ("xlsx", "csv", "parquet")
+TAM_BLOQUE = 10_000
+# Renglones por hoja de Excel (incluido el encabezado); el resto sigue en otra hoja
+MAX_RENGLONES_HOJA = 1_048_576
+
+TIPOS_MIME = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def formato_de(destino):
+    extension = os.path.splitext(str(destino))[1].lower().lstrip(".")
+    formato = {"xls": "xlsx", "pq": "parquet"}.get(extension, extension)
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato de exportación desconocido: {destino!r} (usa {', '.join(FORMATOS)})")
+    return formato
+
+
+def bloques(filas, tam_bloque=TAM_BLOQUE):
+    iterador = iter(filas)
+    while True:
+        bloque = list(itertools.islice(iterador, tam_bloque))
+        if not bloque:
+            return
+        yield bloque
+
+
+def columnas_de(bloque):
+    # Unión de llaves en orden de aparición
+    columnas = {}
+    for fila in bloque:
+        for llave in fila:
+            columnas.setdefault(llave, None)
+    return list(columnas)
+
+
+def _celda(valor):
+    # openpyxl sólo acepta escalares; lo demás se escribe como texto
+    if valor is None or isinstance(valor, (str, int, float, bool)):
+        return valor
+    if hasattr(valor, "item"):
+        return valor.item()
+    return str(valor)
+
+
+class _EscritorXlsx:
+    def __init__(self, destino, columnas):
+        from openpyxl import Workbook
+
+        self.destino = destino
+        self.columnas = columnas
+        self.libro = Workbook(write_only=True)
+        self.hojas = 0
+        self._nueva_hoja()
+
+    def _nueva_hoja(self):
+        self.hojas += 1
+        self.hoja = self.libro.create_sheet("Sheet1" if self.hojas == 1 else f"Sheet{self.hojas}")
+        self.hoja.append(self.columnas)
+        self.renglones = 1
+
+    def escribir(self, bloque):
+        for fila in bloque:
+            if self.renglones >= MAX_RENGLONES_HOJA:
+                self._nueva_hoja()
+            self.hoja.append([_celda(fila.get(c)) for c in self.columnas])
+            self.renglones += 1
+
+    def cerrar(self):
+        self.libro.save(self.destino)
+
+
+class _EscritorCsv:
+    def __init__(self, destino, columnas):
+        if isinstance(destino, (str, os.PathLike)):
+            self.archivo = open(destino, "w", encoding="utf-8", newline="")
+            self.propio = True
+        else:
+            self.archivo = io.TextIOWrapper(destino, encoding="utf-8", newline="", write_through=True)
+            self.propio = False
+        self.columnas = columnas
+        self.escritor = csv.writer(self.archivo)
+        self.escritor.writerow(columnas)
+
+    def escribir(self, bloque):
+        self.escritor.writerows([["" if fila.get(c) is None else fila.get(c) for c in self.columnas] for fila in bloque])
+
+    def cerrar(self):
+        if self.propio:
+            self.archivo.close()
+        else:
+            # Suelta el archivo del llamador sin cerrarlo
+            self.archivo.flush()
+            self.archivo.detach()
+
+
+class _EscritorParquet:
+    # Tipos fijados con el primer bloque: una columna es numérica si todos sus
+    # valores no vacíos lo son; si no, texto. Los valores posteriores que no
+    # caben en una columna numérica quedan nulos y se avisa al cerrar.
+    def __init__(self, destino, columnas, primer_bloque):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        self.columnas = columnas
+        self.numericas = set()
+        campos = []
+        for c in columnas:
+            valores = [fila.get(c) for fila in primer_bloque]
+            llenos = [v for v in valores if v is not None and v != ""]
+            if llenos and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in llenos):
+                self.numericas.add(c)
+                campos.append(pa.field(c, pa.float64()))
+            else:
+                campos.append(pa.field(c, pa.string()))
+        self.esquema = pa.schema(campos)
+        self.escritor = pq.ParquetWriter(destino, self.esquema)
+        self.descartados = 0
+
+    def _numero(self, valor):
+        if valor is None or valor == "":
+            return None
+        try:
+            return float(valor)
+        except (TypeError, ValueError):
+            self.descartados += 1
+            return None
+
+    def escribir(self, bloque):
+        arreglos = []
+        for c in self.columnas:
+            if c in self.numericas:
+                arreglos.append(self.pa.array([self._numero(fila.get(c)) for fila in bloque], self.pa.float64()))
+            else:
+                valores = [fila.get(c) for fila in bloque]
+                arreglos.append(self.pa.array([None if v is None else str(v) for v in valores], self.pa.string()))
+        self.escritor.write_table(self.pa.Table.from_arrays(arreglos, schema=self.esquema))
+
+    def cerrar(self):
+        self.escritor.close()
+        if self.descartados:
+            warnings.warn(f"{self.descartados} valores no numéricos en columnas numéricas quedaron nulos")
+
+
+def exportar(filas, destino, formato=None, columnas=None, tam_bloque=TAM_BLOQUE):
+    # Escribe las filas (iterable de dicts) en destino (ruta o archivo binario)
+    # y devuelve cuántas se escribieron. Sin columnas, se toman las llaves del
+    # primer bloque; las llaves que aparezcan después no se exportan.
+    formato = formato or formato_de(destino)
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato de exportación desconocido: {formato!r}")
+    if isinstance(destino, (str, os.PathLike)):
+        os.makedirs(os.path.dirname(os.fspath(destino)) or ".", exist_ok=True)
+
+    iterador = bloques(filas, tam_bloque)
+    primero = next(iterador, [])
+    columnas = list(columnas) if columnas is not None else columnas_de(primero)
+    if formato == "xlsx":
+        escritor = _EscritorXlsx(destino, columnas)
+    elif formato == "csv":
+        escritor = _EscritorCsv(destino, columnas)
+    else:
+        escritor = _EscritorParquet(destino, columnas, primero)
+
+    total = 0
+    try:
+        for bloque in itertools.chain([primero] if primero else [], iterador):
+            escritor.escribir(bloque)
+            total += len(bloque)
+    finally:
+        escritor.cerrar()
+    return total
+
+
+def exportar_bytes(filas, formato="xlsx", columnas=None):
+    # Para st.download_button; el archivo completo queda en memoria, úsese con
+    # historiales de sesión, no con la bitácora del mes
+    salida = io.BytesIO()
+    exportar(filas, salida, formato, columnas)
+    return salida.getvalue()
+
+
+def main(argv=None):
+    import argparse
+    import time
+
+    from bitacora import RUTA_BITACORA, exportar_bitacora
+
+    parser = argparse.ArgumentParser(description="Exporta la bitácora de cotizaciones por bloques")
+    parser.add_argument("salida", help="archivo .xlsx, .csv o .parquet")
+    parser.add_argument("--fecha", default=None, help="un día (AAAA-MM-DD)")
+    parser.add_argument("--desde", default=None)
+    parser.add_argument("--hasta", default=None)
+    parser.add_argument("--bitacora", default=RUTA_BITACORA)
+    args = parser.parse_args(argv)
+
+    inicio = time.perf_counter()
+    total = exportar_bitacora(args.salida, args.fecha, args.bitacora, args.desde, args.hasta)
+    print(f"{total:,} cotizaciones -> {args.salida} en {time.perf_counter() - inicio:.1f} s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
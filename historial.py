@@ -0,0 +1,156 @@
+import numpy as np
+
+# Historial de cotizaciones de una sesión en columnas.
+#
+# En lugar de una lista de dicts que se vuelve DataFrame en cada rerun, cada
+# campo es un arreglo preasignado que crece al doble al llenarse (anexar es
+# O(1) amortizado): números en float64, y Servicio, Origen, Destino y Tipo de
+# unidad codificados como categorías (int32 + tabla de valores). La tabla de
+# la app sólo materializa la página visible, y la exportación recorre los
+# renglones sin armar el DataFrame completo.
+
+NUMERO = "numero"
+CATEGORIA = "categoria"
+TEXTO = "texto"
+
+CAPACIDAD_INICIAL = 64
+
+# Campos de app.py y cotizador_fletes.py
+ESQUEMA_FLETES = (
+    ("Fecha cotización", TEXTO),
+    ("Cliente", TEXTO),
+    ("Servicio", CATEGORIA),
+    ("Origen", CATEGORIA),
+    ("Destino", CATEGORIA),
+    ("Distancia (km)", NUMERO),
+    ("Tipo de unidad", CATEGORIA),
+    ("Peso/Vol (Ton)", NUMERO),
+    ("Volumen (m3)", NUMERO),
+    ("Costo Total MXN", NUMERO),
+    ("Detalle", TEXTO),
+    ("Observaciones", TEXTO),
+    ("Fecha de servicio", TEXTO),
+)
+
+
+class _Columna:
+    def __init__(self, tipo, capacidad):
+        self.tipo = tipo
+        if tipo == NUMERO:
+            self.datos = np.full(capacidad, np.nan)
+        elif tipo == CATEGORIA:
+            self.datos = np.full(capacidad, -1, dtype=np.int32)
+            self.categorias = []
+            self.codigos = {}
+        else:
+            self.datos = np.full(capacidad, None, dtype=object)
+
+    def crecer(self, capacidad):
+        vacio = np.nan if self.tipo == NUMERO else (-1 if self.tipo == CATEGORIA else None)
+        nuevos = np.full(capacidad, vacio, dtype=self.datos.dtype)
+        nuevos[:len(self.datos)] = self.datos
+        self.datos = nuevos
+
+    def poner(self, i, valor):
+        if self.tipo == NUMERO:
+            # "" y None (campo que no aplica al servicio) quedan como NaN
+            self.datos[i] = np.nan if valor is None or valor == "" else float(valor)
+        elif self.tipo == CATEGORIA:
+            if valor is None:
+                return
+            codigo = self.codigos.get(valor)
+            if codigo is None:
+                codigo = self.codigos[valor] = len(self.categorias)
+                self.categorias.append(valor)
+            self.datos[i] = codigo
+        else:
+            self.datos[i] = valor
+
+    def valor(self, i):
+        if self.tipo == NUMERO:
+            valor = self.datos[i]
+            return None if np.isnan(valor) else float(valor)
+        if self.tipo == CATEGORIA:
+            codigo = self.datos[i]
+            return None if codigo < 0 else self.categorias[codigo]
+        return self.datos[i]
+
+    def serie(self, inicio, fin):
+        import pandas as pd
+
+        if self.tipo == CATEGORIA:
+            # Sólo las categorías presentes en la ventana: costo O(ventana)
+            codigos = self.datos[inicio:fin]
+            presentes = codigos >= 0
+            usadas, locales = np.unique(codigos[presentes], return_inverse=True)
+            nuevos = np.full(len(codigos), -1, dtype=np.int32)
+            nuevos[presentes] = locales
+            return pd.Categorical.from_codes(nuevos, categories=pd.Index([self.categorias[c] for c in usadas], dtype=object))
+        # Copia: la página no debe cambiar si la sesión sigue anexando
+        return self.datos[inicio:fin].copy()
+
+
+class HistorialSesion:
+    def __init__(self, esquema=ESQUEMA_FLETES, capacidad=CAPACIDAD_INICIAL):
+        self.capacidad = max(1, int(capacidad))
+        self.n = 0
+        self.columnas = {nombre: _Columna(tipo, self.capacidad) for nombre, tipo in esquema}
+
+    def __len__(self):
+        return self.n
+
+    def __bool__(self):
+        return self.n > 0
+
+    def agregar(self, cotizacion):
+        # Las llaves fuera del esquema se agregan como columnas de texto
+        if self.n == self.capacidad:
+            self.capacidad *= 2
+            for columna in self.columnas.values():
+                columna.crecer(self.capacidad)
+        for llave, valor in cotizacion.items():
+            columna = self.columnas.get(llave)
+            if columna is None:
+                columna = self.columnas[llave] = _Columna(TEXTO, self.capacidad)
+            columna.poner(self.n, valor)
+        self.n += 1
+        return self.n - 1
+
+    def fila(self, i):
+        if not -self.n <= i < self.n:
+            raise IndexError(f"El historial tiene {self.n} cotizaciones")
+        i %= self.n
+        return {nombre: columna.valor(i) for nombre, columna in self.columnas.items()}
+
+    def iterar(self, inicio=0, fin=None):
+        # Renglones como dicts, para exportacion.exportar
+        fin = self.n if fin is None else min(fin, self.n)
+        for i in range(max(inicio, 0), fin):
+            yield self.fila(i)
+
+    def ventana(self, inicio, fin, columnas=None):
+        # DataFrame sólo con los renglones [inicio, fin)
+        import pandas as pd
+
+        inicio, fin = max(0, inicio), min(self.n, fin)
+        fin = max(inicio, fin)
+        nombres = list(columnas) if columnas is not None else list(self.columnas)
+        return pd.DataFrame(
+            {nombre: self.columnas[nombre].serie(inicio, fin) for nombre in nombres},
+            index=pd.RangeIndex(inicio, fin),
+        )
+
+    def paginas(self, tam_pagina):
+        return max(1, -(-self.n // tam_pagina))
+
+    def pagina(self, numero, tam_pagina=50, recientes_primero=True, columnas=None):
+        # Página 1 = las cotizaciones más recientes (o las primeras)
+        numero = min(max(1, int(numero)), self.paginas(tam_pagina))
+        if recientes_primero:
+            fin = self.n - (numero - 1) * tam_pagina
+            return self.ventana(fin - tam_pagina, fin, columnas).iloc[::-1]
+        inicio = (numero - 1) * tam_pagina
+        return self.ventana(inicio, inicio + tam_pagina, columnas)
+
+    def a_dataframe(self, columnas=None):
+        return self.ventana(0, self.n, columnas)
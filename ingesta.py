@@ -0,0 +1,281 @@
+import json
+import sys
+
+import numpy as np
+
+from catalogo import CSV_ALIAS, CSV_CAPITALES, CSV_MUNICIPIOS, limpia_texto, normaliza
+
+# Ingesta de los CSV de municipios para el catálogo compilado.
+#
+# Lee municipios_mexico.csv, municipios.csv y capitales_mexico.csv con pandas
+# y los limpia de una vez por columna:
+#
+#   - textos: limpia_texto/normaliza se aplican una vez por valor distinto y
+#     se reparten con los códigos de factorize; los alias con UTF-8 leído
+#     como latin-1 ("CosÃ­o") se reparan
+#   - coordenadas: cada renglón se valida contra los límites de México; si
+#     sólo cabe con latitud y longitud intercambiadas o con el signo de la
+#     longitud invertido, se repara; si no cabe de ninguna forma, se descarta
+#   - duplicados: mismo municipio con la misma coordenada (a ~100 m); los
+#     homónimos con coordenadas distintas se conservan y se reportan
+#   - conciliación: el alias de municipios.csv se enlaza por coordenada y,
+#     si no, por nombre; capitales_mexico.csv se compara por nombre
+#
+# El resultado queda en el catálogo binario (catalogo.py), cuya huella cubre
+# el contenido de los tres CSV: la limpieza corre una vez por cambio en los
+# datos, no una vez por proceso. El reporte se guarda en la cabecera del
+# catálogo ("ingesta") y se puede ver sin compilar:
+#
+#   python ingesta.py
+
+LATITUD_MEXICO = (14.0, 33.0)
+LONGITUD_MEXICO = (-119.0, -86.0)
+# Decimales de grado para considerar dos coordenadas la misma (~100 m)
+DECIMALES_DUPLICADO = 3
+# Ejemplos por hallazgo en el reporte
+MAX_EJEMPLOS = 20
+
+OK = "ok"
+INTERCAMBIADA = "intercambiada"
+SIGNO = "signo"
+INTERCAMBIADA_SIGNO = "intercambiada_signo"
+FUERA = "fuera_de_rango"
+
+
+def leer_csv(ruta):
+    import pandas as pd
+
+    try:
+        return pd.read_csv(ruta, dtype=str, keep_default_na=False, encoding="utf-8-sig")
+    except UnicodeDecodeError:
+        return pd.read_csv(ruta, dtype=str, keep_default_na=False, encoding="latin1")
+
+
+def por_valor_unico(valores, funcion):
+    # funcion aplicada una vez por valor distinto; devuelve arreglo object
+    import pandas as pd
+
+    codigos, unicos = pd.factorize(np.asarray(valores, dtype=object))
+    resultado = np.array([funcion(u) for u in unicos] + [funcion("")], dtype=object)
+    return resultado[codigos]
+
+
+def repara_mojibake(texto):
+    # UTF-8 que se leyó como latin-1 y se volvió a guardar en UTF-8
+    if not texto or not any(c in texto for c in "ÃÂ"):
+        return texto
+    try:
+        return texto.encode("latin1").decode("utf-8")
+    except (UnicodeEncodeError, UnicodeDecodeError):
+        return texto
+
+
+def numeros(columna):
+    import pandas as pd
+
+    return pd.to_numeric(columna, errors="coerce").to_numpy(dtype=np.float64)
+
+
+def _en_mexico(lat, lon):
+    with np.errstate(invalid="ignore"):
+        return (
+            (lat >= LATITUD_MEXICO[0]) & (lat <= LATITUD_MEXICO[1])
+            & (lon >= LONGITUD_MEXICO[0]) & (lon <= LONGITUD_MEXICO[1])
+        )
+
+
+def repara_coordenadas(lat, lon):
+    # Devuelve (lat, lon, estado) por renglón; estado dice qué se reparó.
+    # Los renglones FUERA quedan en NaN.
+    casos = (
+        (OK, lat, lon),
+        (INTERCAMBIADA, lon, lat),
+        (SIGNO, lat, -lon),
+        (INTERCAMBIADA_SIGNO, lon, -lat),
+    )
+    nueva_lat = np.full(len(lat), np.nan)
+    nueva_lon = np.full(len(lat), np.nan)
+    estado = np.full(len(lat), FUERA, dtype=object)
+    pendientes = np.ones(len(lat), dtype=bool)
+    for nombre, la, lo in casos:
+        cabe = pendientes & _en_mexico(la, lo)
+        nueva_lat[cabe], nueva_lon[cabe] = la[cabe], lo[cabe]
+        estado[cabe] = nombre
+        pendientes &= ~cabe
+    return nueva_lat, nueva_lon, estado
+
+
+def llave_nombre(texto):
+    # normaliza + espacios repetidos colapsados, para comparar entre archivos
+    return " ".join(normaliza(texto).split())
+
+
+def _ejemplos(valores):
+    valores = list(valores)
+    return valores[:MAX_EJEMPLOS]
+
+
+def _llave_coordenada(lat, lon, decimales=6):
+    return list(zip(np.round(lat, decimales).tolist(), np.round(lon, decimales).tolist()))
+
+
+def _concilia_alias(municipios, ruta, reporte):
+    # Alias de cada municipio: por coordenada exacta y, si no, por "Ciudad-Estado"
+    import pandas as pd
+
+    n = len(municipios["ciudad"])
+    alias = np.full(n, None, dtype=object)
+    try:
+        df = leer_csv(ruta)
+    except FileNotFoundError:
+        reporte["alias"] = {"archivo": ruta, "existe": False}
+        return alias
+    etiquetas = df.get("municipio", pd.Series([""] * len(df))).str.strip().to_numpy(dtype=object)
+    reparadas = por_valor_unico(etiquetas, repara_mojibake)
+    lat, lon, estado = repara_coordenadas(numeros(df.get("latitud")), numeros(df.get("longitud")))
+
+    por_coordenada = {}
+    for i, llave in enumerate(_llave_coordenada(lat, lon)):
+        if estado[i] != FUERA:
+            por_coordenada.setdefault(llave, i)
+    por_nombre = {}
+    for i, etiqueta in enumerate(por_valor_unico(reparadas, llave_nombre)):
+        por_nombre.setdefault(etiqueta, i)
+
+    usados = np.zeros(len(df), dtype=bool)
+    por_coord = por_nom = 0
+    nombres = (por_valor_unico(municipios["ciudad"], llave_nombre) + "-" + por_valor_unico(municipios["estado"], llave_nombre)).tolist()
+    for fila, (llave, nombre) in enumerate(zip(_llave_coordenada(municipios["latitud"], municipios["longitud"]), nombres)):
+        i = por_coordenada.get(llave)
+        if i is not None and not usados[i]:
+            por_coord += 1
+        else:
+            i = por_nombre.get(nombre)
+            if i is None or usados[i]:
+                continue
+            por_nom += 1
+        usados[i] = True
+        alias[fila] = reparadas[i]
+
+    sin_alias = [i for i in range(n) if alias[i] is None]
+    reporte["alias"] = {
+        "archivo": ruta,
+        "renglones": len(df),
+        "mojibake_reparado": int((reparadas != etiquetas).sum()),
+        "coordenadas_reparadas": int((estado != OK).sum()),
+        "enlazados_por_coordenada": por_coord,
+        "enlazados_por_nombre": por_nom,
+        "municipios_sin_alias": len(sin_alias),
+        "ejemplos_sin_alias": _ejemplos(municipios["ciudad"][i] + " (" + municipios["estado"][i] + ")" for i in sin_alias),
+        "alias_sin_municipio": int((~usados).sum()),
+        "ejemplos_alias_sin_municipio": _ejemplos(reparadas[~usados]),
+    }
+    return alias
+
+
+def _concilia_capitales(municipios, ruta, reporte):
+    try:
+        df = leer_csv(ruta)
+    except FileNotFoundError:
+        reporte["capitales"] = {"archivo": ruta, "existe": False}
+        return
+    estado = df.get("Estado").str.strip().to_numpy(dtype=object)
+    ciudad = df.get("Ciudad").str.strip().to_numpy(dtype=object)
+    ajenas = list(zip(por_valor_unico(ciudad, llave_nombre), por_valor_unico(estado, llave_nombre)))
+    propias = list(zip(por_valor_unico(municipios["ciudad"], llave_nombre), por_valor_unico(municipios["estado"], llave_nombre)))
+    en_capitales, en_catalogo = set(ajenas), set(propias)
+    faltan_en_capitales = [i for i, llave in enumerate(propias) if llave not in en_capitales]
+    faltan_en_catalogo = [i for i, llave in enumerate(ajenas) if llave not in en_catalogo]
+    reporte["capitales"] = {
+        "archivo": ruta,
+        "renglones": len(df),
+        "sin_municipio_en_catalogo": len(faltan_en_catalogo),
+        "ejemplos_sin_municipio": _ejemplos(f"{ciudad[i]} ({estado[i]})" for i in faltan_en_catalogo),
+        "municipios_fuera_de_capitales": len(faltan_en_capitales),
+        "ejemplos_fuera_de_capitales": _ejemplos(
+            f"{municipios['ciudad'][i]} ({municipios['estado'][i]})" for i in faltan_en_capitales
+        ),
+    }
+
+
+def ingerir(fuente=CSV_MUNICIPIOS, alias=CSV_ALIAS, capitales=CSV_CAPITALES):
+    # Devuelve (columnas, reporte): columnas es un dict de arreglos alineados
+    # (textos del catálogo + latitud/longitud) ya limpios y sin duplicados
+    df = leer_csv(fuente)
+    reporte = {"fuente": fuente, "renglones": len(df)}
+    estado_txt = df["Estado"].str.strip().to_numpy(dtype=object)
+    ciudad_txt = df["Ciudad"].str.strip().to_numpy(dtype=object)
+
+    lat, lon, reparacion = repara_coordenadas(numeros(df.get("Latitud")), numeros(df.get("Longitud")))
+    conteo = {nombre: int((reparacion == nombre).sum()) for nombre in (OK, INTERCAMBIADA, SIGNO, INTERCAMBIADA_SIGNO, FUERA)}
+    reporte["coordenadas"] = conteo
+    # Si casi todo sale intercambiado, el problema es el encabezado del CSV
+    reporte["encabezado_intercambiado"] = conteo[INTERCAMBIADA] > len(df) / 2
+    fuera = reparacion == FUERA
+    reporte["ejemplos_fuera_de_rango"] = _ejemplos(
+        f"{c} ({e}): {la}, {lo}" for c, e, la, lo in zip(
+            ciudad_txt[fuera], estado_txt[fuera], df["Latitud"].to_numpy()[fuera], df["Longitud"].to_numpy()[fuera]
+        )
+    )
+    validos = ~fuera & (ciudad_txt != "")
+    reporte["sin_nombre"] = int((~fuera & (ciudad_txt == "")).sum())
+
+    municipios = {
+        "estado": estado_txt[validos],
+        "ciudad": ciudad_txt[validos],
+        "latitud": lat[validos],
+        "longitud": lon[validos],
+    }
+    municipios["estado_limpio"] = por_valor_unico(municipios["estado"], limpia_texto)
+    municipios["ciudad_limpio"] = por_valor_unico(municipios["ciudad"], limpia_texto)
+    municipios["estado_norm"] = por_valor_unico(municipios["estado"], normaliza)
+    municipios["ciudad_norm"] = por_valor_unico(municipios["ciudad"], normaliza)
+
+    # Duplicados: mismo nombre normalizado y misma coordenada redondeada
+    import pandas as pd
+
+    clave = pd.DataFrame({
+        "c": municipios["ciudad_norm"],
+        "e": municipios["estado_norm"],
+        "la": np.round(municipios["latitud"], DECIMALES_DUPLICADO),
+        "lo": np.round(municipios["longitud"], DECIMALES_DUPLICADO),
+    })
+    repetido = clave.duplicated().to_numpy()
+    reporte["duplicados"] = int(repetido.sum())
+    reporte["ejemplos_duplicados"] = _ejemplos(
+        f"{c} ({e})" for c, e in zip(municipios["ciudad"][repetido], municipios["estado"][repetido])
+    )
+    municipios = {nombre: valores[~repetido] for nombre, valores in municipios.items()}
+    homonimos = clave[~repetido].duplicated(["c", "e"], keep=False).to_numpy()
+    reporte["homonimos"] = int(homonimos.sum())
+    reporte["ejemplos_homonimos"] = _ejemplos(
+        sorted({f"{c} ({e})" for c, e in zip(municipios["ciudad"][homonimos], municipios["estado"][homonimos])})
+    )
+
+    alias_fila = _concilia_alias(municipios, alias, reporte)
+    sin_alias = np.array([a is None for a in alias_fila], dtype=bool)
+    alias_fila[sin_alias] = municipios["ciudad"][sin_alias] + "-" + municipios["estado"][sin_alias]
+    municipios["alias"] = alias_fila
+    _concilia_capitales(municipios, capitales, reporte)
+
+    reporte["municipios"] = len(municipios["ciudad"])
+    municipios["latitud"] = np.ascontiguousarray(municipios["latitud"], dtype=np.float64)
+    municipios["longitud"] = np.ascontiguousarray(municipios["longitud"], dtype=np.float64)
+    return municipios, reporte
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Valida y concilia los CSV de municipios (sin compilar)")
+    parser.add_argument("--fuente", default=CSV_MUNICIPIOS)
+    parser.add_argument("--alias", default=CSV_ALIAS)
+    parser.add_argument("--capitales", default=CSV_CAPITALES)
+    args = parser.parse_args(argv)
+    _, reporte = ingerir(args.fuente, args.alias, args.capitales)
+    print(json.dumps(reporte, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,311 @@
+import atexit
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from functools import wraps
+
+# Métricas por etapa del cotizador: carga del catálogo, búsqueda de filas,
+# distancia, tarificación, PDF y Excel.
+#
+# Cada etapa lleva un contador de llamadas, uno de errores y un histograma de
+# latencia con cubetas fijas. Apagadas (el valor por omisión) cuestan una
+# lectura de variable por llamada: etapa() devuelve un contexto vacío
+# compartido y las funciones decoradas con medido() llaman directo.
+#
+#   COTIZADOR_METRICAS=1                 enciende el registro
+#   COTIZADOR_METRICAS_ARCHIVO=m.prom    vuelca al salir (.prom Prometheus, si no JSON)
+#   COTIZADOR_TRAZA=traza.jsonl          un renglón por etapa con el id de solicitud
+#
+# El servicio HTTP las expone en GET /metricas; desde consola:
+#
+#   python metricas.py m.json --formato prometheus
+
+# Cubetas de latencia en segundos (estilo Prometheus, "le")
+CUBETAS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_VERDADERO = ("1", "true", "si", "sí", "on")
+
+
+class Histograma:
+    def __init__(self, cubetas=CUBETAS):
+        self.cubetas = cubetas
+        self.cuentas = [0] * (len(cubetas) + 1)
+        self.suma = 0.0
+        self.cuenta = 0
+
+    def observar(self, segundos):
+        self.cuentas[bisect_left(self.cubetas, segundos)] += 1
+        self.suma += segundos
+        self.cuenta += 1
+
+    def acumuladas(self):
+        return list(itertools.accumulate(self.cuentas))
+
+    def percentil(self, p):
+        # Límite superior de la cubeta donde cae el percentil p (0-100)
+        if not self.cuenta:
+            return None
+        objetivo = self.cuenta * p / 100
+        for limite, acumulado in zip(self.cubetas + (float("inf"),), self.acumuladas()):
+            if acumulado >= objetivo:
+                return limite
+        return float("inf")
+
+
+class RegistroMetricas:
+    def __init__(self):
+        self._candado = threading.Lock()
+        self.contadores = {}
+        self.errores = {}
+        self.histogramas = {}
+
+    def registrar(self, etapa, segundos, error=False):
+        with self._candado:
+            self.contadores[etapa] = self.contadores.get(etapa, 0) + 1
+            if error:
+                self.errores[etapa] = self.errores.get(etapa, 0) + 1
+            histograma = self.histogramas.get(etapa)
+            if histograma is None:
+                histograma = self.histogramas[etapa] = Histograma()
+            histograma.observar(segundos)
+
+    def contar(self, nombre, n=1):
+        with self._candado:
+            self.contadores[nombre] = self.contadores.get(nombre, 0) + n
+
+    def reiniciar(self):
+        with self._candado:
+            self.contadores.clear()
+            self.errores.clear()
+            self.histogramas.clear()
+
+    def a_json(self):
+        with self._candado:
+            etapas = {}
+            for nombre, total in sorted(self.contadores.items()):
+                datos = {"llamadas": total, "errores": self.errores.get(nombre, 0)}
+                histograma = self.histogramas.get(nombre)
+                if histograma is not None:
+                    datos.update({
+                        "segundos_total": round(histograma.suma, 6),
+                        "promedio_ms": round(histograma.suma / histograma.cuenta * 1000, 3),
+                        "p50_ms_max": _ms(histograma.percentil(50)),
+                        "p99_ms_max": _ms(histograma.percentil(99)),
+                        "cubetas": dict(zip([str(c) for c in histograma.cubetas] + ["+Inf"], histograma.acumuladas())),
+                    })
+                etapas[nombre] = datos
+            return {"activo": _activo, "etapas": etapas}
+
+    def a_prometheus(self, prefijo="cotizador"):
+        with self._candado:
+            renglones = [
+                f"# HELP {prefijo}_etapa_total Llamadas por etapa",
+                f"# TYPE {prefijo}_etapa_total counter",
+            ]
+            for nombre, total in sorted(self.contadores.items()):
+                renglones.append(f'{prefijo}_etapa_total{{etapa="{_etiqueta(nombre)}"}} {total}')
+            renglones += [
+                f"# HELP {prefijo}_etapa_errores_total Llamadas por etapa que terminaron en excepción",
+                f"# TYPE {prefijo}_etapa_errores_total counter",
+            ]
+            for nombre, total in sorted(self.errores.items()):
+                renglones.append(f'{prefijo}_etapa_errores_total{{etapa="{_etiqueta(nombre)}"}} {total}')
+            renglones += [
+                f"# HELP {prefijo}_etapa_segundos Latencia por etapa",
+                f"# TYPE {prefijo}_etapa_segundos histogram",
+            ]
+            for nombre, histograma in sorted(self.histogramas.items()):
+                etiqueta = _etiqueta(nombre)
+                for limite, acumulado in zip([repr(c) for c in histograma.cubetas] + ["+Inf"], histograma.acumuladas()):
+                    renglones.append(f'{prefijo}_etapa_segundos_bucket{{etapa="{etiqueta}",le="{limite}"}} {acumulado}')
+                renglones.append(f'{prefijo}_etapa_segundos_sum{{etapa="{etiqueta}"}} {histograma.suma!r}')
+                renglones.append(f'{prefijo}_etapa_segundos_count{{etapa="{etiqueta}"}} {histograma.cuenta}')
+            return "\n".join(renglones) + "\n"
+
+
+def _ms(segundos):
+    return None if segundos is None else (segundos * 1000 if segundos != float("inf") else None)
+
+
+def _etiqueta(texto):
+    return str(texto).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+REGISTRO = RegistroMetricas()
+
+_activo = os.environ.get("COTIZADOR_METRICAS", "").lower() in _VERDADERO
+_traza = None
+_candado_traza = threading.Lock()
+_solicitud = ContextVar("solicitud", default=None)
+_contador_solicitudes = itertools.count(1)
+
+
+def habilitar(activo=True, traza=None):
+    # Enciende/apaga el registro en caliente; traza es la ruta del log JSONL
+    # por solicitud (None la cierra)
+    global _activo, _traza
+    _activo = bool(activo)
+    with _candado_traza:
+        if _traza is not None:
+            _traza.close()
+            _traza = None
+        if traza:
+            _traza = open(traza, "a", encoding="utf-8", buffering=1)
+
+
+def activo():
+    return _activo
+
+
+def _escribe_traza(etapa, inicio_ns, segundos, error):
+    renglon = json.dumps({
+        "solicitud": _solicitud.get(),
+        "etapa": etapa,
+        "inicio": round(time.time() - (time.perf_counter_ns() - inicio_ns) / 1e9, 6),
+        "ms": round(segundos * 1000, 3),
+        "error": error,
+    }, ensure_ascii=False)
+    with _candado_traza:
+        if _traza is not None:
+            _traza.write(renglon + "\n")
+
+
+def _registra(etapa, inicio_ns, error):
+    segundos = (time.perf_counter_ns() - inicio_ns) / 1e9
+    REGISTRO.registrar(etapa, segundos, error)
+    if _traza is not None:
+        _escribe_traza(etapa, inicio_ns, segundos, error)
+
+
+class _Etapa:
+    __slots__ = ("nombre", "inicio")
+
+    def __init__(self, nombre):
+        self.nombre = nombre
+
+    def __enter__(self):
+        self.inicio = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, tipo, valor, rastreo):
+        _registra(self.nombre, self.inicio, tipo is not None)
+        return False
+
+
+class _Nula:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, valor, rastreo):
+        return False
+
+
+_NULA = _Nula()
+
+
+def etapa(nombre):
+    # with etapa("pdf"): ...
+    return _Etapa(nombre) if _activo else _NULA
+
+
+def medido(nombre):
+    # Decorador: mide cada llamada de la función como la etapa nombre
+    def decora(funcion):
+        @wraps(funcion)
+        def envoltura(*args, **kwargs):
+            if not _activo:
+                return funcion(*args, **kwargs)
+            inicio = time.perf_counter_ns()
+            error = True
+            try:
+                resultado = funcion(*args, **kwargs)
+                error = False
+                return resultado
+            finally:
+                _registra(nombre, inicio, error)
+        return envoltura
+    return decora
+
+
+class solicitud:
+    # Agrupa las etapas de una cotización bajo un id para la traza y mide el
+    # total como la etapa nombre
+    __slots__ = ("nombre", "ficha", "etapa")
+
+    def __init__(self, nombre="solicitud"):
+        self.nombre = nombre
+
+    def __enter__(self):
+        if not _activo:
+            self.ficha = None
+            return None
+        id_solicitud = f"{os.getpid()}-{next(_contador_solicitudes)}"
+        self.ficha = _solicitud.set(id_solicitud)
+        self.etapa = _Etapa(self.nombre).__enter__()
+        return id_solicitud
+
+    def __exit__(self, tipo, valor, rastreo):
+        if self.ficha is not None:
+            self.etapa.__exit__(tipo, valor, rastreo)
+            _solicitud.reset(self.ficha)
+        return False
+
+
+def volcar(destino, formato=None):
+    # Escribe el registro a un archivo (.prom -> texto Prometheus, si no JSON)
+    formato = formato or ("prometheus" if destino.endswith(".prom") else "json")
+    with open(destino, "w", encoding="utf-8") as f:
+        if formato == "prometheus":
+            f.write(REGISTRO.a_prometheus())
+        else:
+            json.dump(REGISTRO.a_json(), f, ensure_ascii=False, indent=2)
+
+
+if os.environ.get("COTIZADOR_TRAZA"):
+    habilitar(True, os.environ["COTIZADOR_TRAZA"])
+if _activo and os.environ.get("COTIZADOR_METRICAS_ARCHIVO"):
+    atexit.register(volcar, os.environ["COTIZADOR_METRICAS_ARCHIVO"])
+
+
+def main(argv=None):
+    import argparse
+    from collections import defaultdict
+
+    parser = argparse.ArgumentParser(description="Resume una traza JSONL de etapas del cotizador")
+    parser.add_argument("traza", help="archivo escrito con COTIZADOR_TRAZA")
+    parser.add_argument("--formato", choices=("tabla", "json", "prometheus"), default="tabla")
+    args = parser.parse_args(argv)
+
+    habilitar(True)
+    solicitudes = defaultdict(float)
+    with open(args.traza, encoding="utf-8") as f:
+        for renglon in f:
+            evento = json.loads(renglon)
+            REGISTRO.registrar(evento["etapa"], evento["ms"] / 1000, evento.get("error", False))
+            if evento.get("solicitud"):
+                solicitudes[evento["solicitud"]] = max(solicitudes[evento["solicitud"]], evento["ms"])
+    if args.formato == "json":
+        print(json.dumps(REGISTRO.a_json(), ensure_ascii=False, indent=2))
+    elif args.formato == "prometheus":
+        print(REGISTRO.a_prometheus(), end="")
+    else:
+        for nombre, datos in REGISTRO.a_json()["etapas"].items():
+            print(
+                f"{nombre:28s} {datos['llamadas']:>8,} llamadas  {datos['errores']:>5,} errores  "
+                f"prom. {datos['promedio_ms']:>10,.3f} ms  p99 <= {datos['p99_ms_max'] or float('inf'):>8,.1f} ms"
+            )
+        if solicitudes:
+            lentas = sorted(solicitudes.items(), key=lambda par: -par[1])[:5]
+            print("Solicitudes más lentas: " + ", ".join(f"{s} ({ms:,.1f} ms)" for s, ms in lentas))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,195 @@
+import io
+import os
+import sys
+
+
+# Render de cotizaciones a PDF en memoria.
+#
+# Cada formato de cotización es una Plantilla: el título y la lista de campos
+# se compilan una sola vez y el render sólo escribe los valores. El PDF sale
+# como bytes, listo para st.download_button o para una respuesta HTTP, sin
+# archivo temporal. renderizar_lote reparte muchas cotizaciones entre
+# procesos (un PDF por cotización) o las junta en un solo PDF de varias páginas.
+
+ANCHO = 200
+ALTO_RENGLON = 10
+
+
+class Campo:
+    def __init__(self, etiqueta, llave=None, formato="{}", multilinea=False, solo_con_valor=False):
+        self.etiqueta = etiqueta
+        self.llave = llave or etiqueta
+        self.formato = formato
+        self.multilinea = multilinea
+        self.solo_con_valor = solo_con_valor
+
+    def texto(self, cotizacion):
+        valor = cotizacion.get(self.llave, "")
+        if self.solo_con_valor and not valor:
+            return None
+        try:
+            valor = self.formato.format(valor)
+        except (ValueError, TypeError):
+            valor = str(valor)
+        return f"{self.etiqueta}: {valor}"
+
+
+class Plantilla:
+    # campos=None imprime todas las llaves de la cotización en orden
+    def __init__(self, titulo=None, campos=None, estilo_titulo="", tam_titulo=12, espacio_titulo=0):
+        self.titulo = titulo
+        self.campos = tuple(campos) if campos is not None else None
+        self.estilo_titulo = estilo_titulo
+        self.tam_titulo = tam_titulo
+        self.espacio_titulo = espacio_titulo
+
+    def _documento(self):
+        # fpdf se importa al primer PDF, no al importar el módulo
+        from fpdf import FPDF
+
+        pdf = FPDF()
+        # Los PDF son de una página de texto; comprimir cuesta más de lo que ahorra
+        pdf.set_compression(False)
+        return pdf
+
+    def _pagina(self, pdf, cotizacion):
+        from fpdf.enums import XPos, YPos
+
+        pdf.add_page()
+        if self.titulo:
+            pdf.set_font("helvetica", self.estilo_titulo, self.tam_titulo)
+            pdf.cell(ANCHO, ALTO_RENGLON, text=self.titulo, new_x=XPos.LMARGIN, new_y=YPos.NEXT, align="C")
+            if self.espacio_titulo:
+                pdf.ln(self.espacio_titulo)
+        pdf.set_font("helvetica", "", 12)
+        if self.campos is None:
+            renglones = ((f"{clave}: {valor}", False) for clave, valor in cotizacion.items())
+        else:
+            renglones = ((campo.texto(cotizacion), campo.multilinea) for campo in self.campos)
+        for texto, multilinea in renglones:
+            if texto is None:
+                continue
+            if multilinea:
+                pdf.multi_cell(ANCHO, ALTO_RENGLON, text=texto, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+            else:
+                pdf.cell(ANCHO, ALTO_RENGLON, text=texto, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+
+    def renderizar(self, cotizacion):
+        pdf = self._documento()
+        self._pagina(pdf, cotizacion)
+        return bytes(pdf.output())
+
+    def renderizar_combinado(self, cotizaciones):
+        # Un solo PDF con una página por cotización
+        pdf = self._documento()
+        for cotizacion in cotizaciones:
+            self._pagina(pdf, cotizacion)
+        return bytes(pdf.output())
+
+
+# Formato de app.py
+PLANTILLA_FLETES = Plantilla(
+    "Cotización de Transporte",
+    [
+        Campo("Fecha de cotización", "Fecha cotización"),
+        Campo("Cliente"),
+        Campo("Servicio"),
+        Campo("Origen"),
+        Campo("Destino"),
+        Campo("Distancia", "Distancia (km)", "{} km"),
+        Campo("Tipo de unidad"),
+        Campo("Peso/Volumen", "Peso/Vol (Ton)"),
+        Campo("Volumen (m3)", solo_con_valor=True),
+        Campo("Costo total", "Costo Total MXN", "${:,.2f}"),
+        Campo("Observaciones", multilinea=True),
+        Campo("Fecha de servicio"),
+    ],
+    espacio_titulo=10,
+)
+
+# Formato de cotizador_fletes.py: igual, más el detalle del cálculo
+PLANTILLA_FLETES_DETALLE = Plantilla(
+    PLANTILLA_FLETES.titulo,
+    PLANTILLA_FLETES.campos[:10] + (Campo("Detalle", multilinea=True),) + PLANTILLA_FLETES.campos[10:],
+    espacio_titulo=10,
+)
+
+# Formato de app_actualizada.py: título en negritas y todas las llaves
+PLANTILLA_SERVICIO = Plantilla("Cotización de Servicio de Transporte", estilo_titulo="B", tam_titulo=14)
+
+# Formato de cotizador_transporte.py: sólo las llaves
+PLANTILLA_SIMPLE = Plantilla()
+
+PLANTILLAS = {
+    "fletes": PLANTILLA_FLETES,
+    "fletes_detalle": PLANTILLA_FLETES_DETALLE,
+    "servicio": PLANTILLA_SERVICIO,
+    "simple": PLANTILLA_SIMPLE,
+}
+
+
+def _renderiza_bloque(nombre_plantilla, cotizaciones):
+    plantilla = PLANTILLAS[nombre_plantilla]
+    return [plantilla.renderizar(c) for c in cotizaciones]
+
+
+def renderizar_lote(cotizaciones, plantilla="fletes", combinado=False, procesos=None, tam_bloque=64):
+    # Devuelve una lista de PDFs (bytes) en el mismo orden, o un solo PDF de
+    # varias páginas si combinado=True. El modo individual se reparte entre
+    # procesos por bloques; el combinado es un solo documento y se arma en
+    # este proceso.
+    cotizaciones = list(cotizaciones)
+    if combinado:
+        return PLANTILLAS[plantilla].renderizar_combinado(cotizaciones)
+    procesos = procesos or os.cpu_count() or 1
+    if procesos == 1 or len(cotizaciones) <= tam_bloque:
+        return _renderiza_bloque(plantilla, cotizaciones)
+    from concurrent.futures import ProcessPoolExecutor
+
+    bloques = [cotizaciones[i:i + tam_bloque] for i in range(0, len(cotizaciones), tam_bloque)]
+    with ProcessPoolExecutor(procesos) as grupo:
+        resultados = grupo.map(_renderiza_bloque, [plantilla] * len(bloques), bloques)
+        return [pdf for bloque in resultados for pdf in bloque]
+
+
+def empaquetar_zip(pdfs, nombres):
+    # Junta PDFs individuales en un zip en memoria (para una sola descarga)
+    import zipfile
+
+    salida = io.BytesIO()
+    with zipfile.ZipFile(salida, "w", zipfile.ZIP_STORED) as archivo:
+        for nombre, pdf in zip(nombres, pdfs):
+            archivo.writestr(nombre, pdf)
+    return salida.getvalue()
+
+
+def main(argv=None):
+    import argparse
+
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(description="Genera PDFs de cotizaciones desde un CSV o Excel")
+    parser.add_argument("entrada")
+    parser.add_argument("salida", help="archivo .pdf (combinado) o .zip (un PDF por cotización)")
+    parser.add_argument("--plantilla", default="simple", choices=sorted(PLANTILLAS))
+    parser.add_argument("--procesos", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    if args.entrada.lower().endswith((".xlsx", ".xls")):
+        df = pd.read_excel(args.entrada)
+    else:
+        df = pd.read_csv(args.entrada)
+    cotizaciones = df.fillna("").to_dict(orient="records")
+    if args.salida.lower().endswith(".pdf"):
+        datos = renderizar_lote(cotizaciones, args.plantilla, combinado=True)
+    else:
+        pdfs = renderizar_lote(cotizaciones, args.plantilla, procesos=args.procesos)
+        datos = empaquetar_zip(pdfs, [f"cotizacion_{i + 1:06d}.pdf" for i in range(len(pdfs))])
+    with open(args.salida, "wb") as f:
+        f.write(datos)
+    print(f"{len(cotizaciones)} cotizaciones -> {args.salida}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,311 @@
+import glob
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from bitacora import RUTA_BITACORA
+from cotizacion import precios_lote
+from tarifas import RUTA_TARIFAS, Tarifario, obtener_tarifario
+
+# Recotización "qué pasaría si" del historial de cotizaciones.
+#
+# Carga el historial (por omisión la bitácora SQLite de las apps; también
+# Excel diarios exportados de ella o una exportación del historial de la
+# sesión en xlsx/csv/parquet), lo normaliza a columnas y lo vuelve a cotizar completo con
+# precios_lote (las reglas de cotizar_servicio vectorizadas) bajo el tarifario
+# vigente y bajo cada tarifario candidato. El reporte compara ingresos por
+# carril, por servicio y por banda de distancia.
+#
+# Un candidato es un JSON con el formato de tarifas.json; basta con las llaves
+# que cambian (p. ej. sólo "ltl"), el resto se toma del tarifario base.
+#
+#   python recotizar.py propuesta_ltl.json --salida impacto.xlsx
+#   python recotizar.py a.json b.json --historial export_sesion.parquet
+#   python recotizar.py a.json --historial "BaseCotizaciones/cotizaciones_*.xlsx"
+
+# Nombres de servicio de las apps a las reglas del tarifario
+SERVICIOS = {
+    "FTL": "FTL",
+    "LTL": "LTL",
+    "MUDANZA": "MUDANZA",
+    "LTL (CONSOLIDADO)": "LTL",
+}
+
+# Columnas de las apps (app.py, cotizador_fletes.py, cotizador_transporte.py)
+# a las del historial normalizado
+COLUMNAS = {
+    "servicio": ("Servicio", "Tipo de Flete"),
+    "origen": ("Origen",),
+    "destino": ("Destino",),
+    "distancia": ("Distancia (km)",),
+    "peso_vol": ("Peso/Vol (Ton)",),
+    "volumen_m3": ("Volumen (m3)",),
+    "unidad": ("Tipo de unidad",),
+    "costo": ("Costo Total MXN", "Costo Total"),
+}
+
+
+def _leer(ruta):
+    import pandas as pd
+
+    extension = os.path.splitext(ruta)[1].lower()
+    if extension in (".xlsx", ".xls"):
+        # Los Excel largos se parten en varias hojas (exportacion.MAX_RENGLONES_HOJA)
+        return pd.concat(pd.read_excel(ruta, sheet_name=None).values(), ignore_index=True)
+    if extension in (".parquet", ".pq"):
+        return pd.read_parquet(ruta)
+    if extension in (".sqlite", ".db"):
+        from bitacora import leer_cotizaciones
+
+        return leer_cotizaciones(ruta=ruta)
+    return pd.read_csv(ruta, encoding="utf-8")
+
+
+def archivos_historial(rutas):
+    # Archivos existentes de cada ruta o patrón glob, en orden
+    if isinstance(rutas, (str, os.PathLike)):
+        rutas = [rutas]
+    archivos = []
+    for patron in rutas:
+        archivos.extend(sorted(glob.glob(os.fspath(patron))))
+    return archivos
+
+
+def cargar_historial(rutas=RUTA_BITACORA):
+    # rutas: una ruta o patrón glob, o una lista de ellas. Sin archivos que
+    # leer es FileNotFoundError (la bitácora no se crea vacía al leerla)
+    import pandas as pd
+
+    archivos = archivos_historial(rutas)
+    if not archivos:
+        raise FileNotFoundError(f"No hay historial en {rutas}")
+    return pd.concat([_leer(ruta) for ruta in archivos], ignore_index=True)
+
+
+def _columna(df, nombres, defecto=None):
+    # Primer valor no vacío entre los nombres alternativos (un historial
+    # puede juntar archivos de varias apps)
+    import pandas as pd
+
+    columna = pd.Series(defecto, index=df.index, dtype=object)
+    for nombre in reversed(nombres):
+        if nombre in df:
+            valores = df[nombre].astype(object)
+            columna = valores.where(valores.notna() & (valores != ""), columna)
+    return columna
+
+
+def _numeros(serie):
+    import pandas as pd
+
+    # "" (campo que no aplica al servicio) queda como NaN
+    return pd.to_numeric(serie, errors="coerce").to_numpy(dtype=np.float64, copy=True)
+
+
+def normalizar_historial(df, base=None):
+    # Columnas servicio (FTL/LTL/MUDANZA, None si no tiene regla en el
+    # tarifario), etiqueta_servicio, origen, destino, distancia, peso_vol,
+    # volumen_m3, maniobras y costo (el registrado).
+    #
+    # Lo que el historial no guarda se deduce con el tarifario base, con el
+    # que se cotizó: el peso de una unidad sin Peso/Vol se toma del "Tipo de
+    # unidad", las maniobras de una mudanza son el costo menos el precio de la
+    # unidad, y el volumen LTL sin "Volumen (m3)" es costo / tarifa por m3.
+    # El FTL de cotizador_transporte (tarifa LTL de la distancia por viaje) se
+    # recotiza como LTL de 1 m3.
+    import pandas as pd
+
+    base = base or obtener_tarifario()
+    etiqueta = _columna(df, COLUMNAS["servicio"], "").fillna("").astype(str)
+    servicio = etiqueta.str.strip().str.upper().map(SERVICIOS)
+    servicio = servicio.astype(object).where(servicio.notna(), None).to_numpy(dtype=object, copy=True)
+
+    distancia = _numeros(_columna(df, COLUMNAS["distancia"]))
+    peso_vol = _numeros(_columna(df, COLUMNAS["peso_vol"]))
+    volumen_m3 = _numeros(_columna(df, COLUMNAS["volumen_m3"]))
+    costo = _numeros(_columna(df, COLUMNAS["costo"]))
+
+    es_ftl_viaje = (etiqueta.str.strip().str.upper() == "FTL (COMPLETO)").to_numpy()
+    servicio[es_ftl_viaje] = "LTL"
+    volumen_m3[es_ftl_viaje] = 1.0
+
+    es_ltl = servicio == "LTL"
+    con_unidad = (servicio == "FTL") | (servicio == "MUDANZA")
+
+    # Peso representativo de cada unidad: su tope (la última no tiene)
+    sin_peso = con_unidad & np.isnan(peso_vol)
+    if sin_peso.any():
+        topes = np.append(base.limites_peso, np.inf)
+        peso_unidad = {nombre: topes[i] for i, nombre in enumerate(base.unidades)}
+        unidad = _columna(df, COLUMNAS["unidad"], "").astype(str).str.strip()
+        peso_vol[sin_peso] = unidad[sin_peso].map(peso_unidad).to_numpy(dtype=np.float64)
+
+    sin_volumen = es_ltl & np.isnan(volumen_m3)
+    if sin_volumen.any():
+        volumen_m3[sin_volumen] = costo[sin_volumen] / base.tarifa_ltl(np.nan_to_num(distancia[sin_volumen]))
+
+    maniobras = np.zeros(len(df))
+    es_mudanza = servicio == "MUDANZA"
+    if es_mudanza.any():
+        _, sin_maniobras, _ = precios_lote(
+            np.nan_to_num(distancia[es_mudanza]), np.full(es_mudanza.sum(), "FTL", dtype=object),
+            np.nan_to_num(peso_vol[es_mudanza]), 0.0, 0.0, base,
+        )
+        maniobras[es_mudanza] = np.maximum(np.nan_to_num(costo[es_mudanza] - sin_maniobras), 0.0)
+
+    # Sin distancia o sin peso/volumen no hay con qué recotizar
+    valida = ~np.isnan(distancia) & np.array([s is not None for s in servicio], dtype=bool)
+    valida &= np.where(es_ltl, ~np.isnan(volumen_m3), ~np.isnan(peso_vol))
+    servicio[~valida] = None
+
+    return pd.DataFrame({
+        "servicio": servicio,
+        "etiqueta_servicio": etiqueta.to_numpy(dtype=object),
+        "origen": _columna(df, COLUMNAS["origen"], "").fillna("").astype(str).to_numpy(dtype=object),
+        "destino": _columna(df, COLUMNAS["destino"], "").fillna("").astype(str).to_numpy(dtype=object),
+        "distancia": distancia,
+        "peso_vol": np.nan_to_num(peso_vol),
+        "volumen_m3": np.nan_to_num(volumen_m3),
+        "maniobras": maniobras,
+        "costo": costo,
+    })
+
+
+def tarifario_candidato(ruta, base=None):
+    # JSON completo o parcial: las llaves ausentes se toman del base
+    import hashlib
+
+    base = base or obtener_tarifario()
+    with open(ruta, "rb") as f:
+        contenido = f.read()
+    datos = {**base.datos, **json.loads(contenido)}
+    return Tarifario(datos, hashlib.sha256(contenido).hexdigest())
+
+
+def recotizar(historial, tarifario):
+    # Costo de cada renglón del historial normalizado bajo el tarifario (NaN
+    # en los renglones sin regla)
+    servicio = historial["servicio"].to_numpy(dtype=object)
+    validas = np.array([s is not None for s in servicio], dtype=bool)
+    costo = np.full(len(historial), np.nan)
+    if validas.any():
+        _, costo[validas], _ = precios_lote(
+            historial["distancia"].to_numpy()[validas], servicio[validas],
+            historial["peso_vol"].to_numpy()[validas], historial["maniobras"].to_numpy()[validas],
+            historial["volumen_m3"].to_numpy()[validas], tarifario,
+        )
+    return costo
+
+
+def bandas_distancia(distancia, tarifario):
+    # Nombre e índice de la banda LTL del tarifario base de cada distancia
+    indices = tarifario.indice_banda_ltl(np.nan_to_num(distancia))
+    return np.asarray(tarifario.nombres_ltl, dtype=object)[indices], indices
+
+
+def reporte_impacto(historial, base, candidatos):
+    # candidatos: {nombre: Tarifario}. Devuelve {"resumen", "servicio",
+    # "banda", "carril"}: DataFrames con cotizaciones, ingreso registrado,
+    # ingreso con el tarifario base y, por candidato, ingreso, delta y delta %.
+    valida = historial["servicio"].notna().to_numpy()
+    datos = historial.loc[valida, ["servicio", "etiqueta_servicio", "origen", "destino", "distancia", "costo"]].copy()
+    datos["banda"], datos["orden_banda"] = bandas_distancia(datos["distancia"].to_numpy(), base)
+    datos["carril"] = datos["origen"] + " -> " + datos["destino"]
+    datos["ingreso_base"] = recotizar(historial, base)[valida]
+    for nombre, tarifario in candidatos.items():
+        datos[f"ingreso_{nombre}"] = recotizar(historial, tarifario)[valida]
+
+    sumas = ["costo", "ingreso_base"] + [f"ingreso_{nombre}" for nombre in candidatos]
+
+    def agrega(llaves):
+        tabla = datos.groupby(llaves, sort=False).agg(cotizaciones=("costo", "size"), **{c: (c, "sum") for c in sumas})
+        tabla = tabla.rename(columns={"costo": "ingreso_registrado"})
+        for nombre in candidatos:
+            delta = tabla[f"ingreso_{nombre}"] - tabla["ingreso_base"]
+            tabla[f"delta_{nombre}"] = delta.round(2)
+            tabla[f"delta_pct_{nombre}"] = (100 * delta / tabla["ingreso_base"].where(tabla["ingreso_base"] != 0)).round(2)
+        return tabla
+
+    datos["total"] = "Total"
+    reporte = {
+        "resumen": agrega(["total"]),
+        "servicio": agrega(["etiqueta_servicio"]),
+        "banda": agrega(["orden_banda", "banda"]).sort_index().droplevel("orden_banda"),
+        "carril": agrega(["carril"]),
+    }
+    if candidatos:
+        # Los carriles más afectados primero
+        primero = next(iter(candidatos))
+        reporte["carril"] = reporte["carril"].sort_values(f"delta_{primero}", key=np.abs, ascending=False)
+    else:
+        reporte["carril"] = reporte["carril"].sort_values("cotizaciones", ascending=False)
+    reporte["resumen"].attrs["omitidas"] = int((~valida).sum())
+    return reporte
+
+
+def guardar_reporte(reporte, destino):
+    # .xlsx: una hoja por agrupación; otra extensión: un CSV por agrupación
+    # (destino_servicio.csv, destino_banda.csv, ...)
+    import pandas as pd
+
+    os.makedirs(os.path.dirname(destino) or ".", exist_ok=True)
+    if destino.lower().endswith((".xlsx", ".xls")):
+        with pd.ExcelWriter(destino) as libro:
+            for nombre, tabla in reporte.items():
+                tabla.to_excel(libro, sheet_name=nombre)
+        return [destino]
+    raiz, extension = os.path.splitext(destino)
+    rutas = []
+    for nombre, tabla in reporte.items():
+        ruta = f"{raiz}_{nombre}{extension or '.csv'}"
+        tabla.to_csv(ruta, encoding="utf-8")
+        rutas.append(ruta)
+    return rutas
+
+
+def main(argv=None):
+    import argparse
+
+    import pandas as pd
+
+    parser = argparse.ArgumentParser(description="Recotiza el historial con tarifarios candidatos")
+    parser.add_argument("candidatos", nargs="*", help="JSON de tarifas candidatas (completos o sólo lo que cambia)")
+    parser.add_argument("--historial", nargs="+", default=[RUTA_BITACORA],
+                        help="bitácora .sqlite (por omisión) o xlsx/csv/parquet, también patrones glob")
+    parser.add_argument("--tarifas", default=RUTA_TARIFAS, help="tarifario base")
+    parser.add_argument("--salida", default=None, help="reporte .xlsx o .csv")
+    parser.add_argument("--carriles", type=int, default=10, help="carriles a mostrar en pantalla")
+    args = parser.parse_args(argv)
+
+    inicio = time.perf_counter()
+    base = obtener_tarifario(args.tarifas)
+    candidatos = {}
+    for ruta in args.candidatos:
+        nombre = os.path.splitext(os.path.basename(ruta))[0]
+        candidatos[nombre] = tarifario_candidato(ruta, base)
+    try:
+        historial = cargar_historial(args.historial)
+    except FileNotFoundError as error:
+        parser.error(str(error))
+    leido = time.perf_counter()
+    normalizado = normalizar_historial(historial, base)
+    reporte = reporte_impacto(normalizado, base, candidatos)
+    fin = time.perf_counter()
+
+    print(f"{len(historial):,} cotizaciones leídas en {leido - inicio:.1f} s, "
+          f"recotizadas en {fin - leido:.2f} s ({reporte['resumen'].attrs['omitidas']:,} sin regla del tarifario)")
+    with pd.option_context("display.width", 160, "display.max_columns", None, "display.float_format", "{:,.2f}".format):
+        for nombre in ("resumen", "servicio", "banda"):
+            print(f"\n{reporte[nombre]}")
+        print(f"\n{reporte['carril'].head(args.carriles)}")
+    if args.salida:
+        for ruta in guardar_reporte(reporte, args.salida):
+            print(ruta)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,206 @@
+import sys
+import time
+
+import numpy as np
+
+from catalogo import abrir_catalogo, CSV_MUNICIPIOS
+from distancias import distancias_municipios
+from tarifas import obtener_tarifario
+
+# Planeación de rutas de reparto con varias paradas (milk runs LTL).
+#
+# Un origen y un conjunto de municipios destino: la secuencia se arma con
+# vecino más cercano y se mejora con 2-opt (invertir un tramo) y Or-opt
+# (mover un bloque de 1 a 3 paradas, al derecho o al revés) hasta que ningún
+# movimiento acorta la ruta. Cada pasada evalúa todos los movimientos de una
+# vez con numpy sobre la submatriz de distancias de las paradas, así que unos
+# cientos de paradas se resuelven en milisegundos.
+#
+# Sin regreso (ruta abierta) se trabaja como circuito con el regreso al
+# origen gratis: todas las fórmulas de movimientos sirven igual.
+
+MAX_PASADAS = 10_000
+
+
+def matriz_paradas(catalogo, filas, modo=None):
+    # Submatriz de distancias (km) entre las filas dadas, desde la matriz del
+    # modo del tarifario (geodésica o por carretera)
+    modo = modo or obtener_tarifario().modo_distancia
+    filas = np.asarray(filas, dtype=np.intp)
+    m = len(filas)
+    km = distancias_municipios(catalogo, np.repeat(filas, m), np.tile(filas, m), modo)
+    return km.reshape(m, m)
+
+
+def longitud_recorrido(distancias, recorrido, regreso=False):
+    tramos = distancias[recorrido[:-1], recorrido[1:]]
+    total = float(tramos.sum())
+    if regreso:
+        total += float(distancias[recorrido[-1], recorrido[0]])
+    return total
+
+
+def vecino_mas_cercano(distancias):
+    # Recorrido desde la posición 0 visitando siempre la parada libre más cercana
+    m = len(distancias)
+    recorrido = np.empty(m, dtype=np.intp)
+    recorrido[0] = 0
+    libres = np.ones(m, dtype=bool)
+    libres[0] = False
+    for paso in range(1, m):
+        fila = np.where(libres, distancias[recorrido[paso - 1]], np.inf)
+        recorrido[paso] = int(np.argmin(fila))
+        libres[recorrido[paso]] = False
+    return recorrido
+
+
+def _mejores_2opt(distancias, recorrido, tolerancia):
+    # Inversiones recorrido[i..j] (1 <= i < j) que acortan la ruta: la mejor
+    # de cada i, y de ésas un conjunto que no comparte aristas, para aplicar
+    # varias en la misma pasada
+    m = len(recorrido)
+    siguiente = np.roll(recorrido, -1)
+    a, b = recorrido[:-1], recorrido[1:]          # arista que entra en i: a -> b
+    c, d = recorrido[1:], siguiente[1:]           # arista que sale de j: c -> d
+    delta = (
+        distancias[a[:, None], c[None, :]] + distancias[b[:, None], d[None, :]]
+        - distancias[a, b][:, None] - distancias[c, d][None, :]
+    )
+    # Fila k corresponde a i = k + 1 y columna l a j = l + 1; sólo j > i
+    delta[np.tril_indices(m - 1)] = 0.0
+    mejor_j = np.argmin(delta, axis=1)
+    mejor = delta[np.arange(m - 1), mejor_j]
+    movimientos = []
+    ocupado = np.zeros(m + 1, dtype=bool)
+    for k in np.argsort(mejor):
+        if mejor[k] >= -tolerancia:
+            break
+        i, j = k + 1, mejor_j[k] + 1
+        if not ocupado[i - 1:j + 2].any():
+            ocupado[i - 1:j + 2] = True
+            movimientos.append((i, j))
+    return movimientos
+
+
+def _mejor_or_opt(distancias, recorrido, largo):
+    # Mejor traslado del bloque recorrido[i:i+largo] entre recorrido[j] y el
+    # siguiente, al derecho o al revés; devuelve (delta, i, j, al_reves)
+    m = len(recorrido)
+    if m - 1 <= largo:
+        return 0.0, 0, 0, False
+    siguiente = np.roll(recorrido, -1)
+    inicios = np.arange(1, m - largo + 1)
+    primero, ultimo = recorrido[inicios], recorrido[inicios + largo - 1]
+    antes, despues = recorrido[inicios - 1], siguiente[inicios + largo - 1]
+    ahorro = distancias[antes, primero] + distancias[ultimo, despues] - distancias[antes, despues]
+
+    p, q = recorrido, siguiente                   # insertar en la arista p[j] -> q[j]
+    base = distancias[p, q][None, :]
+    directo = distancias[p[None, :], primero[:, None]] + distancias[ultimo[:, None], q[None, :]] - base
+    reves = distancias[p[None, :], ultimo[:, None]] + distancias[primero[:, None], q[None, :]] - base
+    delta = np.minimum(directo, reves) - ahorro[:, None]
+    # La arista destino no puede tocar el bloque
+    j = np.arange(m)[None, :]
+    i = inicios[:, None]
+    delta[(j >= i - 1) & (j <= i + largo - 1)] = np.inf
+    k, jj = np.unravel_index(np.argmin(delta), delta.shape)
+    return float(delta[k, jj]), int(inicios[k]), int(jj), bool(reves[k, jj] < directo[k, jj])
+
+
+def _aplica_or_opt(recorrido, i, j, largo, al_reves):
+    bloque = recorrido[i:i + largo]
+    if al_reves:
+        bloque = bloque[::-1]
+    resto = np.concatenate([recorrido[:i], recorrido[i + largo:]])
+    # j es posición en el recorrido original; en resto se corre si estaba después del bloque
+    destino = j if j < i else j - largo
+    return np.concatenate([resto[:destino + 1], bloque, resto[destino + 1:]])
+
+
+def mejora_recorrido(distancias, recorrido, tolerancia=1e-9, max_pasadas=MAX_PASADAS):
+    # 2-opt y Or-opt hasta un óptimo local: primero todas las inversiones que
+    # mejoran; cuando ya no hay, el mejor traslado de bloque
+    recorrido = recorrido.copy()
+    for _ in range(max_pasadas):
+        if len(recorrido) < 3:
+            break
+        movimientos = _mejores_2opt(distancias, recorrido, tolerancia)
+        if movimientos:
+            for i, j in movimientos:
+                recorrido[i:j + 1] = recorrido[i:j + 1][::-1]
+            continue
+        mejor = min((_mejor_or_opt(distancias, recorrido, largo) + (largo,) for largo in (1, 2, 3)),
+                    key=lambda movimiento: movimiento[0])
+        delta, i, j, al_reves, largo = mejor
+        if delta < -tolerancia:
+            recorrido = _aplica_or_opt(recorrido, i, j, largo, al_reves)
+            continue
+        break
+    return recorrido
+
+
+def planear_ruta(catalogo, fila_origen, filas_destino, regreso=False, modo=None):
+    # Secuencia de paradas casi óptima desde fila_origen. Devuelve dict con
+    # la secuencia de filas (empieza en el origen), km por tramo y total.
+    paradas = [int(fila_origen)]
+    vistas = {paradas[0]}
+    for fila in filas_destino:
+        if int(fila) not in vistas:
+            vistas.add(int(fila))
+            paradas.append(int(fila))
+    paradas = np.asarray(paradas, dtype=np.intp)
+
+    reales = matriz_paradas(catalogo, paradas, modo)
+    # Las mejoras suponen distancias simétricas (con la red carretera puede
+    # haber sentidos únicos); el total se mide con las reales
+    distancias = (reales + reales.T) / 2
+    if not regreso:
+        distancias[:, 0] = 0.0
+
+    recorrido = mejora_recorrido(distancias, vecino_mas_cercano(distancias))
+    if regreso:
+        recorrido = np.append(recorrido, 0)
+    tramos = reales[recorrido[:-1], recorrido[1:]]
+    return {
+        "secuencia": paradas[recorrido].tolist(),
+        "tramos_km": np.round(tramos, 2).tolist(),
+        "distancia_km": round(float(tramos.sum()), 2),
+        "regreso": regreso,
+    }
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Ordena las paradas de una ruta de reparto")
+    parser.add_argument("origen", help='"Ciudad (Estado)"')
+    parser.add_argument("destinos", nargs="*", help='"Ciudad (Estado)" de cada parada')
+    parser.add_argument("--archivo", help="archivo de texto con un destino por renglón")
+    parser.add_argument("--regreso", action="store_true", help="la ruta termina en el origen")
+    parser.add_argument("--fuente", default=CSV_MUNICIPIOS)
+    args = parser.parse_args(argv)
+
+    catalogo = abrir_catalogo(args.fuente)
+    indice = catalogo.indice()
+    etiquetas = list(args.destinos)
+    if args.archivo:
+        with open(args.archivo, encoding="utf-8") as f:
+            etiquetas += [renglon.strip() for renglon in f if renglon.strip()]
+    filas = []
+    for etiqueta in [args.origen] + etiquetas:
+        fila = indice.buscar_etiqueta(etiqueta)
+        if fila is None:
+            parser.error(f"No se encontró el municipio {etiqueta!r} en el catálogo")
+        filas.append(fila)
+
+    inicio = time.perf_counter()
+    ruta = planear_ruta(catalogo, filas[0], filas[1:], args.regreso)
+    milisegundos = (time.perf_counter() - inicio) * 1000
+    for orden, (fila, km) in enumerate(zip(ruta["secuencia"], [0.0] + ruta["tramos_km"])):
+        print(f"{orden:4d}  {km:9.2f} km  {catalogo.etiqueta(fila, limpio=True)}")
+    print(f"{len(ruta['secuencia']) - 1} paradas, {ruta['distancia_km']:,.2f} km en {milisegundos:.0f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,362 @@
+import asyncio
+import json
+import sys
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from alcance import alcance
+from cache_cotizaciones import CACHE
+from catalogo import abrir_catalogo, CSV_MUNICIPIOS
+from cotizacion import cotizar_envio, cotizar_lote
+from distancias import abrir_matriz, distancia_coordenadas, distancia_municipios
+from metricas import REGISTRO, activo, solicitud
+from rutas import planear_ruta
+from tarifas import obtener_tarifario
+
+# Servicio HTTP sin interfaz para cotizar desde el TMS o el checkout.
+#
+#   GET  /salud                    versiones de catálogo y tarifario, caché
+#   GET  /metricas[?formato=prometheus]   contadores y latencias por etapa
+#   GET  /distancia?origen=&destino=[&modo=]   (o lat1, lon1, lat2, lon2)
+#   GET  /municipios?q=&k=         sugerencias para autocompletar
+#   GET  /cercanos?lat=&lon=&k=    municipios más cercanos a una coordenada
+#   GET  /alcance?origen=[&banda=|&km=|&precio=&servicio=&peso_vol=&volumen_m3=]
+#                                  destinos por banda LTL, radio o precio máximo
+#   POST /cotizar                  {"origen", "destino", "servicio", ...}
+#                                  (o origen_lat/origen_lon, destino_lat/destino_lon)
+#   POST /cotizar/lote             {"envios": [{...}, ...]}
+#   POST /ruta                     {"origen", "destinos": [...], "regreso": false}
+#
+# El catálogo, el índice y la matriz se cargan una sola vez al arrancar. Una
+# cotización individual es sólo búsquedas en dict y la matriz, así que se
+# resuelve en el lazo de eventos; los lotes se mandan a un hilo aparte para no
+# bloquear a los demás clientes.
+
+MAX_CUERPO = 64 * 1024 * 1024
+ESTADOS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           411: "Length Required", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class Texto(str):
+    # Respuesta en texto plano (formato de exposición de Prometheus)
+    pass
+
+
+class ErrorHTTP(Exception):
+    def __init__(self, estado, mensaje):
+        super().__init__(mensaje)
+        self.estado = estado
+
+
+class ServicioCotizador:
+    def __init__(self, fuente=CSV_MUNICIPIOS):
+        self.catalogo = abrir_catalogo(fuente)
+        self.catalogo.indice()
+        self.catalogo.buscador()
+        self.catalogo.espacial()
+        abrir_matriz(self.catalogo)
+        obtener_tarifario()
+
+    # ---------------- rutas ----------------
+
+    def salud(self, consulta, cuerpo):
+        return {
+            "estado": "ok",
+            "municipios": self.catalogo.n,
+            "catalogo": self.catalogo.version,
+            "tarifario": obtener_tarifario().version,
+            "modo_distancia": obtener_tarifario().modo_distancia,
+            "matriz": abrir_matriz(self.catalogo) is not None,
+            "cache": CACHE.estadisticas(),
+        }
+
+    def metricas(self, consulta, cuerpo):
+        if consulta.get("formato", ["json"])[0] == "prometheus":
+            return Texto(REGISTRO.a_prometheus())
+        return REGISTRO.a_json()
+
+    def distancia(self, consulta, cuerpo):
+        parametros = {k: v[0] for k, v in consulta.items()}
+        if "origen" in parametros and "destino" in parametros:
+            indice = self.catalogo.indice()
+            fila_o = indice.buscar_etiqueta(parametros["origen"])
+            fila_d = indice.buscar_etiqueta(parametros["destino"])
+            if fila_o is None or fila_d is None:
+                raise ErrorHTTP(404, "No se encontró alguno de los municipios en el catálogo")
+            modo = parametros.get("modo", obtener_tarifario().modo_distancia)
+            try:
+                km = distancia_municipios(self.catalogo, fila_o, fila_d, modo)
+            except ValueError as error:
+                raise ErrorHTTP(400, str(error))
+        else:
+            try:
+                km = distancia_coordenadas(*(float(parametros[k]) for k in ("lat1", "lon1", "lat2", "lon2")))
+            except (KeyError, ValueError):
+                raise ErrorHTTP(400, "Usa origen y destino, o lat1, lon1, lat2 y lon2")
+        return {"distancia_km": round(km, 2)}
+
+    def municipios(self, consulta, cuerpo):
+        texto = consulta.get("q", [""])[0]
+        try:
+            k = min(int(consulta.get("k", ["10"])[0]), 100)
+        except ValueError:
+            raise ErrorHTTP(400, "k debe ser un entero")
+        buscador = self.catalogo.buscador()
+        return {
+            "municipios": [
+                {"fila": fila, "etiqueta": self.catalogo.etiqueta(fila, limpio=True)}
+                for fila in buscador.buscar(texto, max(k, 1))
+            ]
+        }
+
+    def cercanos(self, consulta, cuerpo):
+        try:
+            lat = float(consulta["lat"][0])
+            lon = float(consulta["lon"][0])
+            k = min(int(consulta.get("k", ["1"])[0]), 100)
+        except (KeyError, ValueError):
+            raise ErrorHTTP(400, "Usa lat, lon y opcionalmente k")
+        if not (np.isfinite(lat) and np.isfinite(lon)):
+            raise ErrorHTTP(400, "lat y lon deben ser números finitos")
+        filas, km = self.catalogo.espacial().vecinos(lat, lon, max(k, 1))
+        return {
+            "municipios": [
+                {"fila": int(fila), "etiqueta": self.catalogo.etiqueta(fila, limpio=True), "distancia_km": round(float(d), 2)}
+                for fila, d in zip(filas, km)
+                if fila >= 0
+            ]
+        }
+
+    def alcance(self, consulta, cuerpo):
+        # Sin filtro: resumen por banda; con banda, km o precio: los destinos
+        parametros = {k: v[0] for k, v in consulta.items()}
+        if "origen" not in parametros:
+            raise ErrorHTTP(400, "Usa origen y opcionalmente banda, km o precio")
+        servicio = parametros.get("servicio", "FTL").upper()
+        if servicio not in ("FTL", "LTL", "MUDANZA"):
+            raise ErrorHTTP(400, f"Servicio desconocido: {servicio!r}")
+        try:
+            resultado = alcance(parametros["origen"], self.catalogo)
+        except KeyError as error:
+            raise ErrorHTTP(404, str(error.args[0]))
+        try:
+            precio = {
+                "servicio": servicio,
+                "peso_vol": float(parametros.get("peso_vol", 0)),
+                "volumen_m3": float(parametros.get("volumen_m3", 1)),
+                "maniobras": float(parametros.get("maniobras", 0)),
+            }
+            if "banda" in parametros:
+                seleccion = resultado.en_banda(int(parametros["banda"]))
+            elif "km" in parametros:
+                seleccion = resultado.dentro_de(float(parametros["km"]))
+            elif "precio" in parametros:
+                seleccion = resultado.bajo_precio(float(parametros["precio"]), **precio)
+            else:
+                return {
+                    "origen": self.catalogo.etiqueta(resultado.fila_origen),
+                    "bandas": resultado.resumen().to_dict(orient="records"),
+                }
+        except ValueError:
+            raise ErrorHTTP(400, "banda debe ser entero; km, precio, peso_vol, volumen_m3 y maniobras, números")
+        tabla = resultado.tabla(self.catalogo, seleccion)
+        tabla["Costo"] = resultado.costos(**precio)[seleccion]
+        return {
+            "origen": self.catalogo.etiqueta(resultado.fila_origen),
+            "destinos": tabla.to_dict(orient="records"),
+        }
+
+    def cotizar(self, consulta, cuerpo):
+        envio = _lee_json(cuerpo)
+        if not isinstance(envio, dict):
+            raise ErrorHTTP(400, "Se esperaba un objeto JSON con los datos del envío")
+        try:
+            return cotizar_envio(envio, self.catalogo)
+        except KeyError as error:
+            raise ErrorHTTP(404, str(error.args[0]))
+        except (ValueError, TypeError) as error:
+            raise ErrorHTTP(400, str(error))
+
+    def cotizar_lote(self, consulta, cuerpo):
+        datos = _lee_json(cuerpo)
+        envios = datos.get("envios") if isinstance(datos, dict) else datos
+        if not isinstance(envios, list):
+            raise ErrorHTTP(400, "Se esperaba {\"envios\": [...]} o una lista de envíos")
+        if not envios:
+            return {"resultados": []}
+        try:
+            resultado = cotizar_lote(envios, self.catalogo)
+        except (KeyError, ValueError, TypeError) as error:
+            raise ErrorHTTP(400, f"Lote inválido: {error}")
+        resultado = resultado.astype(object).where(resultado.notna(), None)
+        return {"resultados": resultado.to_dict(orient="records")}
+
+    def ruta(self, consulta, cuerpo):
+        datos = _lee_json(cuerpo)
+        if not isinstance(datos, dict) or not isinstance(datos.get("destinos"), list):
+            raise ErrorHTTP(400, "Se esperaba {\"origen\": ..., \"destinos\": [...]}")
+        indice = self.catalogo.indice()
+        filas = []
+        for etiqueta in [datos.get("origen")] + datos["destinos"]:
+            fila = indice.buscar_etiqueta(str(etiqueta))
+            if fila is None:
+                raise ErrorHTTP(404, f"No se encontró el municipio {etiqueta!r} en el catálogo")
+            filas.append(fila)
+        try:
+            ruta = planear_ruta(self.catalogo, filas[0], filas[1:], bool(datos.get("regreso", False)))
+        except ValueError as error:
+            raise ErrorHTTP(400, str(error))
+        ruta["paradas"] = [self.catalogo.etiqueta(fila) for fila in ruta["secuencia"]]
+        return ruta
+
+    def rutas(self):
+        return {
+            ("GET", "/salud"): (self.salud, False),
+            ("GET", "/metricas"): (self.metricas, False),
+            ("GET", "/distancia"): (self.distancia, False),
+            ("GET", "/municipios"): (self.municipios, False),
+            ("GET", "/cercanos"): (self.cercanos, False),
+            ("GET", "/alcance"): (self.alcance, False),
+            ("POST", "/cotizar"): (self.cotizar, False),
+            ("POST", "/cotizar/lote"): (self.cotizar_lote, True),
+            ("POST", "/ruta"): (self.ruta, True),
+        }
+
+    # ---------------- HTTP ----------------
+
+    async def atender(self, lector, escritor):
+        rutas = self.rutas()
+        try:
+            while True:
+                solicitud = await _lee_solicitud(lector)
+                if solicitud is None:
+                    break
+                metodo, ruta, consulta, cuerpo, mantener = solicitud
+                try:
+                    manejador = rutas.get((metodo, ruta))
+                    if manejador is None:
+                        if any(r == ruta for _, r in rutas):
+                            raise ErrorHTTP(405, f"Método {metodo} no permitido en {ruta}")
+                        raise ErrorHTTP(404, f"Ruta desconocida: {ruta}")
+                    funcion, en_hilo = manejador
+                    if en_hilo:
+                        respuesta = await asyncio.get_running_loop().run_in_executor(
+                            None, _medida, f"http {metodo} {ruta}", funcion, consulta, cuerpo,
+                        )
+                    else:
+                        respuesta = _medida(f"http {metodo} {ruta}", funcion, consulta, cuerpo)
+                    estado = 200
+                except ErrorHTTP as error:
+                    estado, respuesta = error.estado, {"error": str(error)}
+                except Exception as error:
+                    estado, respuesta = 500, {"error": f"{type(error).__name__}: {error}"}
+                escritor.write(_respuesta(estado, respuesta, mantener))
+                await escritor.drain()
+                if not mantener:
+                    break
+        except ErrorHTTP as error:
+            escritor.write(_respuesta(error.estado, {"error": str(error)}, False))
+            await escritor.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            escritor.close()
+
+
+def _medida(nombre, funcion, consulta, cuerpo):
+    if not activo():
+        return funcion(consulta, cuerpo)
+    with solicitud(nombre):
+        return funcion(consulta, cuerpo)
+
+
+def _a_json(valor):
+    if isinstance(valor, np.generic):
+        return valor.item()
+    raise TypeError(f"{type(valor).__name__} no es serializable")
+
+
+def _lee_json(cuerpo):
+    try:
+        return json.loads(cuerpo or b"null")
+    except ValueError as error:
+        raise ErrorHTTP(400, f"JSON inválido: {error}")
+
+
+def _respuesta(estado, datos, mantener):
+    if isinstance(datos, Texto):
+        cuerpo, tipo = datos.encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8"
+    else:
+        cuerpo, tipo = json.dumps(datos, ensure_ascii=False, default=_a_json).encode("utf-8"), "application/json; charset=utf-8"
+    cabeceras = (
+        f"HTTP/1.1 {estado} {ESTADOS.get(estado, '')}\r\n"
+        f"Content-Type: {tipo}\r\n"
+        f"Content-Length: {len(cuerpo)}\r\n"
+        f"Connection: {'keep-alive' if mantener else 'close'}\r\n\r\n"
+    )
+    return cabeceras.encode("latin1") + cuerpo
+
+
+async def _lee_solicitud(lector):
+    try:
+        encabezado = await lector.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError:
+        return None
+    except asyncio.LimitOverrunError:
+        raise ErrorHTTP(413, "Encabezados demasiado grandes")
+    lineas = encabezado.decode("latin1").split("\r\n")
+    try:
+        metodo, objetivo, version = lineas[0].split(" ", 2)
+    except ValueError:
+        raise ErrorHTTP(400, "Línea de solicitud inválida")
+    cabeceras = {}
+    for linea in lineas[1:]:
+        if ":" in linea:
+            nombre, valor = linea.split(":", 1)
+            cabeceras[nombre.strip().lower()] = valor.strip()
+
+    cuerpo = b""
+    if metodo in ("POST", "PUT"):
+        if "content-length" not in cabeceras:
+            raise ErrorHTTP(411, "Falta Content-Length")
+        try:
+            largo = int(cabeceras["content-length"])
+        except ValueError:
+            raise ErrorHTTP(400, "Content-Length inválido")
+        if largo > MAX_CUERPO:
+            raise ErrorHTTP(413, "Cuerpo demasiado grande")
+        cuerpo = await lector.readexactly(largo)
+
+    conexion = cabeceras.get("connection", "").lower()
+    mantener = conexion != "close" if version == "HTTP/1.1" else conexion == "keep-alive"
+    partes = urlsplit(objetivo)
+    return metodo, partes.path.rstrip("/") or "/", parse_qs(partes.query), cuerpo, mantener
+
+
+async def servir(host="127.0.0.1", puerto=8080, fuente=CSV_MUNICIPIOS):
+    servicio = ServicioCotizador(fuente)
+    servidor = await asyncio.start_server(servicio.atender, host, puerto)
+    direcciones = ", ".join(str(s.getsockname()) for s in servidor.sockets)
+    print(f"Cotizador HTTP escuchando en {direcciones} ({servicio.catalogo.n} municipios)")
+    async with servidor:
+        await servidor.serve_forever()
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Servicio HTTP de cotización de fletes")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=8080)
+    parser.add_argument("--fuente", default=CSV_MUNICIPIOS)
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(servir(args.host, args.puerto, args.fuente))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+import bisect
+import hashlib
+import json
+import os
+import warnings
+
+import numpy as np
+
+# Tarifario único. Las bandas LTL y las unidades FTL se leen de un archivo
+# versionado y se compilan a arreglos de límites ordenados; la banda se busca
+# con searchsorted/bisect, así que no hay huecos entre límites enteros
+# (400.5 km cae en la banda de 900). El archivo se vuelve a leer cuando cambia,
+# sin reiniciar el servidor de Streamlit.
+
+RUTA_TARIFAS = "tarifas.json"
+
+
+class Tarifario:
+    def __init__(self, datos, huella=""):
+        self.datos = datos
+        self.version = f"{datos.get('version', 's/v')}+{huella[:8]}" if huella else str(datos.get("version", "s/v"))
+        self.km_banderazo = float(datos["km_banderazo"])
+        # Fuente de los km que se tarifican: geodésica (vincenty) o por carretera
+        self.modo_distancia = datos.get("modo_distancia", "vincenty")
+
+        unidades = datos["unidades"]
+        self.unidades = tuple(u["nombre"] for u in unidades)
+        self.limites_peso = np.array([u["peso_max_ton"] for u in unidades[:-1]], dtype=np.float64)
+        self.banderazo = np.array([u["banderazo"] for u in unidades], dtype=np.float64)
+        self.por_km = np.array([u["por_km"] for u in unidades], dtype=np.float64)
+        self.tarifas_banderazo = dict(zip(self.unidades, self.banderazo.tolist()))
+        self.tarifas_km = dict(zip(self.unidades, self.por_km.tolist()))
+        # Carga útil de cada unidad para consolidar envíos (NaN = no se usa)
+        self.capacidad_ton = np.array([u.get("capacidad_ton", np.nan) for u in unidades], dtype=np.float64)
+        self.capacidad_m3 = np.array([u.get("capacidad_m3", np.nan) for u in unidades], dtype=np.float64)
+        # Mudanza de app_actualizada: banderazo más km desde el kilómetro 0, sin clase de unidad
+        mudanza = datos["mudanza"]
+        self.mudanza_banderazo = float(mudanza["banderazo"])
+        self.mudanza_por_km = float(mudanza["por_km"])
+
+        bandas = datos["ltl"]
+        self.limites_ltl = np.array([b["hasta_km"] for b in bandas[:-1]], dtype=np.float64)
+        self.tarifas_ltl = np.array([b["por_m3"] for b in bandas], dtype=np.float64)
+        # Nombre de cada banda para reportes ("400-900 km", "> 1999 km")
+        topes = [0] + [b["hasta_km"] for b in bandas[:-1]]
+        self.nombres_ltl = tuple(f"{a:g}-{b:g} km" for a, b in zip(topes, topes[1:])) + (f"> {topes[-1]:g} km",)
+
+        self._valida(unidades, bandas)
+        self._limites_peso = self.limites_peso.tolist()
+        self._limites_ltl = self.limites_ltl.tolist()
+        self._tarifas_ltl = self.tarifas_ltl.tolist()
+
+    def _valida(self, unidades, bandas):
+        if not unidades or not bandas:
+            raise ValueError("El tarifario necesita al menos una unidad y una banda LTL")
+        if unidades[-1].get("peso_max_ton") is not None or bandas[-1].get("hasta_km") is not None:
+            raise ValueError("La última unidad y la última banda LTL no deben tener tope")
+        if self.modo_distancia not in ("vincenty", "haversine", "carretera"):
+            raise ValueError(f"modo_distancia desconocido: {self.modo_distancia!r}")
+        for nombre, limites in (("peso_max_ton", self.limites_peso), ("hasta_km", self.limites_ltl)):
+            if np.isnan(limites).any() or (np.diff(limites) <= 0).any():
+                raise ValueError(f"Los límites '{nombre}' deben ser crecientes y sin huecos")
+
+    # Bandas inclusivas por arriba: d <= límite, como las cadenas if/elif originales
+    def indice_banda_ltl(self, distancia):
+        if np.ndim(distancia) == 0:
+            return bisect.bisect_left(self._limites_ltl, distancia)
+        return np.searchsorted(self.limites_ltl, distancia, side="left")
+
+    def tarifa_ltl(self, distancia):
+        if np.ndim(distancia) == 0:
+            return self._tarifas_ltl[bisect.bisect_left(self._limites_ltl, distancia)]
+        return self.tarifas_ltl[np.searchsorted(self.limites_ltl, distancia, side="left")]
+
+    # Un peso NaN no tiene unidad: el escalar lo rechaza y en arreglos
+    # searchsorted da la última; precios_lote deja esos renglones sin precio
+    def indice_unidad(self, peso_vol):
+        if np.ndim(peso_vol) == 0:
+            if peso_vol != peso_vol:
+                raise ValueError(f"Peso/volumen inválido: {peso_vol}")
+            return bisect.bisect_left(self._limites_peso, peso_vol)
+        return np.searchsorted(self.limites_peso, peso_vol, side="left")
+
+    def unidad(self, peso_vol):
+        return self.unidades[self.indice_unidad(peso_vol)]
+
+    def costo_mudanza(self, distancia):
+        return self.mudanza_banderazo + distancia * self.mudanza_por_km
+
+
+def _lee_tarifario(ruta):
+    with open(ruta, "rb") as f:
+        contenido = f.read()
+    return Tarifario(json.loads(contenido), hashlib.sha256(contenido).hexdigest())
+
+
+_VIGENTE = {}
+
+
+def obtener_tarifario(ruta=RUTA_TARIFAS):
+    # Devuelve el tarifario compilado; si el archivo cambió desde la última
+    # lectura se recompila. Si la nueva versión es inválida se conserva la
+    # anterior y se emite una advertencia.
+    st = os.stat(ruta)
+    firma = (st.st_size, st.st_mtime_ns)
+    clave = os.path.abspath(ruta)
+    actual = _VIGENTE.get(clave)
+    if actual is not None and actual[0] == firma:
+        return actual[1]
+    try:
+        tarifario = _lee_tarifario(ruta)
+    except (ValueError, KeyError, TypeError) as error:
+        if actual is None:
+            raise
+        warnings.warn(f"No se pudo recargar {ruta}: {error}; se conserva la versión {actual[1].version}")
+        _VIGENTE[clave] = (firma, actual[1])
+        return actual[1]
+    _VIGENTE[clave] = (firma, tarifario)
+    return tarifario
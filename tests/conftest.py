@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+
+# Los módulos viven en la raíz del repositorio y abren los CSV y tarifas.json
+# con rutas relativas a ella
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+os.chdir(RAIZ)
+
+
+@pytest.fixture(scope="session")
+def catalogo():
+    from catalogo import abrir_catalogo, CSV_MUNICIPIOS
+
+    return abrir_catalogo(CSV_MUNICIPIOS)
+
+
+@pytest.fixture(scope="session")
+def tarifario():
+    from tarifas import obtener_tarifario
+
+    return obtener_tarifario()
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from alcance import Alcance, alcance
+from cache_cotizaciones import CacheCotizaciones
+from cotizacion import cotizar_ruta
+
+
+@pytest.fixture(scope="module")
+def desde_cero(catalogo, tarifario):
+    return Alcance(catalogo, catalogo.indice().buscar_etiqueta("Monterrey (Nuevo León)"), tarifario)
+
+
+@pytest.mark.parametrize("servicio, peso_vol, volumen_m3, maniobras", [
+    ("FTL", 0.5, 0, 0), ("FTL", 4, 0, 0), ("FTL", 12, 0, 0),
+    ("LTL", 0, 2.37, 0), ("MUDANZA", 2, 0, 845.5),
+])
+def test_precios_igual_a_cotizar_ruta(catalogo, tarifario, desde_cero, servicio, peso_vol, volumen_m3, maniobras):
+    costos = desde_cero.costos(servicio, peso_vol, volumen_m3, maniobras)
+    for i in range(0, len(desde_cero), 7):
+        distancia, _, costo, _ = cotizar_ruta(
+            catalogo, desde_cero.fila_origen, int(desde_cero.filas[i]), servicio, peso_vol, maniobras, volumen_m3,
+            tarifario, cache=None,
+        )
+        assert distancia == desde_cero.distancia[i]
+        assert costo == costos[i]
+
+
+def test_bandas_y_radios(tarifario, desde_cero):
+    assert desde_cero.fila_origen not in desde_cero.filas
+    assert np.all(np.diff(desde_cero.distancia) >= 0)
+    for banda in range(len(tarifario.nombres_ltl)):
+        rango = desde_cero.en_banda(banda)
+        assert np.all(tarifario.indice_banda_ltl(desde_cero.distancia[rango]) == banda)
+    dentro = desde_cero.dentro_de(400)
+    assert np.all(desde_cero.distancia[dentro] <= 400)
+    assert np.all(desde_cero.distancia[dentro.stop:] > 400)
+
+
+def test_bajo_precio(desde_cero):
+    costos = desde_cero.costos("LTL", volumen_m3=3)
+    posiciones = desde_cero.bajo_precio(10_500, "LTL", volumen_m3=3)
+    esperadas = np.flatnonzero(costos <= 10_500)
+    np.testing.assert_array_equal(posiciones, esperadas)
+
+
+def test_cache_por_origen(catalogo, tarifario):
+    cache = CacheCotizaciones(4)
+    primero = alcance(catalogo.etiqueta(10), catalogo, tarifario, cache)
+    assert alcance(10, catalogo, tarifario, cache) is primero
+    with pytest.raises(KeyError):
+        alcance("No existe (Ninguno)", catalogo, tarifario, cache)
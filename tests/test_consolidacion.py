@@ -0,0 +1,46 @@
+import numpy as np
+
+from consolidacion import CONSOLIDADO, INDIVIDUAL, planear_consolidacion, resumen
+
+
+def test_consolidacion_respeta_capacidad_y_no_encarece(catalogo, tarifario):
+    rng = np.random.default_rng(5)
+    n = 120
+    carriles = [(catalogo.etiqueta(10), catalogo.etiqueta(900)), (catalogo.etiqueta(50), catalogo.etiqueta(1200))]
+    envios = [
+        {
+            "origen": carriles[i % 2][0], "destino": carriles[i % 2][1],
+            "volumen_m3": float(rng.uniform(0.2, 6)), "peso_ton": float(rng.uniform(0.05, 1.5)),
+        }
+        for i in range(n)
+    ]
+    viajes, asignacion = planear_consolidacion(envios, catalogo, tarifario)
+    assert len(asignacion) == n
+    assert set(asignacion["modalidad"]) <= {CONSOLIDADO, INDIVIDUAL}
+    assert (viajes["ocupacion_volumen"] <= 1 + 1e-9).all() and (viajes["ocupacion_peso"] <= 1 + 1e-9).all()
+    totales = resumen(viajes, asignacion)
+    assert totales["costo_plan"] <= totales["costo_individual"]
+    # Cada viaje lleva exactamente los envíos que se le asignaron
+    por_viaje = asignacion[asignacion["modalidad"] == CONSOLIDADO].groupby("viaje").size()
+    assert por_viaje.sort_index().tolist() == viajes.set_index("viaje")["envios"].sort_index().tolist()
+
+
+def test_consolida_destinos_cercanos_de_un_origen(catalogo, tarifario):
+    # Envíos chicos de un origen a seis municipios vecinos entre sí
+    indice = catalogo.indice()
+    origen = indice.buscar_etiqueta("Monterrey (Nuevo León)")
+    centro = indice.buscar_etiqueta("Guadalajara (Jalisco)")
+    vecinos, km = catalogo.espacial().vecinos(float(catalogo.latitud[centro]), float(catalogo.longitud[centro]), 6)
+    assert km.max() < 25
+    envios = [
+        {"origen": catalogo.etiqueta(origen), "destino": catalogo.etiqueta(int(vecinos[i % 6])), "volumen_m3": 1.5, "peso_ton": 0.2}
+        for i in range(24)
+    ]
+    por_carril, _ = planear_consolidacion(envios, catalogo, tarifario, radio_km=0)
+    viajes, asignacion = planear_consolidacion(envios, catalogo, tarifario, radio_km=50)
+    assert (por_carril["paradas"] == 1).all() and len(por_carril) == 6
+    assert len(viajes) < len(por_carril) and viajes["paradas"].max() > 1
+    assert viajes["costo"].sum() < por_carril["costo"].sum()
+    assert (asignacion["modalidad"] == CONSOLIDADO).all()
+    # La ruta de reparto es al menos tan larga como el destino más lejano
+    assert (viajes["distancia_km"] >= asignacion.groupby("viaje")["distancia_km"].max().to_numpy() - 0.01).all()
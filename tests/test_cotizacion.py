@@ -0,0 +1,109 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from cotizacion import cotizar_envio, cotizar_lote, cotizar_ruta, cotizar_servicio, precios_lote
+
+
+def test_lote_servicio_desconocido_sin_precio(catalogo, tarifario):
+    origen, destino = catalogo.etiqueta(0), catalogo.etiqueta(100)
+    envios = [
+        {"origen": origen, "destino": destino, "servicio": "XYZ", "peso_vol": 2},
+        {"origen": origen, "destino": destino, "servicio": "ftl", "peso_vol": 2},
+        {"origen": origen, "destino": destino, "servicio": None, "peso_vol": 2},
+    ]
+    for cache in (None, "proceso"):
+        argumentos = {"cache": None} if cache is None else {}
+        resultado = cotizar_lote(envios, catalogo, tarifario=tarifario, **argumentos)
+        assert np.isnan(resultado["costo"][0]) and pd.isna(resultado["unidad"][0])
+        assert pd.isna(resultado["detalle"][0])
+        assert "Servicio desconocido" in resultado["error"][0]
+        assert resultado["costo"][1] > 0 and pd.isna(resultado["error"][1])
+        assert np.isnan(resultado["costo"][2]) and "Servicio desconocido" in resultado["error"][2]
+
+
+def _envios(catalogo, n, semilla=0):
+    rng = np.random.default_rng(semilla)
+    filas = rng.integers(0, catalogo.n, size=(n, 2))
+    servicios = rng.choice(["FTL", "LTL", "MUDANZA"], n)
+    return [
+        {
+            "origen": catalogo.etiqueta(int(o)),
+            "destino": catalogo.etiqueta(int(d)),
+            "servicio": str(s),
+            "peso_vol": float(rng.uniform(0.1, 12)),
+            "largo": float(rng.integers(10, 300)),
+            "ancho": float(rng.integers(10, 300)),
+            "alto": float(rng.integers(10, 300)),
+            "maniobras": float(rng.choice([0, 350, 1200])),
+        }
+        for (o, d), s in zip(filas.tolist(), servicios.tolist())
+    ]
+
+
+@pytest.mark.parametrize("cache", [None, "proceso"])
+def test_lote_igual_a_cotizar_servicio(catalogo, tarifario, cache):
+    envios = _envios(catalogo, 300)
+    argumentos = {"cache": None} if cache is None else {}
+    resultado = cotizar_lote(envios, catalogo, tarifario=tarifario, **argumentos)
+    for envio, renglon in zip(envios, resultado.itertuples()):
+        volumen = envio["largo"] * envio["ancho"] * envio["alto"] / 1_000_000
+        distancia, unidad, costo, detalle = cotizar_ruta(
+            catalogo, renglon.fila_origen, renglon.fila_destino, envio["servicio"], envio["peso_vol"],
+            envio["maniobras"], volumen, tarifario, cache=None,
+        )
+        assert (renglon.distancia_km, renglon.unidad, renglon.costo, renglon.detalle) == (distancia, unidad, costo, detalle)
+        assert cotizar_servicio(distancia, envio["peso_vol"], envio["servicio"], envio["maniobras"], volumen, tarifario)[1] == costo
+
+
+def test_precios_lote_servicio_desconocido(tarifario):
+    _, costo, _ = precios_lote([100.0, 100.0], np.array(["FTL", "XYZ"], dtype=object), [2.0, 2.0], 0.0, 0.0, tarifario)
+    assert costo[0] == cotizar_servicio(100.0, 2.0, "FTL", tarifario=tarifario)[1]
+    assert np.isnan(costo[1])
+
+
+@pytest.mark.parametrize("lat, lon", [("nan", -100.0), (25.0, float("inf")), (float("-inf"), "nan")])
+def test_envio_rechaza_coordenadas_no_finitas(catalogo, lat, lon):
+    envio = {"origen_lat": lat, "origen_lon": lon, "destino": catalogo.etiqueta(0), "servicio": "FTL"}
+    with pytest.raises(ValueError):
+        cotizar_envio(envio, catalogo)
+
+
+def test_envio_por_coordenadas(catalogo):
+    fila = 100
+    envio = {
+        "origen_lat": float(catalogo.latitud[fila]), "origen_lon": float(catalogo.longitud[fila]),
+        "destino": catalogo.etiqueta(0), "servicio": "FTL", "peso_vol": 1,
+    }
+    assert cotizar_envio(envio, catalogo)["fila_origen"] == fila
+
+
+def test_cache_ltl_cobra_el_volumen_de_cada_consulta(catalogo, tarifario):
+    from cache_cotizaciones import CacheCotizaciones
+
+    cache = CacheCotizaciones()
+    # Volúmenes distintos del mismo carril (y casi empates de 6 decimales)
+    volumenes = [1.0, 1.0000004999999, 1.0000005, 2.5, 0.3333335]
+    envios = [
+        {"origen": catalogo.etiqueta(3), "destino": catalogo.etiqueta(700), "servicio": "LTL", "volumen_m3": v}
+        for v in volumenes
+    ]
+    lote = cotizar_lote(envios, catalogo, tarifario=tarifario, cache=cache)
+    # El lote llena una sola entrada LTL y cotizar_ruta la reutiliza
+    assert len(cache) == 1
+    for volumen, renglon in zip(volumenes, lote.itertuples()):
+        esperado = cotizar_ruta(catalogo, 3, 700, "LTL", volumen_m3=volumen, tarifario=tarifario, cache=None)
+        assert cotizar_ruta(catalogo, 3, 700, "LTL", volumen_m3=volumen, tarifario=tarifario, cache=cache) == esperado
+        assert (renglon.distancia_km, renglon.unidad, renglon.costo, renglon.detalle) == esperado
+    assert len(cache) == 1 and cache.aciertos == len(volumenes)
+    # Un segundo lote sale del caché con el mismo resultado
+    pd.testing.assert_frame_equal(cotizar_lote(envios, catalogo, tarifario=tarifario, cache=cache), lote)
+
+
+def test_peso_nan_sin_precio(tarifario):
+    with pytest.raises(ValueError):
+        cotizar_servicio(100.0, float("nan"), "FTL", tarifario=tarifario)
+    servicio = np.array(["FTL", "MUDANZA", "LTL"], dtype=object)
+    _, costo, _ = precios_lote([100.0] * 3, servicio, [np.nan] * 3, 0.0, 1.0, tarifario)
+    assert np.isnan(costo[:2]).all()
+    assert costo[2] == cotizar_servicio(100.0, np.nan, "LTL", volumen_m3=1.0, tarifario=tarifario)[1]
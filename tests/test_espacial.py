@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from espacial import IndiceEspacial, a_vectores, cuerda_a_km
+
+
+def _fuerza_bruta(indice, lat, lon, k):
+    consultas = a_vectores(lat, lon)
+    d2 = ((consultas[:, None, :] - indice.puntos[None, :, :]) ** 2).sum(axis=-1)
+    orden = np.lexsort((np.broadcast_to(np.arange(indice.n), d2.shape), d2), axis=1)[:, :k]
+    return orden, cuerda_a_km(np.sqrt(np.take_along_axis(d2, orden, axis=1)))
+
+
+@pytest.mark.parametrize("k", [1, 5])
+def test_vecinos_igual_a_fuerza_bruta(catalogo, k):
+    rng = np.random.default_rng(7)
+    lat = rng.uniform(14, 33, 500)
+    lon = rng.uniform(-118, -86, 500)
+    filas, km = catalogo.espacial().vecinos(lat, lon, k)
+    esperadas, km_esperados = _fuerza_bruta(catalogo.espacial(), lat, lon, k)
+    np.testing.assert_allclose(km, km_esperados, rtol=0, atol=1e-6)
+    # Empates a la misma distancia pueden salir en otro orden
+    assert (filas == esperadas).mean() > 0.999
+
+
+def test_vecinos_en_catalogo_chico():
+    rng = np.random.default_rng(1)
+    indice = IndiceEspacial(rng.uniform(14, 33, 40), rng.uniform(-118, -86, 40), tam_hoja=4)
+    lat, lon = rng.uniform(14, 33, 50), rng.uniform(-118, -86, 50)
+    filas, km = indice.vecinos(lat, lon, 3)
+    esperadas, km_esperados = _fuerza_bruta(indice, lat, lon, 3)
+    np.testing.assert_array_equal(filas, esperadas)
+    np.testing.assert_allclose(km, km_esperados, atol=1e-6)
+
+
+def test_coordenada_nan_sin_vecino(catalogo):
+    filas, km = catalogo.espacial().mas_cercano(np.array([np.nan, 25.0]), np.array([-100.0, -100.0]))
+    assert filas[0] == -1 and np.isnan(km[0])
+    assert filas[1] >= 0
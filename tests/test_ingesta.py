@@ -0,0 +1,17 @@
+import numpy as np
+
+from ingesta import FUERA, INTERCAMBIADA, INTERCAMBIADA_SIGNO, OK, SIGNO, llave_nombre, repara_coordenadas
+
+
+def test_repara_coordenadas():
+    lat = np.array([25.67, -100.31, 25.67, 100.31, 45.0, np.nan])
+    lon = np.array([-100.31, 25.67, 100.31, 25.67, 10.0, -100.0])
+    nueva_lat, nueva_lon, estado = repara_coordenadas(lat, lon)
+    assert estado.tolist() == [OK, INTERCAMBIADA, SIGNO, INTERCAMBIADA_SIGNO, FUERA, FUERA]
+    np.testing.assert_array_equal(nueva_lat[:4], 25.67)
+    np.testing.assert_array_equal(nueva_lon[:4], -100.31)
+    assert np.isnan(nueva_lat[4:]).all() and np.isnan(nueva_lon[4:]).all()
+
+
+def test_llave_nombre_colapsa_espacios():
+    assert llave_nombre("San  Luis   Potosí") == llave_nombre("san luis potosi")
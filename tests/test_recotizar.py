@@ -0,0 +1,50 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cotizacion import cotizar_servicio
+from recotizar import cargar_historial, normalizar_historial, reporte_impacto, tarifario_candidato
+
+
+def _historial(tarifario, n=200):
+    rng = np.random.default_rng(11)
+    renglones = []
+    for i in range(n):
+        servicio = ["FTL", "LTL", "MUDANZA"][i % 3]
+        distancia = round(float(rng.uniform(5, 2500)), 2)
+        peso = round(float(rng.uniform(0.1, 12)), 2) if servicio != "LTL" else ""
+        volumen = round(float(rng.uniform(0.1, 20)), 4) if servicio == "LTL" else ""
+        maniobras = float(rng.choice([0, 500])) if servicio == "MUDANZA" else 0
+        unidad, costo, _ = cotizar_servicio(distancia, peso or 0, servicio, maniobras, volumen or 0, tarifario)
+        renglones.append({
+            "Servicio": servicio, "Origen": f"O{i % 5}", "Destino": f"D{i % 7}", "Distancia (km)": distancia,
+            "Tipo de unidad": unidad, "Peso/Vol (Ton)": peso, "Volumen (m3)": volumen, "Costo Total MXN": costo,
+        })
+    return pd.DataFrame(renglones)
+
+
+def test_base_reproduce_lo_registrado(tarifario):
+    reporte = reporte_impacto(normalizar_historial(_historial(tarifario), tarifario), tarifario, {})
+    resumen = reporte["resumen"]
+    assert resumen.attrs["omitidas"] == 0
+    assert resumen["ingreso_base"].iloc[0] == pytest.approx(resumen["ingreso_registrado"].iloc[0], abs=0.01)
+
+
+def test_candidato_parcial(tmp_path, tarifario):
+    bandas = [dict(b) for b in tarifario.datos["ltl"]]
+    for banda in bandas:
+        banda["por_m3"] *= 1.1
+    ruta = tmp_path / "ltl.json"
+    ruta.write_text(json.dumps({"ltl": bandas}))
+    candidato = tarifario_candidato(str(ruta), tarifario)
+    reporte = reporte_impacto(normalizar_historial(_historial(tarifario), tarifario), tarifario, {"ltl": candidato})
+    por_servicio = reporte["servicio"]
+    assert por_servicio.loc["FTL", "delta_ltl"] == 0 and por_servicio.loc["MUDANZA", "delta_ltl"] == 0
+    assert por_servicio.loc["LTL", "delta_pct_ltl"] == pytest.approx(10, abs=0.05)
+
+
+def test_sin_historial(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        cargar_historial(str(tmp_path / "cotizaciones_*.xlsx"))
@@ -0,0 +1,25 @@
+import itertools
+
+import numpy as np
+
+from rutas import longitud_recorrido, matriz_paradas, planear_ruta
+
+
+def test_ruta_visita_cada_parada_una_vez(catalogo):
+    destinos = [50, 900, 1200, 50, 2000, 300]
+    ruta = planear_ruta(catalogo, 10, destinos)
+    assert ruta["secuencia"][0] == 10
+    assert sorted(ruta["secuencia"][1:]) == sorted(set(destinos))
+    assert abs(ruta["distancia_km"] - sum(ruta["tramos_km"])) < 0.05
+
+
+def test_ruta_chica_es_optima(catalogo):
+    # Con 5 destinos se puede comparar contra todas las permutaciones
+    filas = [10, 50, 900, 1200, 2000, 300]
+    distancias = matriz_paradas(catalogo, np.asarray(filas))
+    mejor = min(
+        longitud_recorrido(distancias, np.array((0,) + orden))
+        for orden in itertools.permutations(range(1, len(filas)))
+    )
+    ruta = planear_ruta(catalogo, filas[0], filas[1:])
+    assert ruta["distancia_km"] <= round(mejor, 2) + 0.05
@@ -0,0 +1,37 @@
+import json
+
+import pytest
+
+from servicio_http import ErrorHTTP, ServicioCotizador
+
+
+@pytest.fixture(scope="module")
+def servicio():
+    return ServicioCotizador()
+
+
+@pytest.mark.parametrize("lat, lon", [("nan", "-100"), ("25", "inf")])
+def test_cercanos_rechaza_coordenadas_no_finitas(servicio, lat, lon):
+    with pytest.raises(ErrorHTTP) as error:
+        servicio.cercanos({"lat": [lat], "lon": [lon]}, b"")
+    assert error.value.estado == 400
+
+
+def test_cotizar_rechaza_servicio_y_coordenadas(servicio, catalogo):
+    for envio in (
+        {"origen": catalogo.etiqueta(0), "destino": catalogo.etiqueta(1), "servicio": "XYZ"},
+        {"origen_lat": "nan", "origen_lon": -100, "destino": catalogo.etiqueta(1), "servicio": "FTL"},
+    ):
+        with pytest.raises(ErrorHTTP) as error:
+            servicio.cotizar({}, json.dumps(envio).encode())
+        assert error.value.estado == 400
+
+
+def test_lote_con_servicio_desconocido(servicio, catalogo):
+    envios = [
+        {"origen": catalogo.etiqueta(0), "destino": catalogo.etiqueta(1), "servicio": "XYZ", "peso_vol": 3},
+        {"origen": catalogo.etiqueta(0), "destino": catalogo.etiqueta(1), "servicio": "FTL", "peso_vol": 3},
+    ]
+    resultados = servicio.cotizar_lote({}, json.dumps({"envios": envios}).encode())["resultados"]
+    assert resultados[0]["costo"] is None and "Servicio desconocido" in resultados[0]["error"]
+    assert resultados[1]["costo"] > 0 and resultados[1]["error"] is None